@@ -0,0 +1,333 @@
+import csv
+import json
+import multiprocessing
+import os
+import pickle
+import re
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+from roads import STREET_SPACING_PX, pixels_per_meter
+from styles import get_style, list_styles, load_custom_style
+from variants import parse_output, plan_outputs
+
+JOB_DEFAULTS = {
+    'city': None,
+    'lat': None,
+    'lon': None,
+    'style': 'minimal',
+    'custom_style': None,
+    'title': None,
+    'subtitle': None,
+    'output': None,
+    'width': 3000,
+    'height': 4000,
+    'radius': 5000,
+    'format': 'png',
+    'borderless': False,
+    'export_layers': None,
+    'roads': 'auto',
+    'street_spacing': STREET_SPACING_PX,
+    'extra_outputs': (),
+}
+INT_FIELDS = ('width', 'height', 'radius')
+FLOAT_FIELDS = ('lat', 'lon', 'street_spacing')
+BOOL_FIELDS = ('borderless',)
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_') or 'poster'
+
+
+def normalize_job(row, index):
+    """
+    Fill in defaults and coerce types for one job given as a dict of options.
+    Raises ValueError (or TypeError) for a row that is not a valid job.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Job must be a mapping of options")
+    job = dict(JOB_DEFAULTS)
+    job.update(row)
+    if 'coords' in row:
+        job['lat'], job['lon'] = row['coords']
+    if 'size' in row:
+        job['width'], job['height'] = (int(v) for v in re.split(r'[x, ]+', str(row['size'])))
+    for key in INT_FIELDS:
+        job[key] = int(job[key])
+    for key in FLOAT_FIELDS:
+        if job[key] is not None:
+            job[key] = float(job[key])
+    for key in BOOL_FIELDS:
+        job[key] = _to_bool(job[key])
+    if job['city'] is not None:
+        job['city'] = str(job['city'])
+    if not job['city'] and (job['lat'] is None or job['lon'] is None):
+        raise ValueError("Job needs a city or lat/lon")
+    # get_style falls back to minimal for unknown names, which would hide a typo
+    if str(job['style']).lower() not in list_styles():
+        raise ValueError(f"Unknown style {job['style']!r}: use one of {', '.join(list_styles())}")
+    # PATH[:WxH] specs: a YAML list, or separated by semicolons in CSV
+    specs = job['extra_outputs']
+    if isinstance(specs, str):
+        specs = [spec.strip() for spec in specs.split(';') if spec.strip()]
+    job['extra_outputs'] = [parse_output(spec, (job['width'], job['height'])) for spec in specs]
+    if not job['output']:
+        name = job['city'] or f"{job['lat']:.4f}_{job['lon']:.4f}"
+        job['output'] = f"output/{index:04d}_{_slug(name)}_{job['style']}.{job['format']}"
+    job['index'] = index
+    return job
+
+
+def load_manifest(path):
+    """The job rows of a YAML or CSV manifest, with the YAML defaults merged in but not yet normalized."""
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"Batch manifest not found: {path}")
+    if path.suffix.lower() in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("Reading YAML manifests requires PyYAML: pip install pyyaml")
+        data = yaml.safe_load(path.read_text(encoding='utf-8')) or []
+        defaults = {}
+        if isinstance(data, dict):
+            defaults = data.get('defaults') or {}
+            data = data.get('jobs') or []
+        rows = [{**defaults, **row} if isinstance(row, dict) else row for row in data]
+    elif path.suffix.lower() == '.csv':
+        with path.open(newline='', encoding='utf-8') as f:
+            rows = [{k: v for k, v in row.items() if v not in (None, '')} for row in csv.DictReader(f)]
+    else:
+        raise ValueError("Batch manifest must be a .yaml, .yml or .csv file")
+
+    return rows
+
+
+def job_style(job):
+    if job['custom_style']:
+        return load_custom_style(job['custom_style'], base_style=job['style'])
+    return get_style(job['style']).get_config()
+
+
+def group_jobs(jobs):
+    groups = {}
+    for job in jobs:
+        location = job['city'].strip().lower() if job['city'] else (job['lat'], job['lon'])
+        groups.setdefault((location, job['radius'], job['roads'], job['street_spacing']), []).append(job)
+    return groups
+
+
+@lru_cache(maxsize=2)
+def _load_data(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def cacheable(job):
+    """Whether the job can go through the raster cache: single PNG/TIFF posters."""
+    return job['format'] in ('png', 'tif', 'tiff') and not job['export_layers'] and not job['extra_outputs']
+
+
+def job_body_key(job, osm_file=None, loader='graph'):
+    from raster_cache import body_key
+
+    return body_key(job_style(job), job['width'], job['height'], job['borderless'], True, job['city'],
+                    job['lat'], job['lon'], job['radius'], job['roads'], job['street_spacing'], osm_file,
+                    loader=loader)
+
+
+def _render_job(job, data_path, raster_cache=None, osm_file=None, loader='graph'):
+    from map_poster import MapPosterGenerator
+
+    started = time.perf_counter()
+    try:
+        output = Path(job['output'])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        generator = MapPosterGenerator(job_style(job))
+        if raster_cache and cacheable(job):
+            from raster_cache import RasterCache
+            cache = RasterCache(*raster_cache)
+            key = job_body_key(job, osm_file, loader)
+            cached = key in cache
+            generator.cached_poster(
+                cache,
+                key,
+                lambda: _load_data(data_path),
+                str(output),
+                (job['width'] / 300, job['height'] / 300),
+                job['title'],
+                job['subtitle'],
+                job['format'],
+                job['borderless']
+            )
+            return dict(_result(job, 'ok', started), body_cached=cached)
+        (path, output_format, width, height), *variants = plan_outputs(
+            [(str(output), job['format'], job['width'], job['height']), *job['extra_outputs']])
+        for variant in variants:
+            Path(variant[0]).parent.mkdir(parents=True, exist_ok=True)
+        data = _load_data(data_path)
+        generator.create_poster(
+            data,
+            path,
+            (width / 300, height / 300),
+            job['title'],
+            job['subtitle'],
+            job['export_layers'],
+            output_format,
+            job['borderless'],
+            variants=variants
+        )
+        return _result(job, 'ok', started)
+    except Exception as e:
+        return _result(job, 'error', started, f"{type(e).__name__}: {e}", traceback.format_exc())
+
+
+def _result(job, status, started, error=None, details=None):
+    result = {
+        'index': job['index'],
+        'location': job['city'] or f"{job['lat']}, {job['lon']}",
+        'style': job['style'],
+        'output': job['output'],
+        'status': status,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    if error:
+        result['error'] = error
+        result['details'] = details
+    return result
+
+
+def run_batch(manifest, workers=None, report_path=None, osm_file=None, tile_cache=None,
+              tile_cache_size=None, geocode_cache=None, gazetteer=None, raster_cache=None,
+              raster_cache_size=None, shard_size=None, fetch_workers=None, loader='graph'):
+    """
+    Render every job of a manifest. With raster_cache (a directory), jobs that
+    differ only in their text share one rendered map body: the first of them
+    renders it, the others are composited once it is stored, and groups
+    whose bodies are all cached are not fetched at all.
+    """
+    from map_poster import MapPosterGenerator, make_source, print_cache_stats
+
+    results = []
+    jobs = []
+    for index, row in enumerate(load_manifest(manifest)):
+        started = time.perf_counter()
+        try:
+            jobs.append(normalize_job(row, index))
+        except (ValueError, TypeError, KeyError) as e:
+            # Report what the row has, so the failure can be traced back to it
+            job = {**JOB_DEFAULTS, **(row if isinstance(row, dict) else {}), 'index': index}
+            results.append(_result(job, 'error', started, f"Invalid job: {type(e).__name__}: {e}"))
+    groups = group_jobs(jobs)
+    workers = workers or os.cpu_count() or 1
+    report_path = Path(report_path) if report_path else Path(manifest).with_suffix('.report.json')
+    print(f"[+] Batch: {len(jobs)} jobs in {len(groups)} location groups, {workers} workers")
+    if results:
+        print(f"⚠️  Skipping {len(results)} invalid manifest rows")
+
+    source = make_source(osm_file, tile_cache, tile_cache_size, geocode_cache, gazetteer, shard_size, fetch_workers)
+    cache = None
+    if raster_cache:
+        from raster_cache import RasterCache, DEFAULT_MAX_BYTES
+        raster_cache = (raster_cache, raster_cache_size or DEFAULT_MAX_BYTES)
+        cache = RasterCache(*raster_cache)
+    futures = []
+    # Jobs waiting for another job to store the body they share with it
+    followers = []
+    leaders = set()
+    with tempfile.TemporaryDirectory(prefix='pretty-map-batch-') as tmp_dir, \
+            ProcessPoolExecutor(max_workers=workers,
+                                mp_context=multiprocessing.get_context('spawn')) as pool:
+        for group_index, ((_, radius, roads, spacing), group) in enumerate(groups.items()):
+            first = group[0]
+            started = time.perf_counter()
+            print(f"\n[+] Group {group_index + 1}/{len(groups)}: "
+                  f"{first['city'] or (first['lat'], first['lon'])}, radius {radius} ({len(group)} jobs)")
+            # A job whose style cannot be loaded fails on its own; the rest of the group goes on
+            valid, styles, keys = [], [], {}
+            for job in group:
+                try:
+                    style = job_style(job)
+                    if cache and cacheable(job):
+                        keys[job['index']] = job_body_key(job, osm_file, loader)
+                except Exception as e:
+                    results.append(_result(job, 'error', started, f"{type(e).__name__}: {e}",
+                                           traceback.format_exc()))
+                    continue
+                valid.append(job)
+                styles.append(style)
+            if not valid:
+                continue
+            group = valid
+            fetch_style = {
+                'draw_buildings': any(s.get('draw_buildings') for s in styles),
+                'draw_water': any(s.get('draw_water') for s in styles),
+            }
+            # The job with the finest scale decides the road classes the group is fetched with
+            size = max(((job['width'], job['height']) for job in group),
+                       key=lambda s: pixels_per_meter(radius, s[0], round(s[1] * 0.93)))
+            data_path = os.path.join(tmp_dir, f"group_{group_index}.pickle")
+            if len(keys) == len(group) and all(key in cache for key in keys.values()):
+                print("[+] Every map body is cached, nothing to fetch")
+                futures.extend(pool.submit(_render_job, job, data_path, raster_cache, osm_file, loader)
+                               for job in group)
+                continue
+            try:
+                data = MapPosterGenerator(fetch_style, source, loader=loader).fetch_map_data(
+                    first['city'], first['lat'], first['lon'], radius, size, roads, spacing)
+            except Exception as e:
+                for job in group:
+                    results.append(_result(job, 'error', started, f"Fetch failed: {type(e).__name__}: {e}",
+                                           traceback.format_exc()))
+                continue
+            with open(data_path, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            for job in group:
+                key = keys.get(job['index'])
+                if key is not None and key not in cache:
+                    if key in leaders:
+                        followers.append((job, data_path))
+                        continue
+                    leaders.add(key)
+                futures.append(pool.submit(_render_job, job, data_path, raster_cache, osm_file, loader))
+
+        for future in futures:
+            results.append(future.result())
+        if followers:
+            print(f"\n[+] Compositing {len(followers)} posters onto cached map bodies")
+        futures = [pool.submit(_render_job, job, data_path, raster_cache, osm_file, loader)
+                   for job, data_path in followers]
+        for future in futures:
+            results.append(future.result())
+
+    results.sort(key=lambda r: r['index'])
+    failed = [r for r in results if r['status'] != 'ok']
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps({
+        'manifest': str(manifest),
+        'jobs': len(results),
+        'succeeded': len(results) - len(failed),
+        'failed': len(failed),
+        'results': results,
+    }, indent=2, ensure_ascii=False), encoding='utf-8')
+
+    print(f"\n[+] Batch finished: {len(results) - len(failed)} ok, {len(failed)} failed")
+    for r in failed:
+        print(f"[-] Job {r['index']} ({r['location']}, {r['style']}): {r['error']}")
+    print(f"[+] Report: {report_path.absolute()}")
+    print_cache_stats(source)
+    if cache is not None:
+        composited = sum(1 for r in results if r.get('body_cached'))
+        rendered = sum(1 for r in results if r.get('body_cached') is False)
+        print(f"[+] Raster cache: {composited} posters onto cached map bodies, {rendered} bodies rendered")
+    return results
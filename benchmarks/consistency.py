@@ -0,0 +1,160 @@
+"""
+Output consistency checks on synthetic cities.
+
+Each check renders or encodes the same poster two ways that should agree and
+compares the pixels. No network access is needed; the script exits non-zero
+if any check fails:
+
+    python benchmarks/consistency.py
+    python benchmarks/consistency.py --checks dense_jpeg --size 3000x4000
+
+Checks:
+  tiled         posters rendered in strips (PNG, TIFF, borderless PNG and
+                PNG with layer export) match the single-pass render within
+                TILED_TOLERANCE levels
+  dense_jpeg    a full-size image of noise encodes as JPEG and WebP
+  styles_tiled  --style all rendered in strips to JPEG matches the same
+                strips saved as PNG and encoded afterwards, for every style
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+MODES = {
+    'png': {'output_format': 'png'},
+    'tiff': {'output_format': 'tiff'},
+    'borderless': {'output_format': 'png', 'borderless': True},
+    'layers': {'output_format': 'png', 'export_layers': 'layers'},
+}
+# Small enough that a 1200x1600 poster takes several strips
+STRIP_BUDGET = 8 * 1024 ** 2
+# Agg antialiases a street cut at the strip edge slightly differently along its length
+TILED_TOLERANCE = 2
+
+
+def _pixels(path):
+    from PIL import Image
+    import numpy as np
+
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def _differ(a, b):
+    """(differing pixels, largest channel difference) of two RGB arrays."""
+    import numpy as np
+
+    if a.shape != b.shape:
+        return a.size, 255
+    diff = np.abs(a.astype(np.int16) - b.astype(np.int16))
+    return int(diff.max(axis=-1).astype(bool).sum()), int(diff.max())
+
+
+def check_tiled(data, width, height, tmp_dir):
+    from map_poster import DPI, MapPosterGenerator
+    from styles import get_style
+
+    style = get_style('neon').get_config()
+    # Thick streets make seams between strips easy to see
+    style.update(draw_buildings=True, draw_water=True, street_width=1.5)
+    failures = []
+    for mode in MODES:
+        posters = []
+        for tiled in (False, True):
+            options = dict(MODES[mode])
+            case_dir = os.path.join(tmp_dir, f"{mode}_{'tiled' if tiled else 'single'}")
+            os.makedirs(case_dir)
+            if 'export_layers' in options:
+                options['export_layers'] = os.path.join(case_dir, options['export_layers'])
+            output = os.path.join(case_dir, f"poster.{options['output_format']}")
+            with contextlib.redirect_stdout(io.StringIO()):
+                MapPosterGenerator(style).create_poster(data, output, (width / DPI, height / DPI),
+                                                        memory_budget=STRIP_BUDGET, tiled=tiled, **options)
+            posters.append(_pixels(output))
+        pixels, levels = _differ(*posters)
+        if levels > TILED_TOLERANCE:
+            failures.append(f"{mode}: {pixels} pixels off by up to {levels}")
+    return '; '.join(failures) or None
+
+
+def check_dense_jpeg(data, width, height, tmp_dir):
+    import numpy as np
+    from PIL import Image
+    from variants import save_image
+
+    # Noise is the worst case for the encoders' output buffers
+    noise = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    for output_format in ('jpeg', 'webp'):
+        path = os.path.join(tmp_dir, f"dense.{output_format}")
+        save_image(Image.fromarray(noise), path, output_format)
+        if _pixels(path).shape != noise.shape:
+            return f"{output_format} has the wrong size"
+    return None
+
+
+def check_styles_tiled(data, width, height, tmp_dir):
+    from PIL import Image
+    from map_poster import DPI, MapPosterGenerator
+    from styles import get_style, list_styles
+    from variants import save_image
+
+    styles = [(name, get_style(name).get_config()) for name in list_styles()]
+    generator = MapPosterGenerator(styles[0][1])
+    posters = {}
+    for output_format in ('jpeg', 'png'):
+        outputs = [(style, os.path.join(tmp_dir, f"{name}.{output_format}")) for name, style in styles]
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator.create_posters(data, outputs, (width / DPI, height / DPI), output_format=output_format,
+                                     memory_budget=STRIP_BUDGET, tiled=True)
+        posters[output_format] = [path for _, path in outputs]
+    failures = []
+    for (name, _), jpeg, png in zip(styles, posters['jpeg'], posters['png']):
+        expected = os.path.join(tmp_dir, f"{name}_expected.jpg")
+        with Image.open(png) as image:
+            save_image(image.convert('RGB'), expected, 'jpeg')
+        pixels, levels = _differ(_pixels(jpeg), _pixels(expected))
+        if pixels:
+            failures.append(f"{name}: {pixels} pixels off by up to {levels}")
+    return '; '.join(failures) or None
+
+
+CHECKS = {
+    'tiled': check_tiled,
+    'dense_jpeg': check_dense_jpeg,
+    'styles_tiled': check_styles_tiled,
+}
+
+
+def main(argv=None):
+    sys.path.insert(0, str(ROOT))
+    sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checks', nargs='+', choices=list(CHECKS), default=list(CHECKS))
+    parser.add_argument('--city', default='town', help='Synthetic city preset (default: town)')
+    parser.add_argument('--size', default='1200x1600', help='Poster size WIDTHxHEIGHT (default: 1200x1600)')
+    args = parser.parse_args(argv)
+
+    from synthetic import make_city
+
+    width, height = (int(value) for value in args.size.lower().split('x'))
+    data = make_city(args.city)
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in args.checks:
+            problem = CHECKS[name](data, width, height, tmp_dir)
+            if problem:
+                failed += 1
+                print(f"[-] {name}: {problem}")
+            else:
+                print(f"[+] {name}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
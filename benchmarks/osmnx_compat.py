@@ -0,0 +1,123 @@
+"""
+Check the private osmnx calls in osmnx_compat.py against public osmnx.
+
+The same OSM extract is read two ways: through OSMFileSource, which builds
+graphs and GeoDataFrames with the private osmnx functions, and through
+OverpassSource, whose public ox.graph_from_bbox and ox.features_from_bbox
+download it from mock_osm.py running in-process. The street graph, the
+building and water features and the ways loader must agree. No network
+access is needed; the script exits non-zero if any check fails:
+
+    python benchmarks/osmnx_compat.py test-area.osm
+    python benchmarks/osmnx_compat.py test-area.osm --bbox 48.86 48.84 2.36 2.33
+"""
+import argparse
+import contextlib
+import io
+import sqlite3
+import sys
+import threading
+import warnings
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+FEATURE_TAGS = {'building': True, 'natural': ['water'], 'water': True, 'waterway': ['riverbank']}
+
+
+def default_bbox(source):
+    """The middle half of the extract's node extent, as (north, south, east, west)."""
+    conn = sqlite3.connect(f"file:{source.index_path}?mode=ro", uri=True)
+    south, north, west, east = conn.execute("SELECT min(lat), max(lat), min(lon), max(lon) FROM nodes").fetchone()
+    conn.close()
+    dlat, dlon = (north - south) / 4, (east - west) / 4
+    return north - dlat, south + dlat, east - dlon, west + dlon
+
+
+def check_graph(local, overpass, bbox):
+    options = dict(simplify=False, retain_all=True, truncate_by_edge=True)
+    # Without periphery cleaning, osmnx downloads the bbox itself rather than a buffer around it
+    graphs = [local.graph_from_bbox(bbox, **options),
+              overpass.graph_from_bbox(bbox, clean_periphery=False, **options)]
+    nodes, edges = ({frozenset(g.nodes) for g in graphs}, {frozenset(g.edges(keys=True)) for g in graphs})
+    if len(nodes) > 1 or len(edges) > 1:
+        return f"{len(graphs[0])}/{len(graphs[1])} nodes, " \
+               f"{graphs[0].number_of_edges()}/{graphs[1].number_of_edges()} edges"
+    return None
+
+
+def check_features(local, overpass, bbox):
+    frames = [source.features_from_bbox(bbox, FEATURE_TAGS) for source in (local, overpass)]
+    if set(frames[0].index) != set(frames[1].index):
+        return f"{len(frames[0])}/{len(frames[1])} features"
+    geometry = frames[1].geometry.reindex(frames[0].index)
+    if not frames[0].geometry.geom_equals(geometry).all():
+        return "geometries differ"
+    return None
+
+
+def check_ways(local, overpass, bbox):
+    import numpy as np
+
+    ways = [source.ways_from_bbox(bbox) for source in (local, overpass)]
+    order = [np.argsort(w.osmid) for w in ways]
+    if not np.array_equal(*(w.osmid[o] for w, o in zip(ways, order))):
+        return f"{len(ways[0])}/{len(ways[1])} ways"
+    if not all(np.array_equal(a, b) for a, b in zip(*(np.split(w.coords, w.offsets[1:-1]) for w in ways))):
+        # Both follow the response order, which is the same for the same elements
+        return "way coordinates differ"
+    return None
+
+
+CHECKS = {
+    'graph': check_graph,
+    'features': check_features,
+    'ways': check_ways,
+}
+
+
+def main(argv=None):
+    sys.path.insert(0, str(ROOT))
+    warnings.filterwarnings('ignore')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('osm_file', help='OSM extract (.osm, .osm.bz2 or .osm.pbf)')
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('NORTH', 'SOUTH', 'EAST', 'WEST'),
+                        help='Area to compare (default: the middle of the extract)')
+    parser.add_argument('--checks', nargs='+', choices=list(CHECKS), default=list(CHECKS))
+    args = parser.parse_args(argv)
+
+    import osmnx as ox
+    from map_poster import OverpassSource, configure_endpoints
+    from mock_osm import MockOSMHandler
+    from osm_file import OSMFileSource
+
+    local = OSMFileSource(args.osm_file)
+    bbox = tuple(args.bbox) if args.bbox else default_bbox(local)
+    MockOSMHandler.source = local
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockOSMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    configure_endpoints(overpass_url=f"http://127.0.0.1:{server.server_address[1]}/api")
+    # Responses must come from the mock, not from an earlier run's cache
+    ox.settings.use_cache = False
+
+    print(f"[+] osmnx {ox.__version__}, bbox {bbox}")
+    failed = 0
+    try:
+        for name in args.checks:
+            # pandas warns from inside osmnx and geopandas whatever the filters say
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                problem = CHECKS[name](local, OverpassSource(), bbox)
+            if problem:
+                failed += 1
+                print(f"[-] {name}: {problem}")
+            else:
+                print(f"[+] {name}")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Render benchmark on synthetic cities.
+
+For every city preset and output size, renders the poster in several modes
+(PNG, SVG, borderless PNG, PNG with layer export) through
+MapPosterGenerator.create_poster and records the stage timings reported by
+the --profile instrumentation: prepare, project, lod, render, save,
+export_layers. No network access is needed.
+
+Results are appended as JSON lines tagged with the git commit, so runs from
+different commits can be compared:
+
+    python benchmarks/render.py --cities town city --sizes 1200x1600 3000x4000
+    python benchmarks/render.py --compare abc1234 def5678
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_RESULTS = ROOT / 'benchmarks' / 'results.jsonl'
+MODES = {
+    'png': {'output_format': 'png'},
+    'svg': {'output_format': 'svg'},
+    'borderless': {'output_format': 'png', 'borderless': True},
+    'layers': {'output_format': 'png', 'export_layers': 'layers'},
+}
+STAGES = ('prepare', 'project', 'lod', 'render', 'save', 'render_save', 'export_layers', 'poster')
+
+
+def git_commit():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+
+    commit = git('rev-parse', '--short', 'HEAD') or None
+    # Uncommitted changes to tracked files make the numbers belong to no commit
+    if commit and git('status', '--porcelain', '--untracked-files=no'):
+        commit += '-dirty'
+    return commit
+
+
+def run_case(data, style, width, height, mode, tmp_dir, lod=True):
+    from map_poster import DPI, MapPosterGenerator
+    from profiler import StageProfiler
+
+    profiler = StageProfiler()
+    generator = MapPosterGenerator(style, profiler=profiler)
+    options = dict(MODES[mode])
+    if 'export_layers' in options:
+        options['export_layers'] = os.path.join(tmp_dir, options['export_layers'])
+    output = os.path.join(tmp_dir, f"poster.{options['output_format']}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.create_poster(data, output, (width / DPI, height / DPI), lod=lod, **options)
+    stages = {}
+    for record in profiler.ordered_records():
+        if record['stage'] in STAGES:
+            stages[record['stage']] = record
+    stages['file_mb'] = round(os.path.getsize(output) / 1024 ** 2, 2)
+    return stages
+
+
+def run(cities, sizes, modes, style_name, repeat, scale, results_path, lod=True):
+    from styles import get_style
+    from synthetic import make_city
+
+    style = get_style(style_name).get_config()
+    # Every mode draws the same layers, whatever the style
+    style.update(draw_buildings=True, draw_water=True)
+    commit = git_commit()
+    machine = {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()}
+    records = []
+    for city in cities:
+        started = time.perf_counter()
+        data = make_city(city, scale=scale)
+        print(f"[+] {city}: {len(data.graph.edges):,} edges, {len(data.buildings):,} buildings, "
+              f"generated in {time.perf_counter() - started:.1f} s")
+        for width, height in sizes:
+            for mode in modes:
+                runs = []
+                with tempfile.TemporaryDirectory(prefix='pretty-map-bench-') as tmp_dir:
+                    for _ in range(repeat):
+                        runs.append(run_case(data, style, width, height, mode, tmp_dir, lod))
+                record = {
+                    'benchmark': 'render', 'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    **machine, 'city': city, 'scale': scale, 'edges': len(data.graph.edges),
+                    'width': width, 'height': height, 'mode': mode, 'style': style_name, 'lod': lod,
+                    'repeat': repeat, 'file_mb': runs[-1]['file_mb'],
+                }
+                # Best of the repeats per stage: the least disturbed measurement
+                for stage in STAGES:
+                    samples = [r[stage] for r in runs if stage in r]
+                    if samples:
+                        record[f'{stage}_s'] = min(s['wall'] for s in samples)
+                        record[f'{stage}_peak_mb'] = max(s['peak_rss_mb'] or 0 for s in samples)
+                records.append(record)
+                shown = ', '.join(f"{stage} {record[f'{stage}_s']:.3f}" for stage in STAGES
+                                  if f'{stage}_s' in record and stage != 'poster')
+                print(f"    {width}x{height} {mode:10} total {record['poster_s']:.3f} s  ({shown})")
+
+    if results_path:
+        with open(results_path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        print(f"[+] Results appended to {results_path} (commit {commit})")
+    return records
+
+
+def compare(results_path, base, head):
+    """Print head/base ratios of total time for the cases both commits ran."""
+    by_commit = {}
+    with open(results_path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get('benchmark') != 'render':
+                continue
+            key = (record['city'], record['width'], record['height'], record['mode'], record.get('lod', True))
+            # The latest run of a case wins
+            by_commit.setdefault(record['commit'], {})[key] = record
+
+    def find(commit):
+        matches = [c for c in by_commit if c and c.startswith(commit)]
+        if not matches:
+            raise SystemExit(f"[-] No results for commit {commit} in {results_path}")
+        return by_commit[matches[-1]]
+
+    old, new = find(base), find(head)
+    ratios = []
+    print(f"{'case':40} {base:>12} {head:>12} {'ratio':>7}")
+    for key in sorted(old.keys() & new.keys(), key=str):
+        a, b = old[key]['poster_s'], new[key]['poster_s']
+        ratios.append(b / a)
+        city, width, height, mode, _ = key
+        print(f"{f'{city} {width}x{height} {mode}':40} {a:12.3f} {b:12.3f} {b / a:7.2f}")
+    if ratios:
+        print(f"[+] Geometric mean ratio: {statistics.geometric_mean(ratios):.3f} over {len(ratios)} cases")
+
+
+def _size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main(argv=None):
+    sys.path.insert(0, str(ROOT))
+    sys.path.insert(0, str(ROOT / 'benchmarks'))
+    from synthetic import CITY_PRESETS
+
+    parser = argparse.ArgumentParser(description='Benchmark poster rendering on synthetic cities')
+    parser.add_argument('--cities', nargs='+', default=['town', 'city'], choices=list(CITY_PRESETS),
+                        help='City presets (default: town city)')
+    parser.add_argument('--sizes', nargs='+', type=_size, default=[(1200, 1600), (3000, 4000)],
+                        metavar='WxH', help='Output sizes (default: 1200x1600 3000x4000)')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES),
+                        help='Render modes (default: all)')
+    parser.add_argument('--style', default='watercolor', help='Built-in style (default: watercolor)')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per case; the fastest is kept (default: 1)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiply the street and building counts of every preset (default: 1.0)')
+    parser.add_argument('--no-lod', dest='lod', action='store_false', help='Benchmark without simplification')
+    parser.add_argument('--output', default=str(DEFAULT_RESULTS),
+                        help=f'JSON lines file to append to (default: {DEFAULT_RESULTS.relative_to(ROOT)})')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'),
+                        help='Compare the stored results of two commits instead of running')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(args.output, *args.compare)
+        return 0
+    run(args.cities, args.sizes, args.modes, args.style, args.repeat, args.scale, args.output, args.lod)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
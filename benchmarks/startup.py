@@ -0,0 +1,106 @@
+"""
+CLI startup benchmark.
+
+Times main.py invocations that never render (help, style listing, argument
+errors, custom style loading) in fresh interpreters, and checks that none of
+them imports the rendering stack. Exits non-zero when a case is slower than
+--max-seconds or pulls in a heavy module, so it can guard CI.
+
+    python benchmarks/startup.py --runs 10 --max-seconds 0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ('osmnx', 'geopandas', 'pandas', 'matplotlib', 'shapely', 'networkx', 'pyproj')
+
+# Run main() in-process and report which heavy modules ended up loaded
+PROBE = """
+import json, sys
+sys.argv = ['main.py'] + json.loads(sys.argv[1])
+sys.path.insert(0, {root!r})
+import main
+try:
+    main.main()
+except SystemExit:
+    pass
+heavy = sorted(m for m in json.loads(sys.argv[2]) if m in sys.modules)
+sys.stderr.write('\\nHEAVY ' + json.dumps(heavy) + '\\n')
+"""
+
+
+def cases(custom_style):
+    return {
+        'help': ['--help'],
+        'list-styles': ['--list-styles'],
+        'bad-style': ['--city', 'X', '--style', 'nope'],
+        'missing-location': ['--style', 'dark'],
+        'custom-style-conflict': ['--custom-style', custom_style, '--style', 'all', '--city', 'X'],
+        'serve-help': ['serve', '--help'],
+    }
+
+
+def run_case(args, runs):
+    times = []
+    heavy = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-c', PROBE.format(root=str(ROOT)), json.dumps(args), json.dumps(HEAVY_MODULES)],
+            cwd=ROOT, capture_output=True, text=True)
+        times.append(time.perf_counter() - started)
+        for line in proc.stderr.splitlines():
+            if line.startswith('HEAVY '):
+                heavy = json.loads(line[6:])
+    return times, heavy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark CLI startup without rendering')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per case (default: 5)')
+    parser.add_argument('--max-seconds', type=float, default=0.5,
+                        help='Fail when a case median exceeds this (default: 0.5)')
+    parser.add_argument('--output', type=str, help='Append results as one JSON line to this file')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'])
+    interpreter = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as tmp:
+        custom_style = os.path.join(tmp, 'style.json')
+        Path(custom_style).write_text('{"bg_color": "#123456"}', encoding='utf-8')
+        results = {}
+        failed = False
+        print(f"[+] Bare interpreter: {interpreter:.3f} s")
+        for name, case_args in cases(custom_style).items():
+            times, heavy = run_case(case_args, args.runs)
+            median = statistics.median(times)
+            results[name] = {'median': round(median, 4), 'min': round(min(times), 4), 'heavy_imports': heavy}
+            ok = median <= args.max_seconds and not heavy
+            failed |= not ok
+            note = f", imports {', '.join(heavy)}" if heavy else ""
+            print(f"{'[+]' if ok else '[-]'} {name:24} median {median:.3f} s, min {min(times):.3f} s{note}")
+
+    if args.output:
+        record = {'benchmark': 'startup', 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'commit': _commit(), 'interpreter': round(interpreter, 4), 'cases': results}
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+    return 1 if failed else 0
+
+
+def _commit():
+    proc = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return proc.stdout.strip() or None
+
+
+if __name__ == '__main__':
+    sys.exit(main())
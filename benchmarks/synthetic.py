@@ -0,0 +1,151 @@
+"""
+Synthetic cities for offline benchmarks.
+
+make_city() builds the same MapData that fetch_map_data returns: an osmnx-style
+MultiDiGraph of streets (jittered grid, two-way edges, some curved edges with
+geometry) plus building and water GeoDataFrames, with sizes picked from
+CITY_PRESETS. Everything is generated from a seed, so a preset is the same
+city on every machine and every commit.
+"""
+import math
+import sys
+from pathlib import Path
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import shapely
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from map_poster import MapData  # noqa: E402
+
+METERS_PER_DEGREE = 111320.0
+CENTER = (48.85, 2.35)
+
+# Directed street edges (about four per grid node), buildings and lakes per preset
+CITY_PRESETS = {
+    'town': {'radius': 2000, 'edges': 5000, 'buildings': 4000, 'lakes': 1},
+    'city': {'radius': 5000, 'edges': 40000, 'buildings': 40000, 'lakes': 3},
+    'large': {'radius': 10000, 'edges': 150000, 'buildings': 120000, 'lakes': 6},
+    'metro': {'radius': 15000, 'edges': 500000, 'buildings': 300000, 'lakes': 10},
+}
+HIGHWAY_CLASSES = ('residential', 'residential', 'residential', 'service', 'tertiary', 'secondary',
+                   'primary', 'footway')
+# Share of street edges drawn as a curve with intermediate vertices
+CURVED_SHARE = 0.3
+# Share of grid segments left out so blocks vary in size
+DROPPED_SHARE = 0.08
+
+
+def _degrees(rng, center, radius, size):
+    """Offsets in meters around center turned into lon/lat arrays."""
+    lat, lon = center
+    dx = rng.uniform(-radius, radius, size)
+    dy = rng.uniform(-radius, radius, size)
+    return lon + dx / (METERS_PER_DEGREE * math.cos(math.radians(lat))), lat + dy / METERS_PER_DEGREE
+
+
+def street_graph(rng, center, radius, edges):
+    """Jittered grid of two-way streets with about edges directed edges."""
+    lat, lon = center
+    n = max(2, round(math.sqrt(edges / (4 * (1 - DROPPED_SHARE)))))
+    step = 2 * radius / (n - 1)
+    i, j = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    x_m = -radius + j * step + rng.normal(0, step * 0.15, (n, n))
+    y_m = -radius + i * step + rng.normal(0, step * 0.15, (n, n))
+    cos_lat = math.cos(math.radians(lat))
+    xs = (lon + x_m / (METERS_PER_DEGREE * cos_lat)).ravel()
+    ys = (lat + y_m / METERS_PER_DEGREE).ravel()
+    ids = np.arange(n * n)
+
+    grid = ids.reshape(n, n)
+    u = np.concatenate([grid[:, :-1].ravel(), grid[:-1, :].ravel()])
+    v = np.concatenate([grid[:, 1:].ravel(), grid[1:, :].ravel()])
+    keep = rng.random(len(u)) >= DROPPED_SHARE
+    u, v = u[keep], v[keep]
+    lengths = np.hypot((xs[u] - xs[v]) * cos_lat, ys[u] - ys[v]) * METERS_PER_DEGREE
+    classes = rng.integers(0, len(HIGHWAY_CLASSES), len(u))
+
+    curved = rng.random(len(u)) < CURVED_SHARE
+    bend = rng.normal(0, 0.12, len(u))
+    mid_x = (xs[u] + xs[v]) / 2 - (ys[v] - ys[u]) * bend / cos_lat
+    mid_y = (ys[u] + ys[v]) / 2 + (xs[v] - xs[u]) * bend * cos_lat
+    line_coords = np.stack([np.stack([xs[u], ys[u]], 1), np.stack([mid_x, mid_y], 1),
+                            np.stack([xs[v], ys[v]], 1)], 1)[curved]
+    forward = shapely.linestrings(line_coords)
+    backward = shapely.linestrings(line_coords[:, ::-1])
+
+    graph = nx.MultiDiGraph(crs='epsg:4326')
+    graph.add_nodes_from((int(n_id), {'x': float(x), 'y': float(y)}) for n_id, x, y in zip(ids, xs, ys))
+    curve_index = np.cumsum(curved) - 1
+    edge_list = []
+    for k in range(len(u)):
+        data = {'osmid': k, 'length': float(lengths[k]), 'highway': HIGHWAY_CLASSES[classes[k]],
+                'oneway': False}
+        if curved[k]:
+            c = curve_index[k]
+            edge_list.append((int(u[k]), int(v[k]), 0, dict(data, geometry=forward[c])))
+            edge_list.append((int(v[k]), int(u[k]), 0, dict(data, geometry=backward[c])))
+        else:
+            edge_list.append((int(u[k]), int(v[k]), 0, data))
+            edge_list.append((int(v[k]), int(u[k]), 0, dict(data)))
+    graph.add_edges_from(edge_list)
+    return graph
+
+
+def buildings_frame(rng, center, radius, count):
+    """Rotated rectangular footprints of 8-40 m, a few with a courtyard."""
+    lat, _ = center
+    x, y = _degrees(rng, center, radius, count)
+    w = rng.uniform(8, 40, count) / 2
+    h = rng.uniform(8, 30, count) / 2
+    angle = rng.uniform(0, math.pi, count)
+    corners = np.array([(-1, -1), (1, -1), (1, 1), (-1, 1), (-1, -1)], dtype=float)
+    cos_a, sin_a = np.cos(angle)[:, None], np.sin(angle)[:, None]
+    cx, cy = corners[None, :, 0] * w[:, None], corners[None, :, 1] * h[:, None]
+    dx = (cx * cos_a - cy * sin_a) / (METERS_PER_DEGREE * math.cos(math.radians(lat)))
+    dy = (cx * sin_a + cy * cos_a) / METERS_PER_DEGREE
+    shells = np.stack([x[:, None] + dx, y[:, None] + dy], axis=2)
+    polygons = shapely.polygons(shells)
+
+    courtyard = np.flatnonzero((w > 15) & (h > 10) & (rng.random(count) < 0.3))
+    for k in courtyard:
+        inner = np.stack([x[k] + dx[k] * 0.4, y[k] + dy[k] * 0.4], axis=1)[::-1]
+        polygons[k] = shapely.Polygon(shells[k], [inner])
+    return gpd.GeoDataFrame({'building': ['yes'] * count}, geometry=polygons, crs='epsg:4326')
+
+
+def water_frame(rng, center, radius, lakes):
+    """A river band across the area and round lakes with detailed shores and an island."""
+    lat, lon = center
+    cos_lat = math.cos(math.radians(lat))
+    geometries = []
+    # River: a wide, meandering band from west to east
+    t = np.linspace(-1.2, 1.2, 400)
+    river_x = lon + t * radius / (METERS_PER_DEGREE * cos_lat)
+    river_y = lat + (np.sin(t * 4) * 0.15 * radius) / METERS_PER_DEGREE
+    width = 0.02 * radius / METERS_PER_DEGREE
+    shell = np.concatenate([np.stack([river_x, river_y + width], 1), np.stack([river_x, river_y - width], 1)[::-1]])
+    geometries.append(shapely.Polygon(shell))
+    for _ in range(lakes):
+        x, y = _degrees(rng, center, radius * 0.8, 1)
+        size = rng.uniform(0.03, 0.08) * radius
+        theta = np.linspace(0, 2 * math.pi, 600, endpoint=False)
+        r = size * (1 + 0.15 * np.sin(theta * rng.integers(3, 9)) + rng.normal(0, 0.01, len(theta)))
+        shore = np.stack([x + r * np.cos(theta) / (METERS_PER_DEGREE * cos_lat),
+                          y + r * np.sin(theta) / METERS_PER_DEGREE], 1)
+        island = np.stack([x + 0.2 * size * np.cos(theta[::12]) / (METERS_PER_DEGREE * cos_lat),
+                           y + 0.2 * size * np.sin(theta[::12]) / METERS_PER_DEGREE], 1)[::-1]
+        geometries.append(shapely.Polygon(shore, [island]))
+    return gpd.GeoDataFrame({'natural': ['water'] * len(geometries)}, geometry=geometries, crs='epsg:4326')
+
+
+def make_city(preset='town', seed=0, scale=1.0):
+    """MapData for a synthetic city; scale multiplies the edge and building counts."""
+    params = CITY_PRESETS[preset]
+    rng = np.random.default_rng(seed)
+    graph = street_graph(rng, CENTER, params['radius'], int(params['edges'] * scale))
+    buildings = buildings_frame(rng, CENTER, params['radius'], int(params['buildings'] * scale))
+    water = water_frame(rng, CENTER, params['radius'], params['lakes'])
+    return MapData(graph, f"Synthetic {preset}", CENTER, params['radius'], buildings, water)
@@ -0,0 +1,130 @@
+import csv
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+DEFAULT_GEOCODE_CACHE = Path.home() / '.cache' / 'pretty-map' / 'geocode.sqlite'
+
+
+def normalize_query(query):
+    """
+    Cache key of a place query: accents and case folded, punctuation other
+    than commas dropped, whitespace collapsed, so that "  Zürich,Switzerland"
+    and "zurich, switzerland" share an entry.
+    """
+    text = unicodedata.normalize('NFKD', query)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    parts = (re.sub(r'[^\w\s]+', ' ', part) for part in text.split(','))
+    return ', '.join(p for p in (' '.join(part.split()) for part in parts) if p)
+
+
+def load_gazetteer(path):
+    """
+    Read a gazetteer into {normalized name: (lat, lon)}.
+
+    CSV files need name, lat and lon columns; SQLite files a places table
+    with the same columns. An optional country column also adds
+    "name, country" keys, and where names repeat the row with the largest
+    optional population column wins.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"Gazetteer not found: {path}")
+    if path.suffix.lower() == '.csv':
+        with path.open(newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = [dict(row) for row in conn.execute("SELECT * FROM places")]
+        except sqlite3.DatabaseError as e:
+            raise ValueError(f"{path} is not a gazetteer with a places table: {e}")
+        finally:
+            conn.close()
+
+    places = {}
+    ranks = {}
+    for row in rows:
+        try:
+            point = (float(row['lat']), float(row['lon']))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Gazetteer {path} needs name, lat and lon for every place")
+        rank = float(row.get('population') or 0)
+        keys = [normalize_query(str(row['name']))]
+        if row.get('country'):
+            keys.append(normalize_query(f"{row['name']}, {row['country']}"))
+        for key in keys:
+            if key and rank >= ranks.get(key, -1):
+                places[key] = point
+                ranks[key] = rank
+    return places
+
+
+class GeocodeCache:
+    """
+    Source wrapper that answers geocode() locally whenever it can.
+
+    Queries are looked up by normalized key in memory, then in the gazetteer,
+    then in a persistent SQLite cache of earlier answers; only the rest go to
+    the wrapped source, and its answers are stored. Unknown places are not
+    cached. Everything else is delegated to the wrapped source.
+    """
+
+    def __init__(self, source, cache_path=DEFAULT_GEOCODE_CACHE, gazetteer=None):
+        self.source = source
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.places = load_gazetteer(gazetteer) if gazetteer else {}
+        self.memory = {}
+        self.counts = {'memory': 0, 'gazetteer': 0, 'cache': 0, 'lookups': 0}
+        self._lock = threading.Lock()
+        self._conn = None
+        if self.cache_path:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.cache_path, timeout=30, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS geocode "
+                               "(key TEXT PRIMARY KEY, query TEXT, lat REAL, lon REAL, created REAL)")
+            self._conn.commit()
+
+    def __getattr__(self, name):
+        # Only called for attributes the wrapper lacks: graph_from_bbox, max_retries, stats, ...
+        if name == 'source':
+            raise AttributeError(name)
+        return getattr(self.source, name)
+
+    def _count(self, kind):
+        with self._lock:
+            self.counts[kind] += 1
+
+    def geocode(self, query):
+        key = normalize_query(query)
+        point = self.memory.get(key)
+        if point is not None:
+            self._count('memory')
+            return point
+        point = self.places.get(key)
+        if point is not None:
+            self._count('gazetteer')
+        elif self._conn is not None:
+            with self._lock:
+                row = self._conn.execute("SELECT lat, lon FROM geocode WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                point = row
+                self._count('cache')
+        if point is None:
+            point = tuple(float(v) for v in self.source.geocode(query))
+            self._count('lookups')
+            if self._conn is not None:
+                with self._lock:
+                    self._conn.execute("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?)",
+                                       (key, query, point[0], point[1], time.time()))
+                    self._conn.commit()
+        self.memory[key] = point
+        return point
+
+    def geocode_stats(self):
+        with self._lock:
+            return dict(self.counts, gazetteer_places=len(self.places))
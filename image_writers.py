@@ -0,0 +1,345 @@
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_COLOR_TYPES = {3: 2, 4: 6}
+DEFLATE_WINDOW = 32768
+TIFF_ROWS_PER_STRIP = 64
+
+
+class _OrderedCompressor:
+    """Runs compression jobs on a thread pool and hands results back in submission order."""
+
+    def __init__(self, threads, sink):
+        self.sink = sink
+        self.pool = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        self.pending = deque()
+        self.max_pending = threads * 2
+
+    def submit(self, fn, *args):
+        if self.pool is None:
+            self.sink(fn(*args))
+            return
+        self.pending.append(self.pool.submit(fn, *args))
+        while len(self.pending) > self.max_pending:
+            self.sink(self.pending.popleft().result())
+
+    def drain(self):
+        while self.pending:
+            self.sink(self.pending.popleft().result())
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def _deflate_block(data, level, zdict):
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _png_up(rows, previous_row):
+    """Rows as PNG scanlines with the Up filter, one (filter byte + pixels) row each."""
+    flat = rows.reshape(len(rows), -1)
+    up = np.empty((len(rows), flat.shape[1] + 1), dtype=np.uint8)
+    up[:, 0] = 2
+    np.subtract(flat[0], previous_row.reshape(-1), out=up[0, 1:])
+    np.subtract(flat[1:], flat[:-1], out=up[1:, 1:])
+    return up
+
+
+def adler32_combine(adler1, adler2, length2):
+    """Adler-32 of two concatenated buffers from their checksums (zlib's adler32_combine)."""
+    base = 65521
+    rem = length2 % base
+    sum1 = adler1 & 0xffff
+    sum2 = (rem * sum1) % base
+    sum1 += (adler2 & 0xffff) + base - 1
+    sum2 += (adler1 >> 16) + (adler2 >> 16) + base - rem
+    if sum1 >= base:
+        sum1 -= base
+    if sum1 >= base:
+        sum1 -= base
+    if sum2 >= base << 1:
+        sum2 -= base << 1
+    if sum2 >= base:
+        sum2 -= base
+    return sum1 | (sum2 << 16)
+
+
+def png_stream_state(image, row):
+    """
+    (previous row, deflate window) of a StreamingPNGWriter that has written
+    image[:row], for resume() after bands written with write_deflated().
+    """
+    width, channels = image.shape[1:]
+    if row == 0:
+        return np.zeros((width, channels), dtype=np.uint8), b''
+    start = max(0, row - -(-DEFLATE_WINDOW // (width * channels + 1)))
+    previous = image[start - 1] if start else np.zeros((width, channels), dtype=np.uint8)
+    up = _png_up(np.ascontiguousarray(image[start:row]), previous)
+    return np.array(image[row - 1]), up.reshape(-1)[-DEFLATE_WINDOW:].tobytes()
+
+
+def deflate_png_rows(rows, previous_row, window, level=6):
+    """
+    One band of a StreamingPNGWriter stream, to store and replay with
+    write_deflated(): (deflate data, Adler-32 and length of the scanlines).
+    """
+    up = _png_up(np.ascontiguousarray(rows, dtype=np.uint8), previous_row)
+    return _deflate_block(up.data, level, window), zlib.adler32(up.data), up.nbytes
+
+
+def _identity(value):
+    return value
+
+
+class StreamingPNGWriter:
+    """
+    Writes a PNG from successive bands of rows without holding the whole image.
+
+    Rows use the PNG "Up" filter. With threads > 1 each band is deflated
+    independently (primed with the previous band's last 32 KB, like pigz) and the
+    raw deflate blocks are joined into a single zlib stream.
+    """
+
+    def __init__(self, path, width, height, channels=3, level=6, threads=1, dpi=300):
+        if channels not in PNG_COLOR_TYPES:
+            raise ValueError("PNG writer supports RGB or RGBA rows")
+        self.file = open(path, 'wb')
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.level = level
+        self.rows_written = 0
+        self.previous_row = np.zeros((width, channels), dtype=np.uint8)
+        self.adler = 1
+        self.window = b''
+        self.compressor = _OrderedCompressor(threads, self._write_idat)
+
+        self.file.write(PNG_SIGNATURE)
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8,
+                                               PNG_COLOR_TYPES[channels], 0, 0, 0))
+        pixels_per_meter = round(dpi / 0.0254)
+        self._write_chunk(b'pHYs', struct.pack('>IIB', pixels_per_meter, pixels_per_meter, 1))
+        self._write_idat(b'\x78\x9c')
+
+    def _write_chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    def _write_idat(self, data):
+        if data:
+            self._write_chunk(b'IDAT', data)
+
+    def write_rows(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=np.uint8)
+        if rows.shape[1:] != (self.width, self.channels):
+            raise ValueError(f"Expected rows of shape (n, {self.width}, {self.channels}), got {rows.shape}")
+        up = _png_up(rows, self.previous_row)
+        self.previous_row = rows[-1].copy()
+        data = up.data
+
+        self.adler = zlib.adler32(data, self.adler)
+        self.compressor.submit(_deflate_block, data, self.level, self.window)
+        self.window = up.reshape(-1)[-DEFLATE_WINDOW:].tobytes()
+        self.rows_written += len(rows)
+
+    def write_deflated(self, block, rows):
+        """
+        Append rows already encoded by deflate_png_rows() as (data, adler, length).
+        Call resume() before writing rows again.
+        """
+        data, adler, length = block
+        self.adler = adler32_combine(self.adler, adler, length)
+        self.compressor.submit(_identity, data)
+        self.previous_row = None
+        self.rows_written += rows
+
+    def resume(self, previous_row, window):
+        """Set the stream state (from png_stream_state) after write_deflated()."""
+        self.previous_row = previous_row
+        self.window = window
+
+    def close(self):
+        self.compressor.drain()
+        final = zlib.compressobj(self.level, zlib.DEFLATED, -15).flush(zlib.Z_FINISH)
+        self._write_idat(final + struct.pack('>I', self.adler & 0xffffffff))
+        self._write_chunk(b'IEND', b'')
+        self.file.close()
+        if self.rows_written != self.height:
+            raise ValueError(f"PNG expected {self.height} rows, got {self.rows_written}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.compressor.drain()
+            self.file.close()
+
+
+def compress_tiff_strip(rows, level=6):
+    # Horizontal differencing (TIFF predictor 2) per channel, then zlib
+    diff = rows.copy()
+    diff[:, 1:] -= rows[:, :-1]
+    return zlib.compress(diff.tobytes(), level)
+
+
+def _tiff_page_strip(page, rows, level):
+    return page, compress_tiff_strip(rows, level)
+
+
+class _TIFFPage:
+    def __init__(self, width, channels, name=None):
+        self.channels = channels
+        self.name = name
+        self.buffer = np.empty((0, width, channels), dtype=np.uint8)
+        self.rows_written = 0
+        self.strip_offsets = []
+        self.strip_sizes = []
+
+
+class StreamingTIFFWriter:
+    """
+    Writes a deflate-compressed BigTIFF strip by strip.
+
+    Image strips are fixed at TIFF_ROWS_PER_STRIP rows and compressed
+    independently, so they can be encoded in parallel; offsets are collected and
+    the IFD is written at the end of the file. pages=[(name, channels), ...]
+    makes a multi-page file whose pages are fed with write_rows(rows, page=i)
+    in any interleaving.
+    """
+
+    def __init__(self, path, width, height, channels=3, level=6, threads=1, dpi=300, pages=None):
+        self.file = open(path, 'wb')
+        self.width = width
+        self.height = height
+        self.level = level
+        self.dpi = dpi
+        self.pages = [_TIFFPage(width, page_channels, name)
+                      for name, page_channels in (pages or [(None, channels)])]
+        self.compressor = _OrderedCompressor(threads, self._write_strip)
+        # Header: little endian, BigTIFF (43), 8-byte offsets, first IFD offset patched on close
+        self.file.write(b'II' + struct.pack('<HHHQ', 43, 8, 0, 0))
+
+    def _write_strip(self, result):
+        page, data = result
+        page.strip_offsets.append(self.file.tell())
+        page.strip_sizes.append(len(data))
+        self.file.write(data)
+
+    def _submit(self, page, rows):
+        self.compressor.submit(_tiff_page_strip, page, rows, self.level)
+
+    def write_compressed(self, data, rows, page=0):
+        """Append one strip already compressed by compress_tiff_strip(); strips stay TIFF_ROWS_PER_STRIP rows."""
+        page = self.pages[page]
+        if len(page.buffer):
+            raise ValueError("Compressed strips must start on a strip boundary")
+        self.compressor.submit(_identity, (page, data))
+        page.rows_written += rows
+
+    def write_rows(self, rows, page=0):
+        page = self.pages[page]
+        rows = np.ascontiguousarray(rows, dtype=np.uint8)
+        if rows.shape[1:] != (self.width, page.channels):
+            raise ValueError(f"Expected rows of shape (n, {self.width}, {page.channels}), got {rows.shape}")
+        # Always copy: callers may hand in a view of a canvas that is redrawn later
+        page.buffer = np.concatenate([page.buffer, rows])
+        page.rows_written += len(rows)
+        while len(page.buffer) >= TIFF_ROWS_PER_STRIP:
+            self._submit(page, page.buffer[:TIFF_ROWS_PER_STRIP].copy())
+            page.buffer = page.buffer[TIFF_ROWS_PER_STRIP:]
+
+    def _write_ifd(self, page):
+        SHORT, LONG, RATIONAL, LONG8, ASCII = 3, 4, 5, 16, 2
+        channels = page.channels
+        entries = [
+            (256, LONG, 1, struct.pack('<I', self.width)),
+            (257, LONG, 1, struct.pack('<I', self.height)),
+            (258, SHORT, channels, struct.pack(f'<{channels}H', *[8] * channels)),
+            (259, SHORT, 1, struct.pack('<H', 8)),
+            (262, SHORT, 1, struct.pack('<H', 2)),
+            (273, LONG8, len(page.strip_offsets), np.array(page.strip_offsets, dtype='<u8').tobytes()),
+            (277, SHORT, 1, struct.pack('<H', channels)),
+            (278, LONG, 1, struct.pack('<I', TIFF_ROWS_PER_STRIP)),
+            (279, LONG8, len(page.strip_sizes), np.array(page.strip_sizes, dtype='<u8').tobytes()),
+            (282, RATIONAL, 1, struct.pack('<II', self.dpi, 1)),
+            (283, RATIONAL, 1, struct.pack('<II', self.dpi, 1)),
+            (284, SHORT, 1, struct.pack('<H', 1)),
+        ]
+        if page.name:
+            name = page.name.encode('ascii', 'replace') + b'\0'
+            entries.append((285, ASCII, len(name), name))
+        entries += [
+            (296, SHORT, 1, struct.pack('<H', 2)),
+            (317, SHORT, 1, struct.pack('<H', 2)),
+        ]
+        if channels == 4:
+            entries.append((338, SHORT, 1, struct.pack('<H', 2)))
+
+        # Values that do not fit in the 8-byte entry go before the IFD
+        fields = []
+        for tag, kind, count, value in entries:
+            if len(value) > 8:
+                if self.file.tell() % 2:
+                    self.file.write(b'\0')
+                offset = self.file.tell()
+                self.file.write(value)
+                value = struct.pack('<Q', offset)
+            fields.append(struct.pack('<HHQ', tag, kind, count) + value.ljust(8, b'\0'))
+
+        if self.file.tell() % 2:
+            self.file.write(b'\0')
+        ifd_pos = self.file.tell()
+        self.file.write(struct.pack('<Q', len(fields)))
+        self.file.write(b''.join(fields))
+        next_pointer = self.file.tell()
+        self.file.write(struct.pack('<Q', 0))
+        return ifd_pos, next_pointer
+
+    def close(self):
+        for page in self.pages:
+            if len(page.buffer):
+                self._submit(page, page.buffer.copy())
+        self.compressor.drain()
+        for page in self.pages:
+            if page.rows_written != self.height:
+                self.file.close()
+                raise ValueError(f"TIFF expected {self.height} rows, got {page.rows_written}")
+
+        pointer = 8
+        for page in self.pages:
+            ifd_pos, next_pointer = self._write_ifd(page)
+            end = self.file.tell()
+            self.file.seek(pointer)
+            self.file.write(struct.pack('<Q', ifd_pos))
+            self.file.seek(end)
+            pointer = next_pointer
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.compressor.drain()
+            self.file.close()
+
+
+def open_writer(path, output_format, width, height, channels=3, threads=1, dpi=300):
+    if output_format in ('tif', 'tiff'):
+        return StreamingTIFFWriter(path, width, height, channels, threads=threads, dpi=dpi)
+    return StreamingPNGWriter(path, width, height, channels, threads=threads, dpi=dpi)
@@ -0,0 +1,103 @@
+import numpy as np
+import shapely
+
+from renderers import orient_rings
+
+METERS_PER_DEGREE = 111320.0
+# Vertices that move the line by less than this are dropped
+SIMPLIFY_PIXELS = 0.1
+# Rings smaller than this area and lines shorter than this are culled
+MIN_AREA_PIXELS = 1.0
+MIN_LENGTH_PIXELS = 0.5
+# set_extent pads lon/lat maps by 2% on each side; projected maps are framed exactly
+EXTENT_PADDING = 0.02
+
+
+def pixels_per_degree(bounds, width, height):
+    """
+    Output pixels per degree of latitude when bounds (west, south, east, north)
+    is framed in a width x height pixel axes, as set_extent does.
+    """
+    west, south, east, north = bounds
+    cos_lat = np.cos(np.radians((south + north) / 2))
+    span_x = max((east - west) * cos_lat, 1e-12) * (1 + 2 * EXTENT_PADDING)
+    span_y = max(north - south, 1e-12) * (1 + 2 * EXTENT_PADDING)
+    return min(width / span_x, height / span_y)
+
+
+def pixels_per_unit(scene, width, height):
+    """Output pixels per meter for a projected scene, per degree of latitude otherwise."""
+    if scene.crs is None:
+        return pixels_per_degree(scene.bounds, width, height)
+    xmin, ymin, xmax, ymax = scene.bounds
+    return min(width / max(xmax - xmin, 1e-12), height / max(ymax - ymin, 1e-12))
+
+
+def meters_per_pixel(scene, width, height):
+    px = pixels_per_unit(scene, width, height)
+    return 1 / px if scene.crs is not None else METERS_PER_DEGREE / px
+
+
+def _offsets(index, count):
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(index, minlength=count), out=offsets[1:])
+    return offsets
+
+
+def _ring_index(offsets):
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def simplify_lines(coords, offsets, tolerance, min_length, scale):
+    """
+    Douglas-Peucker each line to tolerance and drop lines shorter than min_length.
+
+    coords are multiplied by scale first, (cos(lat), 1) for lon/lat, so the
+    tolerance is the same ground distance in both directions.
+    """
+    if len(offsets) < 2:
+        return coords, offsets
+    lines = shapely.linestrings(coords * scale, indices=_ring_index(offsets))
+    lines = shapely.simplify(lines[shapely.length(lines) >= min_length], tolerance,
+                             preserve_topology=False)
+    coords, index = shapely.get_coordinates(lines, return_index=True)
+    return coords / scale, _offsets(index, len(lines))
+
+
+def simplify_rings(coords, offsets, tolerance, min_area, scale):
+    """
+    Drop rings smaller than min_area, then simplify the rest to tolerance.
+
+    Rings are culled on their own area, so a tiny building disappears and a
+    hole too small to see is filled in. Each ring keeps its winding.
+    """
+    if len(offsets) < 2:
+        return coords, offsets
+    rings = shapely.linearrings(coords * scale, indices=_ring_index(offsets))
+    rings = rings[shapely.area(shapely.polygons(rings)) >= min_area]
+    ccw = shapely.is_ccw(rings)
+    rings = shapely.simplify(rings, tolerance, preserve_topology=False)
+    coords, index = shapely.get_coordinates(rings, return_index=True)
+    offsets = _offsets(index, len(rings))
+    return orient_rings(coords / scale, offsets, ccw), offsets
+
+
+def apply_lod(scene, width, height):
+    """Return scene simplified for a map of width x height pixels."""
+    px = pixels_per_unit(scene, width, height)
+    if scene.crs is None:
+        west, south, east, north = scene.bounds
+        scale = np.array([np.cos(np.radians((south + north) / 2)), 1.0])
+    else:
+        scale = np.ones(2)
+    tolerance = SIMPLIFY_PIXELS / px
+    min_area = MIN_AREA_PIXELS / px ** 2
+
+    def polygons(layer):
+        return None if layer is None else simplify_rings(*layer, tolerance, min_area, scale)
+
+    return scene.replace(
+        streets=simplify_lines(*scene.streets, tolerance, MIN_LENGTH_PIXELS / px, scale),
+        water=polygons(scene.water),
+        buildings=polygons(scene.buildings),
+    )
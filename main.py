@@ -1,12 +1,18 @@
 
 import argparse
+import os
 import sys
 from pathlib import Path
+from geocoder import DEFAULT_GEOCODE_CACHE
+from roads import ROAD_LEVELS, STREET_LOADERS, STREET_SPACING_PX
 from styles import get_style, list_styles, load_custom_style
-from map_poster import create_map_poster
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        from server import main as serve
+        return serve(sys.argv[2:])
+
     parser = argparse.ArgumentParser(
         description='[+] Beautiful city map poster generator',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -17,6 +23,8 @@ Usage examples:
   %(prog)s --coords 55.7558 37.6173 --style watercolor
   %(prog)s --city "London" --style dark --output london_map.png --size 4000 3000
   %(prog)s --city "Tokyo" --format svg --output tokyo.svg
+  %(prog)s --city "Rome" --output rome.png --extra-output rome_web.jpg:1200x1600 --extra-output rome_thumb.webp:300x400
+  %(prog)s serve --port 8000 --workers 2
   
 Available styles: minimal, blueprint, watercolor, dark, vintage, neon
         """
@@ -35,13 +43,19 @@ Available styles: minimal, blueprint, watercolor, dark, vintage, neon
         metavar=('LAT', 'LON'),
         help='Coordinates: latitude and longitude (e.g., 55.7558 37.6173)'
     )
+    location_group.add_argument(
+        '--scene',
+        type=str,
+        metavar='PATH',
+        help='Render from a scene file saved with --save-scene instead of fetching map data'
+    )
 
     parser.add_argument(
         '--style',
         type=str,
         default='minimal',
-        choices=list_styles(),
-        help='Visual style (default: minimal)'
+        choices=list_styles() + ['all'],
+        help='Visual style, or "all" to render every built-in style from one download (default: minimal)'
     )
     parser.add_argument(
         '--custom-style',
@@ -78,12 +92,59 @@ Available styles: minimal, blueprint, watercolor, dark, vintage, neon
         default=5000,
         help='Map area radius in meters (default: 5000)'
     )
+    parser.add_argument(
+        '--roads',
+        choices=['auto', *ROAD_LEVELS],
+        default='auto',
+        help='Road classes to download, from motorway (motorways and trunks) to all (footpaths included); '
+             'auto picks them from the output scale and the street density of the area (default: auto)'
+    )
+    parser.add_argument(
+        '--street-spacing',
+        type=float,
+        default=STREET_SPACING_PX,
+        metavar='PX',
+        help=f'Average gap between streets, in output pixels, that --roads auto aims for (default: {STREET_SPACING_PX})'
+    )
+    parser.add_argument(
+        '--street-loader',
+        choices=STREET_LOADERS,
+        default='graph',
+        help='How streets are loaded: graph builds the simplified OSMnx street graph; ways reads OSM ways '
+             'straight into flat arrays, without networkx or simplification, using far less memory and time '
+             'on large areas (default: graph)'
+    )
     parser.add_argument(
         '--format',
         type=str,
         default='png',
-        choices=['png', 'svg'],
-        help='Output format: png or svg (default: png)'
+        choices=['png', 'svg', 'tiff', 'jpeg', 'webp'],
+        help='Output format: png, svg, tiff, jpeg or webp (default: png)'
+    )
+    parser.add_argument(
+        '--extra-output',
+        action='append',
+        default=[],
+        metavar='PATH[:WxH]',
+        help='Another file of the same poster, format from the extension (png, tif, jpg, webp, svg, svgz), '
+             'size defaulting to --size; repeatable. The largest output is rendered once and smaller '
+             'raster sizes are downsampled from it (e.g. --extra-output web.jpg:1200x1600)'
+    )
+    parser.add_argument(
+        '--batch',
+        type=str,
+        metavar='MANIFEST',
+        help='Render every job in a .yaml/.csv manifest; jobs sharing a location and radius fetch data once'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='Number of render processes for --batch (default: CPU count)'
+    )
+    parser.add_argument(
+        '--batch-report',
+        type=str,
+        help='Path of the per-job JSON report for --batch (default: <manifest>.report.json)'
     )
     parser.add_argument(
         '--list-styles',
@@ -100,6 +161,115 @@ Available styles: minimal, blueprint, watercolor, dark, vintage, neon
         action='store_true',
         help='Borderless mode: map fades to background at edges, text placed at bottom'
     )
+    parser.add_argument(
+        '--memory-budget',
+        type=int,
+        default=1024,
+        help='Approximate render memory limit in MB; larger posters are rendered in strips (default: 1024)'
+    )
+    parser.add_argument(
+        '--tiled',
+        action='store_true',
+        default=None,
+        help='Always render raster output in strips, regardless of size'
+    )
+    parser.add_argument(
+        '--encode-threads',
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help='Compression threads for strip-rendered PNG/TIFF output (default: up to 4)'
+    )
+    parser.add_argument(
+        '--no-lod',
+        dest='lod',
+        action='store_false',
+        help='Draw geometry at full OSM precision instead of simplifying it to the output resolution'
+    )
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const=True,
+        metavar='JSONL',
+        help='Print wall time, CPU time, memory and feature counts per stage; with a path, also append them there as JSON lines'
+    )
+    parser.add_argument(
+        '--osm-file',
+        type=str,
+        help='Local OpenStreetMap extract (.osm, .osm.bz2, .osm.pbf) to use instead of downloading data'
+    )
+    parser.add_argument(
+        '--save-scene',
+        type=str,
+        metavar='PATH',
+        help='Also save the fetched map as a compact scene file for fast re-renders with --scene'
+    )
+    parser.add_argument(
+        '--tile-cache',
+        type=str,
+        help='Directory for the persistent tile cache of parsed streets, buildings and water'
+    )
+    parser.add_argument(
+        '--tile-cache-size',
+        type=int,
+        default=2048,
+        help='Tile cache size limit in MB; least recently used tiles are evicted (default: 2048)'
+    )
+    parser.add_argument(
+        '--raster-cache',
+        type=str,
+        metavar='DIR',
+        help='Directory for cached map bodies: posters that differ only in title or subtitle are '
+             'composited onto the cached map instead of rendered again (PNG/TIFF)'
+    )
+    parser.add_argument(
+        '--raster-cache-size',
+        type=int,
+        default=4096,
+        help='Raster cache size limit in MB; least recently used bodies are evicted (default: 4096)'
+    )
+    parser.add_argument(
+        '--gazetteer',
+        type=str,
+        metavar='PATH',
+        help='CSV or SQLite file of place names with lat/lon, looked up before any online geocoding'
+    )
+    parser.add_argument(
+        '--geocode-cache',
+        type=str,
+        default=str(DEFAULT_GEOCODE_CACHE),
+        metavar='PATH',
+        help=f'SQLite file that keeps geocoding results between runs (default: {DEFAULT_GEOCODE_CACHE})'
+    )
+    parser.add_argument(
+        '--no-geocode-cache',
+        dest='geocode_cache',
+        action='store_const',
+        const=None,
+        help='Do not read or write the geocode cache'
+    )
+    parser.add_argument(
+        '--shard-size',
+        type=int,
+        metavar='METERS',
+        help='Split Overpass downloads into square queries of at most this side, fetched concurrently and '
+             'retried one by one (default: 10000, so radii over 5000 m are split)'
+    )
+    parser.add_argument(
+        '--fetch-workers',
+        type=int,
+        metavar='N',
+        help='Overpass queries (shards or tiles) in flight at once (default: 4)'
+    )
+    parser.add_argument(
+        '--overpass-url',
+        type=str,
+        help='Overpass API base URL, e.g. a local mirror or mock_osm.py (default: https://overpass-api.de/api)'
+    )
+    parser.add_argument(
+        '--nominatim-url',
+        type=str,
+        help='Nominatim base URL for geocoding (default: https://nominatim.openstreetmap.org/)'
+    )
     
     args = parser.parse_args()
     
@@ -111,23 +281,68 @@ Available styles: minimal, blueprint, watercolor, dark, vintage, neon
         print()
         return 0
 
-    if not args.city and not args.coords:
-        parser.error("Must specify --city or --coords")
+    if args.batch:
+        from batch import run_batch
+        from map_poster import configure_endpoints
+        configure_endpoints(args.overpass_url, args.nominatim_url)
+        results = run_batch(
+            args.batch,
+            workers=args.workers,
+            report_path=args.batch_report,
+            osm_file=args.osm_file,
+            tile_cache=args.tile_cache,
+            tile_cache_size=args.tile_cache_size * 1024 ** 2,
+            geocode_cache=args.geocode_cache,
+            gazetteer=args.gazetteer,
+            raster_cache=args.raster_cache,
+            raster_cache_size=args.raster_cache_size * 1024 ** 2,
+            shard_size=args.shard_size,
+            fetch_workers=args.fetch_workers,
+            loader=args.street_loader
+        )
+        return 0 if all(r['status'] == 'ok' for r in results) else 1
+
+    if not args.city and not args.coords and not args.scene:
+        parser.error("Must specify --city, --coords or --scene")
+    if args.scene and args.save_scene:
+        parser.error("--save-scene cannot be combined with --scene")
+    if args.style == 'all' and (args.custom_style or args.export_layers):
+        parser.error("--style all cannot be combined with --custom-style or --export-layers")
+    if args.raster_cache and (args.format not in ('png', 'tiff') or args.export_layers or args.style == 'all'
+                              or args.save_scene or args.extra_output):
+        parser.error("--raster-cache works for single PNG/TIFF posters, without --export-layers, --save-scene "
+                     "or --extra-output")
+    extra_outputs = []
+    if args.extra_output:
+        if args.style == 'all' or args.export_layers:
+            parser.error("--extra-output cannot be combined with --style all or --export-layers")
+        from variants import parse_output, plan_outputs
+        try:
+            extra_outputs = [parse_output(spec, tuple(args.size)) for spec in args.extra_output]
+            plan_outputs([(args.output, args.format, *args.size), *extra_outputs])
+        except ValueError as e:
+            parser.error(f"--extra-output: {e}")
 
     print("\n" + "="*60)
     print("[+]  MAP POSTER GENERATOR")
     print("="*60 + "\n")
     
-    style = get_style(args.style)
-    style_config = style.get_config()
-    if args.custom_style:
+    if args.style == 'all':
+        style_config = None
+    elif args.custom_style:
         style_config = load_custom_style(args.custom_style, base_style=args.style)
+    else:
+        style_config = get_style(args.style).get_config()
     
     print(f"📍 Location: ", end='')
     if args.city:
         print(f"{args.city}")
         location = args.city
         lat, lon = None, None
+    elif args.scene:
+        print(f"Scene file {args.scene}")
+        location = None
+        lat, lon = None, None
     else:
         print(f"Coordinates {args.coords[0]}, {args.coords[1]}")
         location = None
@@ -143,12 +358,64 @@ Available styles: minimal, blueprint, watercolor, dark, vintage, neon
         print(f"[+] Title: {args.title}")
     if args.subtitle:
         print(f"[+] Subtitle: {args.subtitle}")
+    if args.osm_file:
+        print(f"[+] Data source: {args.osm_file}")
+    if args.save_scene:
+        print(f"[+] Save scene: {args.save_scene}")
+    if args.gazetteer:
+        print(f"[+] Gazetteer: {args.gazetteer}")
+    if args.tile_cache:
+        print(f"[+] Tile cache: {args.tile_cache} (limit {args.tile_cache_size} MB)")
+    if args.raster_cache:
+        print(f"[+] Raster cache: {args.raster_cache} (limit {args.raster_cache_size} MB)")
     print(f"[+] Output file: {args.output}")
+    for path, output_format, width, height in extra_outputs:
+        print(f"[+] Extra output: {path} ({output_format}, {width}x{height})")
     if args.export_layers:
         print(f"[+] Export layers: {args.export_layers}")
     print()
+
+    # osmnx, geopandas and matplotlib take seconds to import; only pay for them when rendering
+    from map_poster import configure_endpoints, create_map_poster, create_style_variants
+    configure_endpoints(args.overpass_url, args.nominatim_url)
     
     try:
+        if args.style == 'all':
+            output_paths = create_style_variants(
+                location=location,
+                lat=lat,
+                lon=lon,
+                styles={name: get_style(name).get_config() for name in list_styles()},
+                radius=args.radius,
+                output_path=args.output,
+                width=args.size[0],
+                height=args.size[1],
+                title_text=args.title,
+                subtitle_text=args.subtitle,
+                output_format=args.format,
+                borderless=args.borderless,
+                osm_file=args.osm_file,
+                tile_cache=args.tile_cache,
+                tile_cache_size=args.tile_cache_size * 1024 ** 2,
+                geocode_cache=args.geocode_cache,
+                gazetteer=args.gazetteer,
+                memory_budget=args.memory_budget * 1024 ** 2,
+                tiled=args.tiled,
+                encode_threads=args.encode_threads,
+                lod=args.lod,
+                profile=args.profile,
+                scene_file=args.scene,
+                save_scene_file=args.save_scene,
+                roads=args.roads,
+                spacing=args.street_spacing,
+                shard_size=args.shard_size,
+                fetch_workers=args.fetch_workers,
+                loader=args.street_loader
+            )
+            print(f"\n[+] Success! {len(output_paths)} posters created in {Path(args.output).parent.absolute()}")
+            print("="*60 + "\n")
+            return 0
+
         output_path = create_map_poster(
             location=location,
             lat=lat,
@@ -162,7 +429,27 @@ Available styles: minimal, blueprint, watercolor, dark, vintage, neon
             subtitle_text=args.subtitle,
             export_layers=args.export_layers,
             output_format=args.format,
-            borderless=args.borderless
+            borderless=args.borderless,
+            osm_file=args.osm_file,
+            tile_cache=args.tile_cache,
+            tile_cache_size=args.tile_cache_size * 1024 ** 2,
+            geocode_cache=args.geocode_cache,
+            gazetteer=args.gazetteer,
+            memory_budget=args.memory_budget * 1024 ** 2,
+            tiled=args.tiled,
+            encode_threads=args.encode_threads,
+            lod=args.lod,
+            profile=args.profile,
+            scene_file=args.scene,
+            save_scene_file=args.save_scene,
+            roads=args.roads,
+            spacing=args.street_spacing,
+            raster_cache=args.raster_cache,
+            raster_cache_size=args.raster_cache_size * 1024 ** 2,
+            extra_outputs=extra_outputs,
+            shard_size=args.shard_size,
+            fetch_workers=args.fetch_workers,
+            loader=args.street_loader
         )
         
         print(f"\n[+] Success! Poster created: {Path(output_path).absolute()}")
@@ -1,14 +1,42 @@
-import osmnx as ox
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-from matplotlib.patches import Rectangle
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg, RendererAgg
+from matplotlib.colors import to_hex, to_rgb
+from matplotlib.font_manager import findfont, get_font
+from matplotlib.transforms import IdentityTransform, blended_transform_factory
+import math
 import numpy as np
+from PIL import Image
 from pathlib import Path
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
+from osm_file import OSMFileSource, highway_filter
+from renderers import draw_lines, draw_polygons, set_extent
+from scene import Scene, load_scene, prepare_scene, save_scene, select_layers
+from postprocess import blend_layer, composite, gradient_image, title_box
+from lod import apply_lod, meters_per_pixel
+from projection import clip_scene, project_scene, viewport
+from image_writers import StreamingPNGWriter, StreamingTIFFWriter
+from svg_writer import SVG_UNITS_PER_PIXEL, StreamingSVGWriter, path_data, quantize
+from variants import DownsampledOutput, finish_outputs, open_output, plan_outputs, save_image
+from profiler import NullProfiler, make_profiler
+from geocoder import GeocodeCache
+from raster_cache import align_rows
+from ways import way_density, ways_from_elements
+from roads import (MAX_DENSITY, PROBE_RADIUS, ROAD_LEVELS, STREET_SPACING_PX, choose_level, network_density,
+                   pixels_per_meter, street_spacing)
 
 warnings.filterwarnings('ignore')
-ox.config(log_console=False, use_cache=True)
+
+
+@lru_cache(maxsize=None)
+def _osmnx():
+    """Import and configure osmnx on first use; rendering a saved scene never needs it."""
+    import osmnx as ox
+    ox.config(log_console=False, use_cache=True)
+    return ox
 
 
 def print_progress(current, total, label=""):
@@ -21,59 +49,299 @@ def print_progress(current, total, label=""):
     print(f"[{bar}] {progress:.1f}% - {label}", end='\r')
 
 
+DPI = 300
+DEFAULT_SIZE = (3000, 4000)
+DEFAULT_MEMORY_BUDGET = 1024 ** 3
+# Agg canvas plus the copies savefig makes while encoding, per RGBA pixel
+RENDER_BYTES_PER_PIXEL = 4 * 4
+# Each exported layer keeps its own RGBA buffer
+LAYER_BYTES_PER_PIXEL = 4
+MIN_STRIP_ROWS = 16
+# Drawing order of the map layers; equal zorders keep the order they are added in
+LAYER_ZORDER = {'water': 1, 'buildings': 2, 'streets': 1}
+
+
+def _bytes_per_pixel(layers):
+    return RENDER_BYTES_PER_PIXEL + layers * LAYER_BYTES_PER_PIXEL
+
+
+def _inches(pixels):
+    # Agg truncates inches * dpi to whole pixels, so round the size up to land on them
+    inches = pixels / DPI
+    while inches * DPI < pixels:
+        inches = np.nextafter(inches, np.inf)
+    return inches
+
+
+def estimate_render_bytes(width, height, layers=0):
+    return width * height * _bytes_per_pixel(layers)
+
+
+def strip_rows(width, memory_budget, layers=0):
+    return max(MIN_STRIP_ROWS, memory_budget // (width * _bytes_per_pixel(layers)))
+
+
+def strip_overlap(*styles):
+    """
+    Rows a strip is rendered past each of its edges and cropped off again.
+    Agg cuts strokes just outside the canvas and caps them there, so the cut
+    must fall beyond the kept rows by more than the widest street's half width.
+    """
+    return math.ceil(max(style['street_width'] for style in styles) * DPI / 72) + 2
+
+
+def polygon_paint(style, layer):
+    """(color, alpha) of the water or buildings layer."""
+    if layer == 'water':
+        return style.get('water_color', '#a0c8ff'), style.get('water_alpha', 0.35)
+    return style.get('building_color', '#c7c7c7'), style.get('building_alpha', 0.5)
+
+
+def style_output_path(output_path, style_name):
+    path = Path(output_path)
+    return str(path.with_name(f"{path.stem}_{style_name}{path.suffix}"))
+
+
+def map_box(ax, width, top, band):
+    """The map axes after aspect adjustment as (left, top, right, bottom) full-poster pixels."""
+    ax.apply_aspect()
+    position = ax.get_position()
+    return (position.x0 * width, top + (1 - position.y1) * band,
+            position.x1 * width, top + (1 - position.y0) * band)
+
+
+def frame_scene(ax, scene):
+    """Set the axes limits and aspect to show the scene: projected scenes fill the axes exactly."""
+    if scene.crs is None:
+        set_extent(ax, scene.bounds)
+    else:
+        set_extent(ax, scene.bounds, padding=0, aspect=1)
+
+
+def _vertex_count(scene):
+    return sum(len(coords) for coords, _ in scene.layers().values())
+
+
+def scene_counts(scene):
+    """Street lines, polygon rings and vertices of a scene, for profiling."""
+    layers = scene.layers()
+    return {
+        'lines': len(scene.streets[1]) - 1,
+        'rings': sum(len(offsets) - 1 for name, (_, offsets) in layers.items() if name != 'streets'),
+        'vertices': _vertex_count(scene),
+    }
+
+
+class OverpassSource:
+    """Map data source backed by Nominatim and the Overpass API (via osmnx)."""
+
+    max_retries = 3
+
+    def geocode(self, query):
+        return _osmnx().geocode(query)
+
+    def graph_from_bbox(self, bbox, highway_classes=None, simplify=True, retain_all=False,
+                        truncate_by_edge=False, clean_periphery=None):
+        return _osmnx().graph_from_bbox(
+            bbox=bbox,
+            network_type='all',
+            simplify=simplify,
+            retain_all=retain_all,
+            truncate_by_edge=truncate_by_edge,
+            clean_periphery=clean_periphery,
+            custom_filter=highway_filter(highway_classes)
+        )
+
+    def ways_from_bbox(self, bbox, highway_classes=None):
+        from osmnx_compat import download_network
+
+        _osmnx()  # configured as for every other osmnx call
+        # The download of ox.graph_from_bbox without its graph building
+        responses = download_network(bbox, highway_filter(highway_classes))
+        return ways_from_elements((element for response in responses for element in response['elements']),
+                                  highway_classes)
+
+    def features_from_bbox(self, bbox, tags):
+        return _osmnx().features_from_bbox(bbox=bbox, tags=tags)
+
+
+class MapData:
+    """Everything fetched for one poster area, ready to hand to the renderer."""
+
+    def __init__(self, graph, place_name, center, radius, buildings=None, water=None, roads=None, ways=None):
+        # Streets as a simplified graph, or as StreetWays (graph None) with the ways loader
+        self.graph = graph
+        self.ways = ways
+        self.place_name = place_name
+        self.center = center
+        self.radius = radius
+        self.buildings = buildings
+        self.water = water
+        # The ROAD_LEVELS entry the streets were fetched at
+        self.roads = roads
+
+    def street_counts(self):
+        if self.graph is None:
+            return {'ways': len(self.ways), 'vertices': self.ways.vertices}
+        return {'nodes': len(self.graph.nodes), 'edges': len(self.graph.edges)}
+
+
 class MapPosterGenerator:
     
-    def __init__(self, style_config):
+    def __init__(self, style_config, source=None, profiler=None, loader='graph'):
         self.style = style_config
+        self.source = source or OverpassSource()
+        self.profiler = profiler or NullProfiler()
+        # One of roads.STREET_LOADERS
+        self.loader = loader
         
-    def fetch_map_data(self, location=None, lat=None, lon=None, radius=5000):
-        print(f"Loading map data...")
-        print_progress(0, 3, "Preparing coordinates")
-        if radius > 6000:
-            custom_filter = '["highway"~"motorway|trunk|primary|secondary"]'
-        else:
-            custom_filter = None
-        max_retries = 3
-        for attempt in range(max_retries):
+    def _retry(self, fn, *args, label="Request"):
+        attempts = self.source.max_retries
+        delay = 1
+        for attempt in range(attempts):
             try:
-                if location:
-                    print_progress(1, 3, "Geocoding")
-                    center_lat, center_lon = ox.geocode(location)
-                elif lat is not None and lon is not None:
-                    center_lat, center_lon = lat, lon
-                else:
-                    raise ValueError("Must specify either location or coordinates (lat, lon)")
-                
-                print_progress(2, 3, "Loading graph data")
-                graph = ox.graph_from_point(
-                    (center_lat, center_lon),
-                    dist=radius,
-                    network_type='all',
-                    simplify=True,
-                    custom_filter=custom_filter
-                )
-                
-                print_progress(3, 3, "Completed")
-                print()
-                
-                if location:
-                    place_name = location
-                else:
-                    place_name = f"{lat:.4f}°, {lon:.4f}°"
-                
-                print(f"✓ Data loaded: {len(graph.nodes)} nodes, {len(graph.edges)} edges")
-                return graph, place_name, (center_lat, center_lon)
-                
+                return fn(*args)
+            except ValueError:
+                # Unknown places and empty areas won't change on retry
+                raise
             except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"\n⚠️  Loading error (attempt {attempt + 1}/{max_retries}), retrying in 5 sec...")
-                    import time
-                    time.sleep(5)
-                else:
-                    print(f"\nData loading error: {e}")
+                if attempt == attempts - 1:
                     raise
+                print(f"\n⚠️  {label} failed (attempt {attempt + 1}/{attempts}): {e}; retrying in {delay} sec...")
+                time.sleep(delay)
+                delay *= 2
+
+    def resolve_center(self, location=None, lat=None, lon=None):
+        if location:
+            with self.profiler.stage('geocode'):
+                return self._retry(self.source.geocode, location, label="Geocoding")
+        if lat is not None and lon is not None:
+            return lat, lon
+        raise ValueError("Must specify either location or coordinates (lat, lon)")
+
+    def get_map_data(self, location=None, lat=None, lon=None, radius=5000, scene_file=None,
+                     save_scene_file=None, size=DEFAULT_SIZE, roads='auto', spacing=STREET_SPACING_PX):
+        """A saved scene when scene_file is given, otherwise freshly fetched data (saved if asked)."""
+        if scene_file:
+            return self.load_scene(scene_file)
+        data = self.fetch_map_data(location, lat, lon, radius, size, roads, spacing)
+        if save_scene_file:
+            self.save_scene(data, save_scene_file)
+        return data
+
+    def fetch_map_data(self, location=None, lat=None, lon=None, radius=5000, size=DEFAULT_SIZE, roads='auto',
+                       spacing=STREET_SPACING_PX):
+        """
+        Fetch streets, buildings and water around the location.
+
+        size is the (width, height) in pixels of the poster the data is for.
+        roads picks the ROAD_LEVELS entry to fetch; 'auto' chooses the most
+        detailed one that keeps streets about spacing pixels apart at that size.
+        """
+        with self.profiler.stage('fetch') as stage:
+            data = self._fetch_map_data(location, lat, lon, radius, size, roads, spacing)
+            stage.count(**data.street_counts())
+        return data
+
+    def choose_roads(self, center_lat, center_lon, radius, size, roads='auto', spacing=STREET_SPACING_PX):
+        """
+        The road level to fetch. For 'auto', the street length per km² of each
+        level is sampled around the center (usually the densest part of the
+        map, so the choice errs towards fewer roads) and compared with the
+        output scale. No sample is fetched when even the densest city would
+        leave spacing pixels between streets.
+        """
+        width, height = size
+        px_per_m = pixels_per_meter(radius, width, round(height * 0.93))
+        with self.profiler.stage('roads', parent='fetch') as stage:
+            stage.count(px_per_m=round(px_per_m, 4))
+            if roads != 'auto':
+                print(f"\n[+] Roads: {roads} (fixed)")
+                stage.count(level=roads)
+                return roads
+            if street_spacing(px_per_m, MAX_DENSITY) >= spacing:
+                print(f"\n[+] Roads: all, {1 / px_per_m:.1f} m/px is detailed enough for any street density")
+                stage.count(level='all')
+                return 'all'
+            probe = min(radius, PROBE_RADIUS)
+            bbox = _osmnx().utils_geo.bbox_from_point((center_lat, center_lon), dist=probe)
+            try:
+                if self.loader == 'ways':
+                    ways = self._retry(self.source.ways_from_bbox, bbox, label="Road density")
+                    densities = way_density(ways, bbox, (2 * probe) ** 2)
+                    probe_edges = len(ways)
+                else:
+                    graph = self._retry(self.source.graph_from_bbox, bbox, None, True, True, label="Road density")
+                    densities = network_density(graph, (2 * probe) ** 2)
+                    probe_edges = len(graph.edges)
+            except ValueError:
+                # No streets at all around the center
+                densities = [0.0] * len(ROAD_LEVELS)
+                probe_edges = 0
+            level = choose_level(px_per_m, densities, spacing)
+            density = densities[list(ROAD_LEVELS).index(level)]
+            print(f"\n[+] Roads: {level}, {density * 1000:.1f} km/km² near the center, "
+                  f"about {street_spacing(px_per_m, density):.0f} px between streets at {1 / px_per_m:.1f} m/px")
+            stage.count(level=level, probe_edges=probe_edges, km_per_km2=round(densities[-1] * 1000, 2),
+                        level_km_per_km2=round(density * 1000, 2))
+            return level
+
+    def _fetch_streets(self, bbox, highway_classes):
+        """The streets in bbox: a simplified graph, or StreetWays with the ways loader."""
+        with self.profiler.stage('streets', parent='fetch') as stage:
+            if self.loader == 'ways':
+                ways = self._retry(self.source.ways_from_bbox, bbox, highway_classes, label="Street network")
+                stage.count(ways=len(ways), vertices=ways.vertices)
+                return ways
+            graph = self._retry(self.source.graph_from_bbox, bbox, highway_classes, label="Street network")
+            stage.count(nodes=len(graph.nodes), edges=len(graph.edges))
+        return graph
+
+    def _fetch_map_data(self, location=None, lat=None, lon=None, radius=5000, size=DEFAULT_SIZE, roads='auto',
+                        spacing=STREET_SPACING_PX):
+        print(f"Loading map data...")
+        print_progress(0, 3, "Preparing coordinates")
+
+        try:
+            print_progress(1, 3, "Geocoding")
+            center_lat, center_lon = self.resolve_center(location, lat, lon)
+
+            print_progress(2, 3, "Loading streets, buildings and water")
+            bbox = _osmnx().utils_geo.bbox_from_point((center_lat, center_lon), dist=radius)
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                # Buildings and water do not depend on the road level; start them during the probe
+                layers_future = pool.submit(self.fetch_layers, center_lat, center_lon, radius, 'fetch')
+                roads = self.choose_roads(center_lat, center_lon, radius, size, roads, spacing)
+                streets_future = pool.submit(self._fetch_streets, bbox, ROAD_LEVELS[roads])
+                streets = streets_future.result()
+                buildings, water = layers_future.result()
+        except Exception as e:
+            print(f"\nData loading error: {e}")
+            raise
+
+        print_progress(3, 3, "Completed")
+        print()
+
+        if location:
+            place_name = location
+        else:
+            place_name = f"{lat:.4f}°, {lon:.4f}°"
+
+        if self.loader == 'ways':
+            data = MapData(None, place_name, (center_lat, center_lon), radius, buildings, water, roads, ways=streets)
+        else:
+            data = MapData(streets, place_name, (center_lat, center_lon), radius, buildings, water, roads)
+        print(f"✓ Data loaded: {', '.join(f'{v} {k}' for k, v in data.street_counts().items())}")
+        return data
     
-    def fetch_layers(self, center_lat, center_lon, radius):
+    def fetch_layers(self, center_lat, center_lon, radius, parent=None):
+        with self.profiler.stage('layers', parent) as stage:
+            buildings, water = self._fetch_layers(center_lat, center_lon, radius)
+            stage.count(buildings=0 if buildings is None else len(buildings),
+                        water=0 if water is None else len(water))
+        return buildings, water
+
+    def _fetch_layers(self, center_lat, center_lon, radius):
         if center_lat is None or center_lon is None:
             return None, None
         tags = {}
@@ -86,7 +354,8 @@ class MapPosterGenerator:
         if not tags:
             return None, None
         try:
-            gdf = ox.geometries_from_point((center_lat, center_lon), dist=radius, tags=tags)
+            bbox = _osmnx().utils_geo.bbox_from_point((center_lat, center_lon), dist=radius)
+            gdf = self._retry(self.source.features_from_bbox, bbox, tags, label="Buildings/water")
         except Exception as e:
             print(f"⚠️  Failed to load buildings/water layers: {e}")
             return None, None
@@ -99,113 +368,346 @@ class MapPosterGenerator:
             water = gdf[gdf[water_cols].notna().any(axis=1)].copy()
         return buildings, water
     
-    def create_poster(self, graph, place_name, output_path, figsize=(12, 16),
-                      center_lat=None, center_lon=None, radius=5000,
-                      title_text=None, subtitle_text=None, export_layers=None, output_format='png', borderless=False):
+    def load_scene(self, path):
+        with self.profiler.stage('load_scene') as stage:
+            scene = load_scene(path)
+            stage.count(**scene_counts(scene))
+        print(f"✓ Scene loaded: {path}")
+        return scene
+
+    def save_scene(self, data, path, **metadata):
+        """Save every layer fetched for data as a scene file that can be re-rendered in any style."""
+        with self.profiler.stage('save_scene') as stage:
+            scene = project_scene(prepare_scene(data, {'draw_water': True, 'draw_buildings': True}))
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            save_scene(scene, path, roads=data.roads, **metadata)
+            stage.count(**scene_counts(scene))
+        print(f"[+] Scene saved: {path}")
+
+    def _prepare(self, data, width, height, borderless, lod):
+        with self.profiler.stage('prepare') as stage:
+            if isinstance(data, Scene):
+                scene = select_layers(data, self.style)
+            else:
+                scene = prepare_scene(data, self.style)
+            stage.count(**scene_counts(scene))
+        map_height = height if borderless else round(height * 0.93)
+        if scene.center is not None and scene.radius:
+            before = _vertex_count(scene)
+            with self.profiler.stage('project') as stage:
+                if scene.crs is None:
+                    scene = project_scene(scene)
+                scene = clip_scene(scene, viewport(scene.radius, width, map_height))
+                stage.count(**scene_counts(scene))
+            print(f"\n[+] Viewport: {width}x{map_height} px in a local metric projection, "
+                  f"{before:,} -> {_vertex_count(scene):,} vertices")
+        if lod:
+            before = _vertex_count(scene)
+            with self.profiler.stage('lod') as stage:
+                scene = apply_lod(scene, width, map_height)
+                stage.count(**scene_counts(scene))
+            print(f"[+] Level of detail: {meters_per_pixel(scene, width, map_height):.1f} m/px, "
+                  f"{before:,} -> {_vertex_count(scene):,} vertices")
+        return scene
+
+    def map_layout(self, scene, width, height, borderless=False):
+        """(map box in poster pixels, xlim, ylim) of the map axes as build_figure lays them out."""
+        fig = Figure(figsize=(_inches(width), _inches(height)), dpi=DPI)
+        ax = fig.add_axes([0, 0, 1, 1 if borderless else 0.93])
+        frame_scene(ax, scene)
+        return map_box(ax, width, 0, height), ax.get_xlim(), ax.get_ylim()
+
+    def svg_paths(self, scene, width, height, borderless=False):
+        """{layer: path data strings} of the scene for _save_svg, lazily generated, in drawing order."""
+        box, xlim, ylim = self.map_layout(scene, width, height, borderless)
+        layers = scene.layers()
+        return {name: path_data(quantize(layers[name][0], box, xlim, ylim), layers[name][1],
+                                closed=name != 'streets')
+                for name in sorted(layers, key=LAYER_ZORDER.get)}
+
+    def _save_svg(self, scene, output_path, width, height, title_text, subtitle_text=None, borderless=False,
+                  paths=None):
+        """
+        Stream the poster to an SVG (gzipped for .svgz): one group per layer with
+        its style, geometry merged into long paths of integer relative
+        coordinates, the fades as one embedded image and the text as text.
+        Returns counts for the profiler.
+        """
+        style = self.style
+        box, _, _ = self.map_layout(scene, width, height, borderless)
+        paths = paths or self.svg_paths(scene, width, height, borderless)
+        with StreamingSVGWriter(output_path, width, height, dpi=DPI) as svg:
+            svg.rect(0, 0, width, height, fill=to_hex(style['bg_color']))
+            svg.clip_rect('map', box)
+            svg.begin_group(id='map', clip_path='url(#map)')
+            for name, layer_paths in paths.items():
+                if name == 'streets':
+                    svg.begin_group(id=name, fill='none', stroke=to_hex(style['street_color']),
+                                    stroke_width=f"{style['street_width'] * DPI / 72 * SVG_UNITS_PER_PIXEL:.4g}",
+                                    stroke_linecap='butt', stroke_linejoin='round')
+                elif style.get(f'draw_{name}'):
+                    color, alpha = polygon_paint(style, name)
+                    svg.begin_group(id=name, fill=to_hex(color), fill_opacity=alpha)
+                else:
+                    continue
+                for d in layer_paths:
+                    svg.path(d)
+                svg.end_group()
+            svg.end_group()
+
+            gradient = gradient_image(style, borderless, width, height, box)
+            if gradient is not None:
+                svg.image(np.round(gradient * 255).astype(np.uint8), 0, 0, width, height, id='fade')
+            title = title_box(style, borderless)
+            if title is not None:
+                color, alpha, top, bottom = title
+                svg.rect(0, top * height, width, (bottom - top) * height, id='title_box',
+                         fill=to_hex(color), fill_opacity=alpha)
+            self._svg_text(svg, width, height, title_text, subtitle_text, borderless)
+        return {'paths': svg.paths, 'mb': round(svg.bytes / 1024 ** 2, 2)}
+
+    def _svg_text(self, svg, width, height, title_text, subtitle_text, borderless):
+        """Write the title and subtitle where _add_text puts them, measured with the same fonts."""
+        fig = Figure(figsize=(_inches(width), _inches(height)), dpi=DPI)
+        self._add_text(fig, title_text, subtitle_text, borderless, height)
+        renderer = RendererAgg(1, 1, DPI)
+        for text in fig.texts:
+            font = text.get_fontproperties()
+            bbox = text.get_window_extent(renderer)
+            # Text bounding boxes reach below the baseline by the larger of the text's and "lp"'s descent
+            descent = max(renderer.get_text_width_height_descent(text.get_text(), font, ismath=False)[2],
+                          renderer.get_text_width_height_descent('lp', font, ismath=False)[2])
+            svg.text(text.get_text(), width / 2, height - bbox.y0 - descent, font.get_size_in_points() * DPI / 72,
+                     id=text.get_gid(), fill=to_hex(text.get_color()), text_anchor='middle',
+                     font_family=f"{get_font(findfont(font)).family_name}, sans-serif",
+                     font_weight='bold' if font.get_weight() == 'bold' else None)
+
+    def _save_image(self, rgba, output_path, output_format):
+        save_image(Image.fromarray(rgba[..., :3]), output_path, output_format, DPI)
+
+    def _save_outputs(self, rgba, outputs, width, height):
+        """
+        Save a width x height poster to every (path, format, width, height) raster
+        output: full-size ones here, smaller ones downsampled on threads alongside.
+        """
+        downsampled = []
+        for path, output_format, w, h in outputs:
+            if (w, h) != (width, height):
+                output = DownsampledOutput(path, output_format, (width, height), (w, h), DPI)
+                output.write_rows(rgba[..., :3])
+                output.finish()
+                downsampled.append(output)
+        for path, output_format, w, h in outputs:
+            if (w, h) == (width, height):
+                self._save_image(rgba, path, output_format)
+        for output in downsampled:
+            output.close()
+
+    def create_poster(self, data, output_path, figsize=(12, 16),
+                      title_text=None, subtitle_text=None, export_layers=None, output_format='png', borderless=False,
+                      memory_budget=DEFAULT_MEMORY_BUDGET, tiled=None, encode_threads=1, lod=True, variants=()):
+        """
+        Render the poster at figsize into output_path. variants are more
+        (path, format, width, height) outputs of the same poster, no larger and
+        of the same aspect ratio: rasters are downsampled from the one render.
+        """
+        with self.profiler.stage('poster') as stage:
+            stage.count(width=round(figsize[0] * DPI), height=round(figsize[1] * DPI))
+            self._create_poster(data, output_path, figsize, title_text, subtitle_text, export_layers,
+                                output_format, borderless, memory_budget, tiled, encode_threads, lod, variants)
+
+    def _create_poster(self, data, output_path, figsize, title_text, subtitle_text, export_layers, output_format,
+                       borderless, memory_budget, tiled, encode_threads, lod, variants=()):
         print(f"Creating poster...")
-        title_text = (title_text or place_name).upper()
+        print_progress(1, 3, "Preparing geometry")
+        width, height = round(figsize[0] * DPI), round(figsize[1] * DPI)
+        scene = self._prepare(data, width, height, borderless, lod)
+        title_text = (title_text or scene.place_name).upper()
         subtitle_text = subtitle_text or None
 
-        fig = plt.figure(figsize=figsize, facecolor=self.style['bg_color'])
+        output_format = output_format.lower()
+        if variants and export_layers:
+            raise ValueError("Extra outputs cannot be combined with layer export")
+        outputs = plan_outputs([(output_path, output_format, width, height), *variants])
+        if outputs[0][2:] != (width, height):
+            raise ValueError(f"Extra outputs must fit in the {width}x{height} poster")
+        rasters = [output for output in outputs if output[1] != 'svg']
+        layer_count = len(scene.layers()) if export_layers else 0
+        if tiled is None:
+            tiled = ((rasters or export_layers)
+                     and estimate_render_bytes(width, height, layer_count) > memory_budget)
+        rows = strip_rows(width, memory_budget, layer_count) if tiled else height
+
+        print_progress(2, 3, "Rendering")
+        if tiled:
+            print(f"\n[+] Tiled rendering: {width}x{height} px in strips of {rows} rows")
+        if export_layers:
+            # Raster posters are composited from the same per-layer buffers
+            with self.profiler.stage('export_layers') as stage:
+                stage.count(layers=layer_count, strips=-(-height // rows))
+                self._save_layered(scene, output_path, output_format, export_layers, width, height, rows,
+                                   title_text, subtitle_text, borderless, encode_threads)
+
+        for path, path_format, w, h in outputs:
+            if path_format == 'svg':
+                print_progress(3, 3, "Saving results")
+                # Paths are built and written in turn, so this covers both
+                with self.profiler.stage('render_save') as stage:
+                    stage.count(**self._save_svg(scene, path, w, h, title_text, subtitle_text, borderless))
+        # With layer export, the raster poster was written from the layer buffers
+        if rasters and not export_layers:
+            if tiled:
+                # Strips are rendered and encoded in turn, so this covers both
+                with self.profiler.stage('render_save') as stage:
+                    stage.count(strips=-(-height // rows), outputs=len(rasters))
+                    self._save_tiled(scene, rasters, width, height, rows, title_text, subtitle_text, borderless,
+                                     encode_threads)
+            else:
+                with self.profiler.stage('render'):
+                    rgba = self.render_band(scene, width, height, title_text, subtitle_text, borderless)
+                print_progress(3, 3, "Saving results")
+                with self.profiler.stage('save') as stage:
+                    stage.count(outputs=len(rasters))
+                    self._save_outputs(rgba, rasters, width, height)
         
-        if borderless:
-            ax = fig.add_axes([0, 0, 1, 1])
-        else:
-            ax = fig.add_axes([0, 0, 1, 0.93])
+        print()
+        for path, *_ in outputs:
+            print(f"[+] Poster saved: {path}")
+
+    def create_posters(self, data, outputs, figsize=(12, 16), title_text=None, subtitle_text=None,
+                       output_format='png', borderless=False, memory_budget=DEFAULT_MEMORY_BUDGET, tiled=None,
+                       encode_threads=1, lod=True):
+        """
+        Render the same map in several styles; outputs is a list of (style config, output path).
+
+        The scene and the matplotlib artists are built once (per strip when tiled)
+        and only repainted for each style. The scene is prepared with the current
+        style, so it must draw every layer that any of the styles draws.
+        """
+        with self.profiler.stage('posters') as stage:
+            stage.count(posters=len(outputs), width=round(figsize[0] * DPI), height=round(figsize[1] * DPI))
+            self._create_posters(data, outputs, figsize, title_text, subtitle_text, output_format, borderless,
+                                 memory_budget, tiled, encode_threads, lod)
+
+    def _create_posters(self, data, outputs, figsize, title_text, subtitle_text, output_format, borderless,
+                        memory_budget, tiled, encode_threads, lod):
+        print(f"Creating {len(outputs)} posters...")
+        width, height = round(figsize[0] * DPI), round(figsize[1] * DPI)
+        scene = self._prepare(data, width, height, borderless, lod)
+        title_text = (title_text or scene.place_name).upper()
+        subtitle_text = subtitle_text or None
+        output_format = output_format.lower()
+        base_style = self.style
+
+        # Each style's render and save alternate, so this covers both
+        with self.profiler.stage('render_save') as stage:
+            stage.count(posters=len(outputs))
+            if output_format == 'svg':
+                paths = {name: list(layer_paths)
+                         for name, layer_paths in self.svg_paths(scene, width, height, borderless).items()}
+                for index, (style, output_path) in enumerate(outputs, 1):
+                    self.style = style
+                    self._save_svg(scene, output_path, width, height, title_text, subtitle_text, borderless, paths)
+                    print_progress(index, len(outputs), f"Saved {output_path}")
+            else:
+                if tiled is None:
+                    tiled = estimate_render_bytes(width, height) > memory_budget
+                rows = strip_rows(width, memory_budget) if tiled else height
+                if tiled:
+                    print(f"\n[+] Tiled rendering: {width}x{height} px in strips of {rows} rows")
+                with ExitStack() as stack:
+                    writers = [stack.enter_context(open_output(output_path, output_format, width, height,
+                                                               (width, height), threads=encode_threads, dpi=DPI))
+                               for _, output_path in outputs] if tiled else None
+                    for top in range(0, height, rows):
+                        bottom = min(top + rows, height)
+                        start, end = self.overlap_rows(top, bottom, height, [style for style, _ in outputs])
+                        fig = self.build_figure(scene, width, height, title_text, subtitle_text, borderless,
+                                                rows=(start, end))
+                        for index, (style, output_path) in enumerate(outputs):
+                            self.style = style
+                            self.restyle(fig)
+                            rgba = self.rasterize(fig, width, height, borderless, start, end)
+                            rgba = rgba[top - start:bottom - start]
+                            if tiled:
+                                writers[index].write_rows(rgba[..., :3])
+                            else:
+                                self._save_image(rgba, output_path, output_format)
+                                print_progress(index + 1, len(outputs), f"Saved {output_path}")
+                        if tiled:
+                            print_progress(bottom, height, f"Rendering rows {top}-{bottom}")
+                    if tiled:
+                        finish_outputs(writers)
+        self.style = base_style
+
+        print()
+        for _, output_path in outputs:
+            print(f"[+] Poster saved: {output_path}")
+
+    def build_figure(self, scene, width, height, title_text, subtitle_text=None, borderless=False,
+                     rows=None):
+        """
+        Draw the poster on a new Agg figure of width x height pixels.
+
+        rows=(top, bottom) limits the figure to that band of pixel rows of the full
+        poster; everything is laid out in full-poster coordinates, so stacking the
+        bands reproduces the full render. The fades and title box are left out;
+        render_band blends them into the pixels afterwards. Without a title_text
+        the figure has no text at all.
+        """
+        top, bottom = rows or (0, height)
+        band = bottom - top
+
+        def fy(y):
+            return (y * height - (height - bottom)) / band
+
+        fig = Figure(figsize=(_inches(width), _inches(band)), dpi=DPI, facecolor=self.style['bg_color'])
+        FigureCanvasAgg(fig)
         
+        map_top = 1 if borderless else 0.93
+        ax = fig.add_axes([0, fy(0), 1, fy(map_top) - fy(0)])
         ax.set_facecolor(self.style['bg_color'])
         
-        print_progress(1, 5, "Loading layers")
-        buildings, water = self.fetch_layers(center_lat, center_lon, radius)
-        
-        layers = {}
+        if scene.water is not None:
+            draw_polygons(ax, *scene.water, *polygon_paint(self.style, 'water'),
+                          zorder=LAYER_ZORDER['water']).set_gid('water')
         
-        print_progress(2, 5, "Drawing water")
-        if water is not None and not water.empty and self.style.get('draw_water'):
-            water.plot(ax=ax,
-                       facecolor=self.style.get('water_color', '#a0c8ff'),
-                       edgecolor='none',
-                       alpha=self.style.get('water_alpha', 0.35),
-                       linewidth=0,
-                       markersize=0,
-                       zorder=1)
-            if export_layers:
-                layers['water'] = (water, self.style.get('water_color', '#a0c8ff'), 
-                                 self.style.get('water_alpha', 0.35), figsize)
+        if scene.buildings is not None:
+            draw_polygons(ax, *scene.buildings, *polygon_paint(self.style, 'buildings'),
+                          zorder=LAYER_ZORDER['buildings']).set_gid('buildings')
         
-        print_progress(3, 5, "Drawing buildings")
-        if buildings is not None and not buildings.empty and self.style.get('draw_buildings'):
-            buildings.plot(ax=ax,
-                           facecolor=self.style.get('building_color', '#c7c7c7'),
-                           edgecolor='none',
-                           alpha=self.style.get('building_alpha', 0.5),
-                           linewidth=0,
-                           markersize=0,
-                           zorder=2)
-            if export_layers:
-                layers['buildings'] = (buildings, self.style.get('building_color', '#c7c7c7'), 
-                                     self.style.get('building_alpha', 0.5), figsize)
-        
-        print_progress(4, 5, "Drawing streets")
-        ox.plot_graph(
-            graph,
-            ax=ax,
-            node_size=0,
-            edge_color=self.style['street_color'],
-            edge_linewidth=self.style['street_width'],
-            bgcolor=self.style['bg_color'],
-            show=False,
-            close=False
-        )
-        if export_layers:
-            layers['streets'] = (graph, self.style['street_color'], 
-                               self.style['street_width'], figsize)
+        draw_lines(ax, *scene.streets,
+                   self.style['street_color'], self.style['street_width'], zorder=LAYER_ZORDER['streets']).set_gid('streets')
+        frame_scene(ax, scene)
         
         ax.axis('off')
         ax.margins(0)
-        
+
+        if title_text:
+            self._add_text(fig, title_text, subtitle_text, borderless, height, height - bottom)
+
+        return fig
+
+    def _add_text(self, fig, title_text, subtitle_text, borderless, height, offset=0):
+        """
+        The title and subtitle of a poster height pixels tall, on a figure whose
+        bottom is offset rows above the poster's. Text is placed in pixels: a
+        whole-row offset then moves it exactly, so every band draws it alike.
+        """
+        transform = blended_transform_factory(fig.transFigure, IdentityTransform())
+
+        def fy(y):
+            return y * height - offset
+
         if borderless:
-            from matplotlib.patches import Rectangle
-            from matplotlib.colors import LinearSegmentedColormap
-            
-            fade_size = 0.24
-            bg_color = self.style['bg_color']
-            steps = 40
-            
-            for i in range(steps):
-                alpha = (i / steps) ** 1.8
-                rect = Rectangle((0, 1-fade_size + (i/steps)*fade_size), 1, fade_size/steps,
-                               transform=ax.transAxes, zorder=100,
-                               facecolor=bg_color, alpha=alpha, edgecolor='none')
-                ax.add_patch(rect)
-            
-            for i in range(steps):
-                alpha = ((steps - i) / steps) ** 1.8
-                rect = Rectangle((0, (i/steps)*fade_size), 1, fade_size/steps,
-                               transform=ax.transAxes, zorder=100,
-                               facecolor=bg_color, alpha=alpha, edgecolor='none')
-                ax.add_patch(rect)
-            
-            for i in range(steps):
-                alpha = ((steps - i) / steps) ** 1.8
-                rect = Rectangle(((i/steps)*fade_size, 0), fade_size/steps, 1,
-                               transform=ax.transAxes, zorder=100,
-                               facecolor=bg_color, alpha=alpha, edgecolor='none')
-                ax.add_patch(rect)
-            
-            for i in range(steps):
-                alpha = (i / steps) ** 1.8
-                rect = Rectangle((1-fade_size + (i/steps)*fade_size, 0), fade_size/steps, 1,
-                               transform=ax.transAxes, zorder=100,
-                               facecolor=bg_color, alpha=alpha, edgecolor='none')
-                ax.add_patch(rect)
-            
             fig.text(
-                0.5, 0.05,
+                0.5, fy(0.05),
                 title_text,
                 ha='center',
                 va='bottom',
                 fontsize=self.style['title_size'],
+                gid='title',
+                transform=transform,
                 color=self.style['title_color'],
                 fontweight='bold',
                 fontfamily='sans-serif',
@@ -214,22 +716,26 @@ class MapPosterGenerator:
             
             if subtitle_text:
                 fig.text(
-                    0.5, 0.02,
+                    0.5, fy(0.02),
                     subtitle_text,
                     ha='center',
                     va='bottom',
                     fontsize=self.style['subtitle_size'],
+                    gid='subtitle',
+                    transform=transform,
                     color=self.style['subtitle_color'],
                     fontfamily='sans-serif',
                     zorder=101
                 )
         else:
             fig.text(
-                0.5, 0.96,
+                0.5, fy(0.96),
                 title_text,
                 ha='center',
                 va='top',
                 fontsize=self.style['title_size'],
+                gid='title',
+                transform=transform,
                 color=self.style['title_color'],
                 fontweight='bold',
                 fontfamily='sans-serif'
@@ -237,140 +743,456 @@ class MapPosterGenerator:
 
             if subtitle_text:
                 fig.text(
-                    0.5, 0.92,
+                    0.5, fy(0.92),
                     subtitle_text,
                     ha='center',
                     va='top',
                     fontsize=self.style['subtitle_size'],
+                    gid='subtitle',
+                    transform=transform,
                     color=self.style['subtitle_color'],
                     fontfamily='sans-serif'
                 )
 
-        print_progress(5, 5, "Saving results")
-        
-        if output_format.lower() == 'svg':
-            fig.savefig(
-                output_path,
-                format='svg',
-                facecolor=self.style['bg_color'],
-                edgecolor='none'
-            )
-        else:
-            fig.savefig(
-                output_path,
-                dpi=300,
-                facecolor=self.style['bg_color'],
-                edgecolor='none'
-            )
-        plt.close(fig)
-        
-        print()
-        print(f"[+] Poster saved: {output_path}")
-        
-        if export_layers and layers:
-            self._export_layers(layers, export_layers, figsize, self.style)
+    def render_band(self, scene, width, height, title_text, subtitle_text=None, borderless=False, rows=None):
+        """
+        Render rows=(top, bottom) of the poster (default: all of it) to an RGBA array.
+
+        The map is drawn first, the fades and title box are blended in with NumPy,
+        and the text is drawn on top. A band is drawn with strip_overlap rows
+        of margin, so stacked bands match the single-pass render to within two
+        levels on streets that cross a band edge.
+        """
+        top, bottom = rows or (0, height)
+        start, end = self.overlap_rows(top, bottom, height)
+        fig = self.build_figure(scene, width, height, title_text, subtitle_text, borderless,
+                                rows=(start, end))
+        return self.rasterize(fig, width, height, borderless, start, end)[top - start:bottom - start]
+
+    def overlap_rows(self, top, bottom, height, styles=None):
+        """The rows to draw for band top..bottom: widened by strip_overlap of styles, within the poster."""
+        margin = strip_overlap(*(styles or [self.style]))
+        return max(0, top - margin), min(height, bottom + margin)
+
+    def rasterize(self, fig, width, height, borderless=False, top=0, bottom=None):
+        """Draw a build_figure figure covering rows top..bottom and post-process it."""
+        bottom = height if bottom is None else bottom
+        for text in fig.texts:
+            text.set_visible(False)
+        fig.canvas.draw()
+        rgba = np.asarray(fig.canvas.buffer_rgba())
+        box = map_box(fig.axes[0], width, top, bottom - top)
+        composite(rgba, self.style, borderless, height, box, top)
+        for text in fig.texts:
+            text.set_visible(True)
+            fig.draw_artist(text)
+        return rgba
+
+    def restyle(self, fig):
+        """
+        Repaint a figure from build_figure with the current style: colors, widths,
+        alphas, text and layer visibility change, the geometry is reused.
+        """
+        style = self.style
+        fig.patch.set_facecolor(style['bg_color'])
+        ax = fig.axes[0]
+        ax.set_facecolor(style['bg_color'])
+        for collection in ax.collections:
+            layer = collection.get_gid()
+            if layer == 'streets':
+                collection.set_color(style['street_color'])
+                collection.set_linewidth(style['street_width'])
+            else:
+                color, alpha = polygon_paint(style, layer)
+                collection.set_facecolor(color)
+                collection.set_alpha(alpha)
+                collection.set_visible(bool(style.get(f'draw_{layer}')))
+        for text in fig.texts:
+            kind = text.get_gid()
+            text.set_color(style[f'{kind}_color'])
+            text.set_fontsize(style[f'{kind}_size'])
+
+    def render_strips(self, scene, width, height, rows, title_text, subtitle_text=None, borderless=False):
+        """Yield (top_row, RGBA array) bands of the poster, one Agg canvas at a time."""
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            yield top, self.render_band(scene, width, height, title_text, subtitle_text, borderless,
+                                        rows=(top, bottom))
+            print_progress(bottom, height, f"Rendering rows {top}-{bottom}")
+
+    def _save_tiled(self, scene, outputs, width, height, rows, title_text, subtitle_text, borderless,
+                    encode_threads=1):
+        """Render in strips of rows into every (path, format, width, height) raster output."""
+        with ExitStack() as stack:
+            writers = [stack.enter_context(open_output(path, output_format, w, h, (width, height),
+                                                       threads=encode_threads, dpi=DPI))
+                       for path, output_format, w, h in outputs]
+            for _, strip in self.render_strips(scene, width, height, rows, title_text, subtitle_text, borderless):
+                for writer in writers:
+                    writer.write_rows(strip[..., :3])
+            finish_outputs(writers)
     
-    def _export_layers(self, layers, export_dir, figsize, style):
-        export_path = Path(export_dir)
-        export_path.mkdir(parents=True, exist_ok=True)
-        
-        print(f"\n[+] Exporting layers to {export_dir}")
-        
-        layer_count = len(layers)
-        for idx, (layer_name, layer_data) in enumerate(layers.items(), 1):
-            print_progress(idx, layer_count, f"Exporting layer: {layer_name}")
-            
-            data, color, alpha, size = layer_data
-            
-            fig = plt.figure(figsize=size, facecolor='none')
-            ax = fig.add_axes([0, 0, 1, 1])
-            ax.set_facecolor('none')
-            
-            try:
-                if layer_name == 'streets':
-                    ox.plot_graph(
-                        data,
-                        ax=ax,
-                        node_size=0,
-                        edge_color=color,
-                        edge_linewidth=alpha,
-                        bgcolor='none',
-                        show=False,
-                        close=False
-                    )
-                else:
-                    data.plot(ax=ax,
-                             facecolor=color,
-                             edgecolor='none',
-                             alpha=alpha,
-                             linewidth=0,
-                             markersize=0)
-            except Exception as e:
-                print(f"\n⚠️  Failed to export layer {layer_name}: {e}")
-                plt.close(fig)
-                continue
-            
-            ax.axis('off')
-            ax.margins(0)
-            
-            output_file = export_path / f"{layer_name}.png"
-            fig.savefig(
-                output_file,
-                dpi=300,
-                transparent=True,
-                bbox_inches='tight',
-                pad_inches=0
-            )
-            plt.close(fig)
-        
+    def render_layered_band(self, scene, width, height, title_text, subtitle_text=None, borderless=False,
+                            rows=None):
+        """
+        Render rows=(top, bottom) of the poster as one transparent RGBA buffer per
+        layer, and the poster composited from those buffers.
+
+        Returns (poster RGBA, {layer name: RGBA}) with layers in drawing order.
+        """
+        top, bottom = rows or (0, height)
+        start, end = self.overlap_rows(top, bottom, height)
+        fig = self.build_figure(scene, width, height, title_text, subtitle_text, borderless,
+                                rows=(start, end))
+        ax = fig.axes[0]
+        fig.patch.set_visible(False)
+        for text in fig.texts:
+            text.set_visible(False)
+        # Same stable zorder sort the axes uses when drawing
+        collections = sorted(ax.collections, key=lambda c: c.get_zorder())
+        layers = {}
+        for collection in collections:
+            for other in collections:
+                other.set_visible(other is collection)
+            fig.canvas.draw()
+            layers[collection.get_gid()] = np.asarray(fig.canvas.buffer_rgba()).copy()
+
+        rgba = np.asarray(fig.canvas.buffer_rgba())
+        rgba[..., :3] = np.round(np.array(to_rgb(self.style['bg_color'])) * 255).astype(np.uint8)
+        rgba[..., 3] = 255
+        for layer in layers.values():
+            blend_layer(rgba[..., :3], layer)
+        composite(rgba, self.style, borderless, height, map_box(ax, width, start, end - start), start)
+        for text in fig.texts:
+            text.set_visible(True)
+            fig.draw_artist(text)
+        kept = slice(top - start, bottom - start)
+        return rgba[kept], {name: layer[kept] for name, layer in layers.items()}
+
+    def _save_layered(self, scene, output_path, output_format, export_layers, width, height, rows,
+                      title_text, subtitle_text, borderless, encode_threads=1):
+        """
+        Render each layer once and write the poster (unless it is an SVG) and the
+        layers from the same buffers: layer PNGs in a directory, or one multi-page
+        TIFF when export_layers ends in .tif/.tiff.
+        """
+        names = sorted(scene.layers(), key=LAYER_ZORDER.get)
+        export_path = Path(export_layers)
+        print(f"\n[+] Exporting layers to {export_layers}")
+        with ExitStack() as stack:
+            poster = None
+            if output_format != 'svg':
+                poster = stack.enter_context(
+                    open_output(output_path, output_format, width, height, (width, height),
+                                threads=encode_threads, dpi=DPI))
+            if export_path.suffix.lower() in ('.tif', '.tiff'):
+                export_path.parent.mkdir(parents=True, exist_ok=True)
+                tiff = stack.enter_context(StreamingTIFFWriter(
+                    export_path, width, height, threads=encode_threads, dpi=DPI,
+                    pages=[('poster', 3)] + [(name, 4) for name in names]))
+
+                def write_layers(rgba, layers):
+                    tiff.write_rows(rgba[..., :3], page=0)
+                    for name, layer in layers.items():
+                        tiff.write_rows(layer, page=names.index(name) + 1)
+            else:
+                export_path.mkdir(parents=True, exist_ok=True)
+                writers = {name: stack.enter_context(StreamingPNGWriter(
+                    export_path / f"{name}.png", width, height, channels=4, threads=encode_threads, dpi=DPI))
+                    for name in names}
+
+                def write_layers(rgba, layers):
+                    for name, layer in layers.items():
+                        writers[name].write_rows(layer)
+
+            for top in range(0, height, rows):
+                bottom = min(top + rows, height)
+                rgba, layers = self.render_layered_band(scene, width, height, title_text, subtitle_text,
+                                                        borderless, rows=(top, bottom))
+                if poster is not None:
+                    poster.write_rows(rgba[..., :3])
+                write_layers(rgba, layers)
+                print_progress(bottom, height, f"Rendering layers, rows {top}-{bottom}")
+
         print()
         print(f"[+] Layers exported to {export_path.absolute()}")
-    
+
+    def render_body(self, data, body, borderless=False, memory_budget=DEFAULT_MEMORY_BUDGET, tiled=None, lod=True):
+        """Render the poster without its text into body, an RGB array of the poster size; returns the place name."""
+        height, width = body.shape[:2]
+        scene = self._prepare(data, width, height, borderless, lod)
+        if tiled is None:
+            tiled = estimate_render_bytes(width, height) > memory_budget
+        rows = strip_rows(width, memory_budget) if tiled else height
+        for top, strip in self.render_strips(scene, width, height, rows, None, borderless=borderless):
+            body[top:top + len(strip)] = strip[..., :3]
+        return scene.place_name
+
+    def text_rows(self, width, height, title_text, subtitle_text=None, borderless=False):
+        """The (top, bottom) pixel rows of the poster that the title and subtitle are drawn on."""
+        fig = Figure(figsize=(_inches(width), _inches(height)), dpi=DPI)
+        self._add_text(fig, title_text, subtitle_text, borderless, height)
+        # Text extents only need the font metrics, not a canvas of the poster size
+        renderer = RendererAgg(1, 1, DPI)
+        extents = [text.get_window_extent(renderer) for text in fig.texts]
+        # A little room for antialiasing
+        return (max(0, math.floor(height - max(e.y1 for e in extents)) - 2),
+                min(height, math.ceil(height - min(e.y0 for e in extents)) + 2))
+
+    def compose_poster(self, entry, output_path, output_format='png', title_text=None, subtitle_text=None,
+                       borderless=False, encode_threads=1):
+        """
+        Write a poster from a raster cache entry: the text is drawn onto the
+        cached body rows under it, the rest of the image is copied as encoded.
+        Returns the number of rows encoded.
+        """
+        width, height = entry.width, entry.height
+        title_text = (title_text or entry.place_name).upper()
+        subtitle_text = subtitle_text or None
+        top, bottom = align_rows(*self.text_rows(width, height, title_text, subtitle_text, borderless), height)
+        band = bottom - top
+        fig = Figure(figsize=(_inches(width), _inches(band)), dpi=DPI)
+        canvas = FigureCanvasAgg(fig)
+        self._add_text(fig, title_text, subtitle_text, borderless, height, height - bottom)
+        rgba = np.asarray(canvas.get_renderer().buffer_rgba())
+        rgba[..., :3] = entry.body[top:bottom]
+        rgba[..., 3] = 255
+        for text in fig.texts:
+            fig.draw_artist(text)
+        return entry.write(output_path, output_format.lower(), top, rgba[..., :3], encode_threads, DPI)
+
+    def cached_poster(self, raster_cache, key, load_data, output_path, figsize=(12, 16), title_text=None,
+                      subtitle_text=None, output_format='png', borderless=False,
+                      memory_budget=DEFAULT_MEMORY_BUDGET, tiled=None, encode_threads=1, lod=True):
+        """
+        Create a PNG or TIFF poster through raster_cache. The body stored under
+        key (see raster_cache.body_key) is reused, or rendered from load_data()
+        and stored first; then only the text is composited onto it.
+        """
+        width, height = round(figsize[0] * DPI), round(figsize[1] * DPI)
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        entry = raster_cache.get(key)
+        data = load_data() if entry is None else None
+        with self.profiler.stage('poster') as stage:
+            stage.count(width=width, height=height, cached=int(entry is not None))
+            if entry is None:
+                print("Rendering map body...")
+                with self.profiler.stage('body'):
+                    entry = raster_cache.build(key, width, height, lambda body: self.render_body(
+                        data, body, borderless, memory_budget, tiled, lod))
+                    entry.blocks(output_format.lower(), encode_threads)
+                print(f"\n[+] Map body cached: {width}x{height} px")
+            else:
+                print(f"[+] Raster cache hit: {entry.place_name}, {width}x{height} px")
+            with self.profiler.stage('compose') as stage:
+                stage.count(rows_encoded=self.compose_poster(entry, output_path, output_format, title_text,
+                                                             subtitle_text, borderless, encode_threads))
+        print(f"[+] Poster saved: {output_path}")
+        return output_path
+
     def generate(self, location=None, lat=None, lon=None, radius=5000, 
                  output_path='map_poster.png', figsize=(12, 16),
-                 title_text=None, subtitle_text=None, export_layers=None, output_format='png', borderless=False):
+                 title_text=None, subtitle_text=None, export_layers=None, output_format='png', borderless=False,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, tiled=None, encode_threads=1, lod=True,
+                 scene_file=None, save_scene_file=None, roads='auto', spacing=STREET_SPACING_PX, variants=()):
 
-        output_file = Path(output_path)
-        output_file.parent.mkdir(parents=True, exist_ok=True)
+        for path in [output_path, *(variant[0] for variant in variants)]:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
 
-        graph, place_name, (center_lat, center_lon) = self.fetch_map_data(location, lat, lon, radius)
+        size = (round(figsize[0] * DPI), round(figsize[1] * DPI))
+        data = self.get_map_data(location, lat, lon, radius, scene_file, save_scene_file, size, roads, spacing)
 
         self.create_poster(
-            graph,
-            place_name,
+            data,
             output_path,
             figsize,
-            center_lat,
-            center_lon,
-            radius,
             title_text,
             subtitle_text,
             export_layers,
             output_format,
-            borderless
+            borderless,
+            memory_budget,
+            tiled,
+            encode_threads,
+            lod,
+            variants
         )
         
         return output_path
 
 
+def configure_endpoints(overpass_url=None, nominatim_url=None):
+    """Point osmnx at other Overpass/Nominatim servers (e.g. a local mirror or mock_osm.py)."""
+    if overpass_url:
+        _osmnx().settings.overpass_url = overpass_url
+    if nominatim_url:
+        _osmnx().settings.nominatim_url = nominatim_url
+
+
+def make_source(osm_file=None, tile_cache=None, tile_cache_size=None, geocode_cache=None, gazetteer=None,
+                shard_size=None, fetch_workers=None):
+    """
+    The data source for the options; geocode_cache is a SQLite path for
+    persistent geocoding results. An OSM extract geocodes locally already,
+    so only the gazetteer is put in front of it. Overpass queries are split
+    into shards of at most shard_size meters, fetch_workers at a time.
+    """
+    if osm_file:
+        source = OSMFileSource(osm_file)
+    else:
+        from sharding import DEFAULT_SHARD_SIZE, DEFAULT_WORKERS, ShardedSource
+        fetch_workers = fetch_workers or DEFAULT_WORKERS
+        source = ShardedSource(OverpassSource(), shard_size or DEFAULT_SHARD_SIZE, fetch_workers)
+    if tile_cache:
+        from tile_cache import TileCache, DEFAULT_MAX_BYTES
+        source = TileCache(source, tile_cache, tile_cache_size or DEFAULT_MAX_BYTES, workers=fetch_workers or 1)
+    if osm_file:
+        geocode_cache = None
+    if geocode_cache or gazetteer:
+        source = GeocodeCache(source, geocode_cache, gazetteer)
+    return source
+
+
+def print_cache_stats(source, raster_cache=None):
+    if hasattr(source, 'geocode_stats'):
+        stats = source.geocode_stats()
+        local = stats['memory'] + stats['gazetteer'] + stats['cache']
+        if local + stats['lookups']:
+            print(f"[+] Geocoding: {stats['gazetteer']} from the gazetteer, {stats['cache'] + stats['memory']} "
+                  f"from the cache, {stats['lookups']} looked up")
+    if hasattr(source, 'stats'):
+        stats = source.stats()
+        print(f"[+] Tile cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['tiles']} tiles ({stats['bytes'] / 1024 ** 2:.1f} MB)")
+    inner = source
+    while inner is not None and not hasattr(inner, 'fetch_stats'):
+        inner = getattr(inner, 'source', None)
+    if inner is not None:
+        stats = inner.fetch_stats()
+        if stats['retries'] or stats['queries'] > 1:
+            print(f"[+] Overpass: {stats['queries']} queries, {stats['retries']} retried, {stats['empty']} empty, "
+                  f"{stats['duplicates']} duplicates across shard edges removed")
+    if raster_cache is not None:
+        stats = raster_cache.stats()
+        print(f"[+] Raster cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['entries']} bodies ({stats['bytes'] / 1024 ** 2:.1f} MB)")
+
+
 def create_map_poster(location=None, lat=None, lon=None, style_config=None,
                      radius=5000, output_path='map_poster.png', width=3000, height=4000,
-                     title_text=None, subtitle_text=None, export_layers=None, output_format='png', borderless=False):
+                     title_text=None, subtitle_text=None, export_layers=None, output_format='png', borderless=False,
+                     osm_file=None, tile_cache=None, tile_cache_size=None, geocode_cache=None, gazetteer=None,
+                     memory_budget=DEFAULT_MEMORY_BUDGET, tiled=None, encode_threads=1, lod=True, profile=None,
+                     scene_file=None, save_scene_file=None, roads='auto', spacing=STREET_SPACING_PX,
+                     raster_cache=None, raster_cache_size=None, extra_outputs=None, shard_size=None,
+                     fetch_workers=None, loader='graph'):
+    """
+    Create a poster. extra_outputs are more (path, format, width, height)
+    files of it, e.g. a web preview and a thumbnail: the largest output is
+    rendered and the other raster sizes are downsampled from it.
+    """
+    variants = []
+    if extra_outputs:
+        if raster_cache:
+            raise ValueError("Extra outputs cannot be combined with the raster cache")
+        (output_path, output_format, width, height), *variants = plan_outputs(
+            [(output_path, output_format, width, height), *extra_outputs])
+    figsize = (width / 300, height / 300)
+
+    source = make_source(osm_file, tile_cache, tile_cache_size, geocode_cache, gazetteer, shard_size, fetch_workers)
+    profiler = make_profiler(profile)
+    generator = MapPosterGenerator(style_config, source, profiler, loader)
+    if raster_cache:
+        from raster_cache import RasterCache, DEFAULT_MAX_BYTES, body_key
+        raster_cache = RasterCache(raster_cache, raster_cache_size or DEFAULT_MAX_BYTES)
+
+    try:
+        if raster_cache:
+            key = body_key(style_config, width, height, borderless, lod, location, lat, lon, radius, roads, spacing,
+                           osm_file, scene_file, loader)
+            result = generator.cached_poster(
+                raster_cache, key,
+                lambda: generator.get_map_data(location, lat, lon, radius, scene_file, save_scene_file,
+                                               (width, height), roads, spacing),
+                output_path, figsize, title_text, subtitle_text, output_format, borderless,
+                memory_budget, tiled, encode_threads, lod)
+        else:
+            result = generator.generate(
+                location=location,
+                lat=lat,
+                lon=lon,
+                radius=radius,
+                output_path=output_path,
+                figsize=figsize,
+                title_text=title_text,
+                subtitle_text=subtitle_text,
+                export_layers=export_layers,
+                output_format=output_format,
+                borderless=borderless,
+                memory_budget=memory_budget,
+                tiled=tiled,
+                encode_threads=encode_threads,
+                lod=lod,
+                scene_file=scene_file,
+                save_scene_file=save_scene_file,
+                roads=roads,
+                spacing=spacing,
+                variants=variants
+            )
+    finally:
+        profiler.finish(location=location or scene_file or [lat, lon], radius=radius, width=width, height=height,
+                        format=output_format, output=output_path)
 
+    print_cache_stats(source, raster_cache)
+
+    return result
+
+
+def create_style_variants(location=None, lat=None, lon=None, styles=None,
+                          radius=5000, output_path='map_poster.png', width=3000, height=4000,
+                          title_text=None, subtitle_text=None, output_format='png', borderless=False,
+                          osm_file=None, tile_cache=None, tile_cache_size=None, geocode_cache=None,
+                          gazetteer=None, memory_budget=DEFAULT_MEMORY_BUDGET, tiled=None, encode_threads=1, lod=True, profile=None,
+                          scene_file=None, save_scene_file=None, roads='auto', spacing=STREET_SPACING_PX,
+                          shard_size=None, fetch_workers=None, loader='graph'):
+    """
+    Render one poster per style in styles ({name: style config}) from a single
+    download and a single set of prepared artists. Output files are named
+    <stem>_<style><suffix> after output_path; their paths are returned.
+    """
     figsize = (width / 300, height / 300)
+    configs = list(styles.values())
+    # Fetch and prepare every layer that at least one style draws
+    fetch_style = dict(configs[0],
+                       draw_buildings=any(c.get('draw_buildings') for c in configs),
+                       draw_water=any(c.get('draw_water') for c in configs))
+
+    source = make_source(osm_file, tile_cache, tile_cache_size, geocode_cache, gazetteer, shard_size, fetch_workers)
+    profiler = make_profiler(profile)
+    generator = MapPosterGenerator(fetch_style, source, profiler, loader)
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    outputs = [(config, style_output_path(output_path, name)) for name, config in styles.items()]
+
+    try:
+        data = generator.get_map_data(location, lat, lon, radius, scene_file, save_scene_file, (width, height),
+                                      roads, spacing)
+        generator.create_posters(
+            data,
+            outputs,
+            figsize,
+            title_text,
+            subtitle_text,
+            output_format,
+            borderless,
+            memory_budget,
+            tiled,
+            encode_threads,
+            lod
+        )
+    finally:
+        profiler.finish(location=location or scene_file or [lat, lon], radius=radius, width=width, height=height,
+                        format=output_format, styles=list(styles))
+
+    print_cache_stats(source)
 
-    generator = MapPosterGenerator(style_config)
-
-    return generator.generate(
-        location=location,
-        lat=lat,
-        lon=lon,
-        radius=radius,
-        output_path=output_path,
-        figsize=figsize,
-        title_text=title_text,
-        subtitle_text=subtitle_text,
-        export_layers=export_layers,
-        output_format=output_format,
-        borderless=borderless
-    )
+    return [path for _, path in outputs]
@@ -0,0 +1,159 @@
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from osm_file import KIND_BUILDING, KIND_STREET, KIND_WATER, OSMFileSource
+
+POLY_RE = re.compile(r"poly:'([^']*)'")
+HIGHWAY_RE = re.compile(r'\["highway"~"([^"]*)"\]')
+FEATURE_KEY_RE = re.compile(r"\['(\w+)'")
+
+
+def query_bbox(query):
+    """(north, south, east, west) around every poly:'lat lon ...' filter in an Overpass query."""
+    values = [float(v) for coords in POLY_RE.findall(query) for v in coords.split()]
+    if not values:
+        raise ValueError("Query has no poly: filter")
+    lats, lons = values[0::2], values[1::2]
+    return max(lats), min(lats), max(lons), min(lons)
+
+
+def answer_overpass(source, query):
+    """
+    Answer the two kinds of Overpass query osmnx sends for this tool: a way
+    network query (optionally with a highway class regex) and a features query.
+    """
+    bbox = query_bbox(query)
+    if '(node[' not in query:
+        match = HIGHWAY_RE.search(query)
+        return source._elements(bbox, KIND_STREET, match.group(1).split('|') if match else None)
+    keys = set(FEATURE_KEY_RE.findall(query))
+    kind = 0
+    if 'building' in keys:
+        kind |= KIND_BUILDING
+    if keys & {'water', 'waterway', 'natural'}:
+        kind |= KIND_WATER
+    return source._elements(bbox, kind) if kind else {'elements': []}
+
+
+def bbox_area_km2(bbox):
+    north, south, east, west = bbox
+    return (north - south) * 111.32 * (east - west) * 111.32 * math.cos(math.radians((north + south) / 2))
+
+
+def answer_nominatim(source, query):
+    try:
+        lat, lon = source.geocode(query)
+    except ValueError:
+        return []
+    return [{'lat': str(lat), 'lon': str(lon), 'display_name': query, 'type': 'place'}]
+
+
+class MockOSMHandler(BaseHTTPRequestHandler):
+    """
+    Overpass (/interpreter, /status) and Nominatim (/search) endpoints over one OSM extract.
+
+    Overpass queries can be slowed down by latency seconds, and made to fail
+    like an overloaded server: at random with fail_rate, and always when they
+    cover more than max_area km².
+    """
+
+    source = None
+    latency = 0.0
+    fail_rate = 0.0
+    max_area = None
+    rng = random.Random()
+
+    def _overloaded(self, query):
+        if self.max_area is not None and bbox_area_km2(query_bbox(query)) > self.max_area:
+            return True
+        return self.rng.random() < self.fail_rate
+
+    def _send(self, status, body, content_type='application/json'):
+        data = body.encode('utf-8') if isinstance(body, str) else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _params(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if self.command == 'POST':
+            length = int(self.headers.get('Content-Length', 0))
+            params.update(parse_qs(self.rfile.read(length).decode('utf-8')))
+        return url.path.rstrip('/'), {k: v[0] for k, v in params.items()}
+
+    def _handle(self):
+        path, params = self._params()
+        try:
+            if path.endswith('/status'):
+                # Same shape as the real status page; osmnx reads the fifth line
+                self._send(200, "Connected as: 0\nCurrent time: {}\nAnnounced endpoint: none\n"
+                                "Rate limit: 0\n2 slots available now.\n".format(
+                                    time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())),
+                           'text/plain')
+            elif path.endswith('/interpreter'):
+                query = params.get('data', '')
+                time.sleep(self.latency)
+                if self._overloaded(query):
+                    # Not a 504: osmnx would wait a minute and resend that by itself
+                    self._send(503, "runtime error: Query timed out", 'text/plain')
+                else:
+                    self._send(200, answer_overpass(self.source, query))
+            elif path.endswith('/search'):
+                self._send(200, answer_nominatim(self.source, params.get('q', '')))
+            else:
+                self._send(404, {'error': f"Unknown endpoint {path}"})
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Offline stand-in for the Overpass and Nominatim APIs, answered from a local OSM extract')
+    parser.add_argument('osm_file', help='OSM extract (.osm, .osm.bz2 or .osm.pbf)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0, metavar='SECONDS',
+                        help='Delay before answering each Overpass query (default: 0)')
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='Fraction of Overpass queries answered with a 503 timeout error (default: 0)')
+    parser.add_argument('--max-area', type=float, metavar='KM2',
+                        help='Fail every Overpass query covering more than this area, like a query that times out')
+    parser.add_argument('--seed', type=int, help='Random seed for --fail-rate')
+    args = parser.parse_args(argv)
+
+    MockOSMHandler.source = OSMFileSource(args.osm_file)
+    MockOSMHandler.latency = args.latency
+    MockOSMHandler.fail_rate = args.fail_rate
+    MockOSMHandler.max_area = args.max_area
+    MockOSMHandler.rng = random.Random(args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), MockOSMHandler)
+    base = f"http://{args.host}:{server.server_address[1]}"
+    print(f"[+] Mock OSM server on {base}")
+    print(f"    --overpass-url {base}/api --nominatim-url {base}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
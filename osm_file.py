@@ -0,0 +1,355 @@
+import bz2
+import json
+import re
+import sqlite3
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+KIND_STREET = 1
+KIND_BUILDING = 2
+KIND_WATER = 4
+
+WATER_NATURAL = ('water', 'bay', 'harbour', 'coastline')
+EXCLUDED_HIGHWAYS = ('abandoned', 'construction', 'no', 'planned', 'platform',
+                     'proposed', 'raceway', 'razed')
+PLACE_RANKS = {'city': 5, 'town': 4, 'suburb': 3, 'village': 2, 'hamlet': 1}
+INDEX_VERSION = 1
+BATCH_SIZE = 100000
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE nodes (id INTEGER PRIMARY KEY, lat REAL, lon REAL);
+CREATE TABLE places (name TEXT, rank INTEGER, lat REAL, lon REAL);
+CREATE TABLE ways (id INTEGER PRIMARY KEY, kind INTEGER, tags TEXT);
+CREATE TABLE way_nodes (way_id INTEGER, seq INTEGER, node_id INTEGER,
+                        PRIMARY KEY (way_id, seq)) WITHOUT ROWID;
+CREATE TABLE relations (id INTEGER PRIMARY KEY, kind INTEGER, tags TEXT);
+CREATE TABLE relation_members (relation_id INTEGER, seq INTEGER, way_id INTEGER, role TEXT,
+                               PRIMARY KEY (relation_id, seq)) WITHOUT ROWID;
+CREATE VIRTUAL TABLE way_rtree USING rtree(id, min_lon, max_lon, min_lat, max_lat);
+CREATE VIRTUAL TABLE relation_rtree USING rtree(id, min_lon, max_lon, min_lat, max_lat);
+"""
+
+
+def classify_tags(tags):
+    kind = 0
+    if 'highway' in tags:
+        kind |= KIND_STREET
+    if 'building' in tags:
+        kind |= KIND_BUILDING
+    if 'water' in tags or 'waterway' in tags or tags.get('natural') in WATER_NATURAL:
+        kind |= KIND_WATER
+    return kind
+
+
+def is_drawable_street(tags, highway_classes=None):
+    highway = tags.get('highway')
+    if highway is None or highway in EXCLUDED_HIGHWAYS:
+        return False
+    if tags.get('area') == 'yes' or tags.get('service') == 'private':
+        return False
+    if tags.get('access') == 'private':
+        return False
+    if highway_classes and not re.search('|'.join(highway_classes), highway):
+        return False
+    return True
+
+
+def highway_filter(highway_classes):
+    if not highway_classes:
+        return None
+    return f'["highway"~"{"|".join(highway_classes)}"]'
+
+
+class _IndexWriter:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.nodes = []
+        self.places = []
+        self.ways = []
+        self.way_nodes = []
+        self.relations = []
+        self.members = []
+        self.count = 0
+
+    def add_node(self, node_id, lat, lon, tags):
+        self.nodes.append((node_id, lat, lon))
+        if tags and 'place' in tags:
+            rank = PLACE_RANKS.get(tags['place'], 0)
+            for key in ('name', 'name:en', 'int_name'):
+                if key in tags:
+                    self.places.append((tags[key].casefold(), rank, lat, lon))
+        self._tick()
+
+    def add_way(self, way_id, refs, tags):
+        kind = classify_tags(tags)
+        self.ways.append((way_id, kind, json.dumps(tags) if kind else None))
+        self.way_nodes.extend((way_id, seq, ref) for seq, ref in enumerate(refs))
+        self._tick()
+
+    def add_relation(self, relation_id, members, tags):
+        if tags.get('type') != 'multipolygon':
+            return
+        kind = classify_tags(tags) & (KIND_BUILDING | KIND_WATER)
+        if not kind:
+            return
+        self.relations.append((relation_id, kind, json.dumps(tags)))
+        self.members.extend((relation_id, seq, ref, role)
+                            for seq, (ref, role) in enumerate(members))
+        self._tick()
+
+    def _tick(self):
+        self.count += 1
+        if self.count % BATCH_SIZE == 0:
+            self.flush()
+
+    def flush(self):
+        c = self.conn
+        c.executemany("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?)", self.nodes)
+        c.executemany("INSERT INTO places VALUES (?, ?, ?, ?)", self.places)
+        c.executemany("INSERT OR REPLACE INTO ways VALUES (?, ?, ?)", self.ways)
+        c.executemany("INSERT OR REPLACE INTO way_nodes VALUES (?, ?, ?)", self.way_nodes)
+        c.executemany("INSERT OR REPLACE INTO relations VALUES (?, ?, ?)", self.relations)
+        c.executemany("INSERT OR REPLACE INTO relation_members VALUES (?, ?, ?, ?)", self.members)
+        for batch in (self.nodes, self.places, self.ways, self.way_nodes,
+                      self.relations, self.members):
+            batch.clear()
+
+
+def _parse_xml(path, writer):
+    opener = bz2.open if path.suffix == '.bz2' else open
+    with opener(path, 'rb') as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        tags = {}
+        refs = []
+        members = []
+        for event, elem in context:
+            if event == 'start':
+                continue
+            tag = elem.tag
+            if tag == 'tag':
+                tags[elem.get('k')] = elem.get('v')
+            elif tag == 'nd':
+                refs.append(int(elem.get('ref')))
+            elif tag == 'member':
+                if elem.get('type') == 'way':
+                    members.append((int(elem.get('ref')), elem.get('role', '')))
+            elif tag in ('node', 'way', 'relation'):
+                element_id = int(elem.get('id'))
+                if tag == 'node':
+                    writer.add_node(element_id, float(elem.get('lat')), float(elem.get('lon')), tags)
+                elif tag == 'way':
+                    writer.add_way(element_id, refs, tags)
+                else:
+                    writer.add_relation(element_id, members, tags)
+                tags = {}
+                refs = []
+                members = []
+                root.clear()
+
+
+def _parse_pbf(path, writer):
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError("Reading .osm.pbf files requires pyosmium: pip install osmium")
+
+    class Handler(osmium.SimpleHandler):
+
+        def node(self, n):
+            tags = {t.k: t.v for t in n.tags} if 'place' in n.tags else None
+            writer.add_node(n.id, n.location.lat, n.location.lon, tags)
+
+        def way(self, w):
+            writer.add_way(w.id, [n.ref for n in w.nodes], {t.k: t.v for t in w.tags})
+
+        def relation(self, r):
+            members = [(m.ref, m.role) for m in r.members if m.type == 'w']
+            writer.add_relation(r.id, members, {t.k: t.v for t in r.tags})
+
+    Handler().apply_file(str(path))
+
+
+def build_index(path, index_path):
+    path = Path(path)
+    index_path = Path(index_path)
+    tmp_path = index_path.with_name(index_path.name + '.tmp')
+    tmp_path.unlink(missing_ok=True)
+
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(SCHEMA)
+
+    writer = _IndexWriter(conn)
+    if path.name.endswith('.pbf'):
+        _parse_pbf(path, writer)
+    else:
+        _parse_xml(path, writer)
+    writer.flush()
+
+    # Member ways of kept relations are usually untagged, so every way is stored
+    # while streaming and the ones nothing refers to are dropped here.
+    conn.executescript("""
+        CREATE INDEX relation_members_way ON relation_members (way_id);
+        DELETE FROM ways WHERE kind = 0
+            AND id NOT IN (SELECT way_id FROM relation_members);
+        DELETE FROM way_nodes WHERE way_id NOT IN (SELECT id FROM ways);
+        INSERT INTO way_rtree
+            SELECT wn.way_id, min(n.lon), max(n.lon), min(n.lat), max(n.lat)
+            FROM way_nodes wn JOIN nodes n ON n.id = wn.node_id
+            GROUP BY wn.way_id;
+        INSERT INTO relation_rtree
+            SELECT m.relation_id, min(r.min_lon), max(r.max_lon), min(r.min_lat), max(r.max_lat)
+            FROM relation_members m JOIN way_rtree r ON r.id = m.way_id
+            GROUP BY m.relation_id;
+        CREATE INDEX places_name ON places (name);
+    """)
+    stat = path.stat()
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+        ('version', str(INDEX_VERSION)),
+        ('source_size', str(stat.st_size)),
+        ('source_mtime', str(stat.st_mtime_ns)),
+    ])
+    conn.commit()
+    conn.close()
+    tmp_path.replace(index_path)
+
+
+class OSMFileSource:
+    """
+    Map data source backed by a local OpenStreetMap extract (.osm, .osm.bz2, .osm.pbf).
+
+    The extract is streamed once into an SQLite index with an R-tree over way and
+    relation bounding boxes, stored next to the file as <name>.idx.sqlite. Later
+    runs only read the rows that intersect the requested area.
+    """
+
+    max_retries = 1
+
+    def __init__(self, path, index_path=None):
+        self.path = Path(path)
+        if not self.path.exists():
+            raise FileNotFoundError(f"OSM file not found: {self.path}")
+        self.index_path = Path(index_path) if index_path else self.path.with_name(self.path.name + '.idx.sqlite')
+        if not self._index_is_fresh():
+            print(f"[+] Indexing {self.path.name} (one-time, may take a while)...")
+            build_index(self.path, self.index_path)
+
+    def _index_is_fresh(self):
+        if not self.index_path.exists():
+            return False
+        try:
+            conn = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True)
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+            conn.close()
+        except sqlite3.DatabaseError:
+            return False
+        stat = self.path.stat()
+        return (meta.get('version') == str(INDEX_VERSION)
+                and meta.get('source_size') == str(stat.st_size)
+                and meta.get('source_mtime') == str(stat.st_mtime_ns))
+
+    def _connect(self):
+        return sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True)
+
+    def geocode(self, query):
+        name = query.split(',')[0].strip().casefold()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT lat, lon FROM places WHERE name = ? ORDER BY rank DESC LIMIT 1", (name,)
+        ).fetchone()
+        conn.close()
+        if row is None:
+            raise ValueError(f"Place '{query}' not found in {self.path.name}; use --coords instead")
+        return row
+
+    def _elements(self, bbox, kind, highway_classes=None):
+        north, south, east, west = bbox
+        conn = self._connect()
+        conn.execute("CREATE TEMP TABLE picked_ways (id INTEGER PRIMARY KEY)")
+
+        rows = conn.execute("""
+            SELECT w.id, w.tags FROM way_rtree r JOIN ways w ON w.id = r.id
+            WHERE r.min_lon <= ? AND r.max_lon >= ? AND r.min_lat <= ? AND r.max_lat >= ?
+              AND (w.kind & ?) != 0
+        """, (east, west, north, south, kind))
+        ways = {}
+        for way_id, tags in rows:
+            tags = json.loads(tags)
+            if kind == KIND_STREET and not is_drawable_street(tags, highway_classes):
+                continue
+            ways[way_id] = tags
+
+        relations = []
+        if kind != KIND_STREET:
+            rows = conn.execute("""
+                SELECT rel.id, rel.tags FROM relation_rtree r JOIN relations rel ON rel.id = r.id
+                WHERE r.min_lon <= ? AND r.max_lon >= ? AND r.min_lat <= ? AND r.max_lat >= ?
+                  AND (rel.kind & ?) != 0
+            """, (east, west, north, south, kind))
+            for relation_id, tags in rows:
+                members = conn.execute(
+                    "SELECT way_id, role FROM relation_members WHERE relation_id = ? ORDER BY seq",
+                    (relation_id,)
+                ).fetchall()
+                relations.append({
+                    'type': 'relation',
+                    'id': relation_id,
+                    'members': [{'type': 'way', 'ref': ref, 'role': role} for ref, role in members],
+                    'tags': json.loads(tags),
+                })
+                for ref, _ in members:
+                    ways.setdefault(ref, {})
+
+        conn.executemany("INSERT OR IGNORE INTO picked_ways VALUES (?)", ((i,) for i in ways))
+        refs = {}
+        nodes = {}
+        rows = conn.execute("""
+            SELECT wn.way_id, wn.node_id, n.lat, n.lon
+            FROM picked_ways p
+            JOIN way_nodes wn ON wn.way_id = p.id
+            JOIN nodes n ON n.id = wn.node_id
+            ORDER BY wn.way_id, wn.seq
+        """)
+        for way_id, node_id, lat, lon in rows:
+            refs.setdefault(way_id, []).append(node_id)
+            nodes[node_id] = (lat, lon)
+        conn.close()
+
+        elements = [{'type': 'node', 'id': i, 'lat': lat, 'lon': lon}
+                    for i, (lat, lon) in nodes.items()]
+        elements.extend({'type': 'way', 'id': i, 'nodes': refs[i], 'tags': tags}
+                        for i, tags in ways.items() if i in refs)
+        elements.extend(relations)
+        return {'elements': elements}
+
+    def graph_from_bbox(self, bbox, highway_classes=None, simplify=True, retain_all=False,
+                        truncate_by_edge=False):
+        import osmnx as ox
+        from osmnx_compat import graph_from_response
+
+        # Same pipeline as ox.graph_from_bbox, minus the Overpass download
+        graph = graph_from_response(self._elements(bbox, KIND_STREET, highway_classes))
+        graph = ox.truncate.truncate_graph_bbox(graph, bbox=bbox, retain_all=retain_all,
+                                                truncate_by_edge=truncate_by_edge)
+        if simplify:
+            graph = ox.simplify_graph(graph)
+        return graph
+
+    def ways_from_bbox(self, bbox, highway_classes=None):
+        from ways import ways_from_elements
+
+        return ways_from_elements(self._elements(bbox, KIND_STREET, highway_classes)['elements'], highway_classes)
+
+    def features_from_bbox(self, bbox, tags):
+        from osmnx_compat import features_from_response
+
+        kind = 0
+        if 'building' in tags:
+            kind |= KIND_BUILDING
+        if 'water' in tags or 'waterway' in tags or 'natural' in tags:
+            kind |= KIND_WATER
+        return features_from_response(self._elements(bbox, kind), bbox, tags)
@@ -0,0 +1,48 @@
+"""
+The osmnx internals this tool relies on, in one place.
+
+osmnx 1.9 has no public way to download a street network without building
+its graph, to build a graph or GeoDataFrame from Overpass JSON already in
+hand, or to import its exception classes. The functions below call its
+private modules instead, so they are only used with the osmnx minor version
+pinned in requirements.txt; benchmarks/osmnx_compat.py checks them against
+the public osmnx functions.
+"""
+from functools import lru_cache
+
+try:
+    from osmnx.errors import InsufficientResponseError, ResponseStatusCodeError
+except ImportError:
+    # osmnx 1.9 only defines them in a private module; both subclass ValueError
+    from osmnx._errors import InsufficientResponseError, ResponseStatusCodeError
+
+SUPPORTED_OSMNX = (1, 9)
+
+
+@lru_cache(maxsize=None)
+def _private_osmnx():
+    """osmnx, once its version is known to have the private functions used here."""
+    import osmnx as ox
+
+    version = tuple(int(part) for part in ox.__version__.split('.')[:2])
+    if version != SUPPORTED_OSMNX:
+        raise ImportError(f"osmnx {ox.__version__} is not supported: install osmnx "
+                          f"{'.'.join(map(str, SUPPORTED_OSMNX))}.x as pinned in requirements.txt")
+    return ox
+
+
+def download_network(bbox, custom_filter=None):
+    """The Overpass JSON responses ox.graph_from_bbox(bbox, network_type='all') downloads, without its graph."""
+    ox = _private_osmnx()
+    return ox._overpass._download_overpass_network(ox.utils_geo.bbox_to_poly(bbox=bbox), 'all', custom_filter)
+
+
+def graph_from_response(response):
+    """The unsimplified, untruncated street graph ox.graph_from_bbox builds from an Overpass JSON response."""
+    return _private_osmnx().graph._create_graph([response], retain_all=True)
+
+
+def features_from_response(response, bbox, tags):
+    """The GeoDataFrame ox.features_from_bbox builds from an Overpass JSON response."""
+    ox = _private_osmnx()
+    return ox.features._create_gdf([response], ox.utils_geo.bbox_to_poly(bbox=bbox), tags)
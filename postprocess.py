@@ -0,0 +1,116 @@
+import numpy as np
+from matplotlib.colors import to_rgb
+
+# Rows blended at a time, so the float temporaries stay small on wide posters
+COMPOSITE_CHUNK_ROWS = 256
+# Long side of the gradient image that stands in for the masks in SVG output
+GRADIENT_SIZE = 512
+
+
+def fade_alpha(x, y, box, size, curve):
+    """
+    Edge fade of the map box (left, top, right, bottom) towards the background.
+
+    At a distance d from an edge, measured as a fraction of the box width or
+    height, the opacity is (1 - d / size) ** curve; the four edges combine like
+    stacked translucent layers and everything outside the box is covered.
+    """
+    left, top, right, bottom = box
+
+    def keep(t):
+        edge = np.minimum(t, 1 - t)
+        return 1 - np.clip(1 - edge / size, 0, 1) ** curve
+
+    return 1 - keep((y - top) / (bottom - top))[:, None] * keep((x - left) / (right - left))[None, :]
+
+
+def vignette_alpha(x, y, width, height, strength):
+    """Radial darkening that starts halfway to the corners and reaches strength there."""
+    r2 = ((2 * x / width - 1) ** 2)[None, :] + ((2 * y / height - 1) ** 2)[:, None]
+    return strength * np.clip(np.sqrt(r2 / 2) * 2 - 1, 0, 1) ** 2
+
+
+def edge_overlays(style, borderless, width, height, map_box):
+    """
+    Smooth overlays as (rgb, alpha(x, y)) in the order they are applied; x and y
+    are pixel-center coordinates of the full poster.
+    """
+    overlays = []
+    if style.get('vignette'):
+        overlays.append((to_rgb(style.get('vignette_color', '#000000')),
+                         lambda x, y: vignette_alpha(x, y, width, height, style['vignette'])))
+    if borderless and style.get('fade_size', 0.24) > 0:
+        overlays.append((to_rgb(style['bg_color']),
+                         lambda x, y: fade_alpha(x, y, map_box, style.get('fade_size', 0.24),
+                                                 style.get('fade_curve', 1.8))))
+    return overlays
+
+
+def title_box(style, borderless):
+    """The title box as (rgb, alpha, top, bottom) in fractions of the height from the top, or None."""
+    if not style.get('title_box'):
+        return None
+    box_height = style.get('title_box_height', 0.12)
+    top, bottom = (1 - box_height, 1) if borderless else (0, box_height)
+    return to_rgb(style.get('title_box_color', '#000000')), style.get('title_box_alpha', 0.22), top, bottom
+
+
+def composite(rgba, style, borderless, height, map_box, top=0):
+    """
+    Blend the overlays into an Agg RGBA buffer in place.
+
+    rgba holds rows top..top + len(rgba) of a poster that is height rows tall and
+    map_box is in full-poster pixels, so strips can be processed independently.
+    """
+    rows, width = rgba.shape[:2]
+    x = np.arange(width, dtype=np.float32) + 0.5
+    box = title_box(style, borderless)
+    layers = edge_overlays(style, borderless, width, height, map_box)
+    for start in range(0, rows, COMPOSITE_CHUNK_ROWS):
+        stop = min(start + COMPOSITE_CHUNK_ROWS, rows)
+        y = np.arange(top + start, top + stop, dtype=np.float32) + 0.5
+        chunk = rgba[start:stop, :, :3]
+        masks = [(rgb, alpha(x, y)) for rgb, alpha in layers]
+        if box is not None:
+            rgb, alpha, box_top, box_bottom = box
+            inside = (y >= box_top * height) & (y < box_bottom * height)
+            masks.append((rgb, np.where(inside, np.float32(alpha), np.float32(0))[:, None]))
+        for rgb, alpha in masks:
+            for channel in range(3):
+                blended = chunk[..., channel] * (1 - alpha) + (rgb[channel] * 255) * alpha
+                chunk[..., channel] = np.rint(blended)
+    return rgba
+
+
+def blend_layer(rgb, layer):
+    """Blend a straight-alpha RGBA layer over an opaque RGB buffer in place."""
+    for start in range(0, len(rgb), COMPOSITE_CHUNK_ROWS):
+        chunk = rgb[start:start + COMPOSITE_CHUNK_ROWS]
+        source = layer[start:start + COMPOSITE_CHUNK_ROWS]
+        alpha = source[..., 3] * np.float32(1 / 255)
+        for channel in range(3):
+            blended = chunk[..., channel] * (1 - alpha) + source[..., channel] * alpha
+            chunk[..., channel] = np.rint(blended)
+    return rgb
+
+
+def gradient_image(style, borderless, width, height, map_box):
+    """
+    The smooth overlays flattened into one straight-alpha RGBA image covering
+    the poster, for vector output; None when there is nothing to draw.
+    """
+    layers = edge_overlays(style, borderless, width, height, map_box)
+    if not layers:
+        return None
+    scale = GRADIENT_SIZE / max(width, height)
+    w, h = max(round(width * scale), 2), max(round(height * scale), 2)
+    x = (np.arange(w, dtype=np.float32) + 0.5) * width / w
+    y = (np.arange(h, dtype=np.float32) + 0.5) * height / h
+    color = np.zeros((h, w, 3), dtype=np.float32)
+    alpha = np.zeros((h, w), dtype=np.float32)
+    for rgb, layer_alpha in layers:
+        a = np.broadcast_to(layer_alpha(x, y), (h, w))
+        color = color * (alpha * (1 - a))[..., None] + np.asarray(rgb, dtype=np.float32) * a[..., None]
+        alpha = a + alpha * (1 - a)
+        color /= np.maximum(alpha, 1e-6)[..., None]
+    return np.dstack([color, alpha])
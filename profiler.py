@@ -0,0 +1,183 @@
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss():
+    """Resident set size in bytes, or None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss():
+    """Highest resident set size of the process so far in bytes, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _mb(value):
+    return None if value is None else round(value / 1024 ** 2, 1)
+
+
+class _Stage:
+    def __init__(self, profiler, name, parent):
+        self.profiler = profiler
+        self.name = name
+        self.parent = parent
+        self.counts = {}
+
+    def count(self, **counts):
+        """Attach feature counts (nodes, edges, polygons, vertices, ...) to the stage."""
+        self.counts.update(counts)
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        if self.parent is None and stack:
+            self.parent = stack[-1].name
+        stack.append(self)
+        self.order = self.profiler._next_order()
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.rss_started = current_rss()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.started
+        cpu = time.process_time() - self.cpu_started
+        rss = current_rss()
+        self.profiler._stack().pop()
+        record = {
+            'stage': self.name,
+            'parent': self.parent,
+            'start': round(self.started - self.profiler.started, 4),
+            'wall': round(wall, 4),
+            'cpu': round(cpu, 4),
+            'rss_mb': _mb(rss),
+            'rss_delta_mb': _mb(rss - self.rss_started) if rss is not None else None,
+            'peak_rss_mb': _mb(peak_rss()),
+            'ok': exc_type is None,
+        }
+        record.update(self.counts)
+        self.profiler._add(self.order, record)
+        return False
+
+
+class _NullStage:
+    def count(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off: every stage is the same no-op context."""
+
+    enabled = False
+
+    def stage(self, name, parent=None):
+        return _NULL_STAGE
+
+    def finish(self, **context):
+        pass
+
+
+class StageProfiler:
+    """
+    Records wall time, CPU time, RSS and feature counts per named stage.
+
+    Stages nest: a stage opened inside another on the same thread gets it as
+    parent; stages run on worker threads pass parent= explicitly. CPU time is
+    process-wide, so stages that run concurrently each include the other's.
+    finish() prints a summary and appends one JSON line per stage to output.
+    """
+
+    enabled = True
+
+    def __init__(self, output=None):
+        self.output = output
+        self.records = []
+        self.opened = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.perf_counter()
+        self.run = time.strftime('%Y%m%dT%H%M%S') + f"-{os.getpid()}"
+
+    def _stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def _next_order(self):
+        with self.lock:
+            self.opened += 1
+            return self.opened
+
+    def _add(self, order, record):
+        with self.lock:
+            self.records.append((order, record))
+
+    def ordered_records(self):
+        """Records in the order their stages were entered, so parents come before children."""
+        return [record for _, record in sorted(self.records, key=lambda item: item[0])]
+
+    def stage(self, name, parent=None):
+        return _Stage(self, name, parent)
+
+    def summary(self):
+        records = self.ordered_records()
+        depth = {}
+        lines = [f"{'Stage':28} {'Wall s':>8} {'CPU s':>8} {'RSS MB':>8} {'Peak MB':>8}  Counts"]
+        for r in records:
+            depth[r['stage']] = depth.get(r['parent'], -1) + 1
+            counts = ', '.join(f"{k}={v:,}" if isinstance(v, int) else f"{k}={v}"
+                               for k, v in r.items() if k not in _RECORD_FIELDS)
+            lines.append(f"{'  ' * depth[r['stage']] + r['stage']:28} {r['wall']:8.3f} {r['cpu']:8.3f} "
+                         f"{_fmt(r['rss_mb'])} {_fmt(r['peak_rss_mb'])}  {counts}")
+        return '\n'.join(lines)
+
+    def finish(self, **context):
+        """Print the summary and write the records, tagged with context (location, style, ...)."""
+        print("\n[+] Profile:")
+        print(self.summary())
+        if not self.output:
+            return
+        with open(self.output, 'a', encoding='utf-8') as f:
+            for record in self.ordered_records():
+                f.write(json.dumps({'run': self.run, **context, **record}, ensure_ascii=False) + '\n')
+        print(f"[+] Profile written to {self.output}")
+
+
+_RECORD_FIELDS = ('stage', 'parent', 'start', 'wall', 'cpu', 'rss_mb', 'rss_delta_mb', 'peak_rss_mb', 'ok')
+
+
+def _fmt(value):
+    return f"{'-':>8}" if value is None else f"{value:8.1f}"
+
+
+def make_profiler(profile=None):
+    """profile: None/False for no profiling, True for a printed summary, or a JSON lines path."""
+    if not profile:
+        return NullProfiler()
+    return StageProfiler(None if profile is True else profile)
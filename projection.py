@@ -0,0 +1,152 @@
+import numpy as np
+import shapely
+
+from renderers import orient_rings
+
+WGS84_A = 6378137.0
+WGS84_E2 = 0.00669437999014
+
+
+def local_crs(lat, lon):
+    """PROJ string of the azimuthal equidistant projection centered on (lat, lon)."""
+    return f"+proj=aeqd +lat_0={lat:.7f} +lon_0={lon:.7f} +datum=WGS84 +units=m +no_defs"
+
+
+def project_coords(coords, lat, lon):
+    """
+    lon/lat coords to meters east/north of (lat, lon), azimuthal equidistant.
+
+    The spherical formula is scaled by the WGS84 meridional and prime vertical
+    radii at the center, which matches the ellipsoidal projection to well under
+    a pixel over a city and is far cheaper than a full PROJ transform.
+    """
+    if not len(coords):
+        return np.empty((0, 2))
+    phi0, lam0 = np.radians(lat), np.radians(lon)
+    phi, dlam = np.radians(coords[:, 1]), np.radians(coords[:, 0]) - lam0
+    sin_phi0, cos_phi0 = np.sin(phi0), np.cos(phi0)
+    sin_phi, cos_phi = np.sin(phi), np.cos(phi)
+    cos_dlam = np.cos(dlam)
+    cos_c = np.clip(sin_phi0 * sin_phi + cos_phi0 * cos_phi * cos_dlam, -1, 1)
+    c = np.arccos(cos_c)
+    # c / sin(c) -> 1 at the center
+    k = np.where(c > 1e-12, c / np.sin(np.maximum(c, 1e-12)), 1.0)
+    w = 1 - WGS84_E2 * sin_phi0 ** 2
+    east = WGS84_A / np.sqrt(w)
+    north = WGS84_A * (1 - WGS84_E2) / w ** 1.5
+    x = east * k * cos_phi * np.sin(dlam)
+    y = north * k * (cos_phi0 * sin_phi - sin_phi0 * cos_phi * cos_dlam)
+    return np.column_stack([x, y])
+
+
+def project_scene(scene):
+    """Scene in meters around its center; orientation is preserved, so rings keep their winding."""
+    lat, lon = scene.center
+    projected = {name: (project_coords(np.asarray(coords), lat, lon), offsets)
+                 for name, (coords, offsets) in scene.layers().items()}
+    arrays = {name: projected.get(name) for name in ('streets', 'water', 'buildings')}
+    radius = scene.radius
+    bounds = (-radius, -radius, radius, radius) if radius else None
+    return scene.replace(bounds=bounds, crs=local_crs(lat, lon), **arrays)
+
+
+def viewport(radius, width, height):
+    """
+    The (xmin, ymin, xmax, ymax) rectangle with the aspect of a width x height
+    map that just fits in the fetched 2 * radius square.
+    """
+    aspect = width / height
+    half_w, half_h = (radius * aspect, radius) if aspect < 1 else (radius, radius / aspect)
+    return -half_w, -half_h, half_w, half_h
+
+
+def _pieces(pool, starts, lengths):
+    """Concatenate the runs pool[start:start + length] into coordinates and offsets."""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    index = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+    return pool[index], offsets
+
+
+def _gather(coords, offsets, items):
+    """Coordinates and offsets of lines/rings items, in that order."""
+    return _pieces(coords, offsets[items], np.diff(offsets)[items])
+
+
+def _split(coords, offsets, box):
+    """Per line/ring: entirely inside the box, and crossing its edge (the rest is outside)."""
+    xmin, ymin, xmax, ymax = box
+    starts = offsets[:-1]
+    lo = np.minimum.reduceat(coords, starts)
+    hi = np.maximum.reduceat(coords, starts)
+    inside = (lo[:, 0] >= xmin) & (lo[:, 1] >= ymin) & (hi[:, 0] <= xmax) & (hi[:, 1] <= ymax)
+    outside = (hi[:, 0] < xmin) | (hi[:, 1] < ymin) | (lo[:, 0] > xmax) | (lo[:, 1] > ymax)
+    return inside, ~inside & ~outside
+
+
+def _merge(coords, offsets, keep, clipped, clipped_offsets, source):
+    """Kept items and clipped pieces, ordered by the item each came from."""
+    pool = np.concatenate([coords, clipped])
+    starts = np.concatenate([offsets[keep], len(coords) + clipped_offsets[:-1]])
+    lengths = np.concatenate([np.diff(offsets)[keep], np.diff(clipped_offsets)])
+    order = np.argsort(np.concatenate([keep, source]), kind='stable')
+    return _pieces(pool, starts[order], lengths[order])
+
+
+def _piece_offsets(piece, count):
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(piece, minlength=count), out=offsets[1:])
+    return offsets
+
+
+def clip_lines(coords, offsets, box):
+    """Cut lines to box: lines inside are kept as they are, lines across the edge are clipped."""
+    if len(offsets) < 2:
+        return coords, offsets
+    inside, crossing = _split(coords, offsets, box)
+    crossing = np.flatnonzero(crossing)
+    selected, selected_offsets = _gather(coords, offsets, crossing)
+    lines = shapely.linestrings(selected, indices=np.repeat(np.arange(len(crossing)), np.diff(selected_offsets)))
+    parts, index = shapely.get_parts(shapely.clip_by_rect(lines, *box), return_index=True)
+    keep = shapely.get_type_id(parts) == 1
+    parts, index = parts[keep], index[keep]
+    clipped, piece = shapely.get_coordinates(parts, return_index=True)
+    clipped_offsets = _piece_offsets(piece, len(parts))
+    return _merge(coords, offsets, np.flatnonzero(inside), clipped, clipped_offsets, crossing[index])
+
+
+def clip_rings(coords, offsets, box):
+    """
+    Cut rings to box, each on its own as the area it encloses.
+
+    A clipped exterior and a clipped hole still cancel under the nonzero rule,
+    so polygons need no reassembly; clipped pieces take their ring's winding
+    and stay where the ring was, next to the other rings of its polygon.
+    """
+    if len(offsets) < 2:
+        return coords, offsets
+    inside, crossing = _split(coords, offsets, box)
+    crossing = np.flatnonzero(crossing)
+    selected, selected_offsets = _gather(coords, offsets, crossing)
+    rings = shapely.linearrings(selected, indices=np.repeat(np.arange(len(crossing)), np.diff(selected_offsets)))
+    ccw = shapely.is_ccw(rings)
+    parts, index = shapely.get_parts(shapely.clip_by_rect(shapely.polygons(rings), *box), return_index=True)
+    keep = (shapely.get_type_id(parts) == 3) & ~shapely.is_empty(parts)
+    parts, index = parts[keep], index[keep]
+    clipped, piece = shapely.get_coordinates(shapely.get_exterior_ring(parts), return_index=True)
+    clipped_offsets = _piece_offsets(piece, len(parts))
+    clipped = orient_rings(clipped, clipped_offsets, ccw[index])
+    return _merge(coords, offsets, np.flatnonzero(inside), clipped, clipped_offsets, crossing[index])
+
+
+def clip_scene(scene, box):
+    """Scene cut to box, which becomes its bounds."""
+    def polygons(layer):
+        return None if layer is None else clip_rings(*layer, box)
+
+    return scene.replace(
+        bounds=box,
+        streets=clip_lines(*scene.streets, box),
+        water=polygons(scene.water),
+        buildings=polygons(scene.buildings),
+    )
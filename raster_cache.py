@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from geocoder import normalize_query
+from image_writers import (DEFLATE_WINDOW, TIFF_ROWS_PER_STRIP, compress_tiff_strip, deflate_png_rows, open_writer,
+                           png_stream_state)
+
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'pretty-map' / 'rasters'
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+# Bodies are encoded in bands of this many rows; a TIFF strip each
+BAND_ROWS = TIFF_ROWS_PER_STRIP
+
+
+def _file_id(path):
+    stat = os.stat(path)
+    return [str(Path(path).resolve()), stat.st_mtime_ns, stat.st_size]
+
+
+def body_key(style, width, height, borderless=False, lod=True, location=None, lat=None, lon=None, radius=5000,
+             roads='auto', spacing=None, osm_file=None, scene_file=None, loader='graph'):
+    """
+    Cache key of a poster body: everything that decides its pixels except the
+    title and subtitle; the street loader counts as well, since it changes
+    which streets are drawn. Locations are keyed by their normalized query, saved
+    scenes and OSM extracts by path, modification time and size.
+    """
+    fields = {'style': style, 'width': width, 'height': height, 'borderless': borderless, 'lod': lod}
+    if scene_file:
+        fields['scene'] = _file_id(scene_file)
+    else:
+        fields.update(radius=radius, roads=roads, spacing=spacing, loader=loader)
+        if location:
+            fields['location'] = normalize_query(location)
+        else:
+            fields['coords'] = [round(float(lat), 7), round(float(lon), 7)]
+        if osm_file:
+            fields['osm_file'] = _file_id(osm_file)
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def align_rows(top, bottom, height):
+    """Rows top..bottom widened to whole BAND_ROWS bands of a height-row image."""
+    return max(0, top // BAND_ROWS * BAND_ROWS), min(height, -(-bottom // BAND_ROWS) * BAND_ROWS)
+
+
+def _format_kind(output_format):
+    return 'tiff' if output_format in ('tif', 'tiff') else 'png'
+
+
+class RasterEntry:
+    """
+    A cached poster body: the RGB pixels of everything but the text as a
+    memory-mapped .npy, plus per-format encoded bands built on first use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        meta = json.loads((path / 'meta.json').read_text(encoding='utf-8'))
+        self.width = meta['width']
+        self.height = meta['height']
+        self.place_name = meta['place_name']
+        self.body = np.load(path / 'body.npy', mmap_mode='r')
+
+    def _encode_band(self, kind, top):
+        rows = np.ascontiguousarray(self.body[top:top + BAND_ROWS])
+        if kind == 'tiff':
+            return compress_tiff_strip(rows), 0, 0
+        return deflate_png_rows(rows, *png_stream_state(self.body, top))
+
+    def blocks(self, output_format, threads=1):
+        """
+        (index, blocks path) of the body encoded as output_format, one block per
+        band; index rows are (offset, size, adler32, raw length).
+        """
+        kind = _format_kind(output_format)
+        index_path = self.path / f'{kind}.index.npy'
+        blocks_path = self.path / f'{kind}.blocks'
+        if index_path.exists():
+            return np.load(index_path), blocks_path
+
+        tmp = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        tops = range(0, self.height, BAND_ROWS)
+        index = np.zeros((len(tops), 4), dtype=np.int64)
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as pool, \
+                open(blocks_path.with_name(blocks_path.name + tmp), 'wb') as f:
+            for i, (data, adler, length) in enumerate(pool.map(lambda top: self._encode_band(kind, top), tops)):
+                index[i] = f.tell(), len(data), adler, length
+                f.write(data)
+        os.replace(blocks_path.with_name(blocks_path.name + tmp), blocks_path)
+        # The index goes last: once it exists, the blocks are complete
+        with open(index_path.with_name(index_path.name + tmp), 'wb') as f:
+            np.save(f, index)
+        os.replace(index_path.with_name(index_path.name + tmp), index_path)
+        return index, blocks_path
+
+    def write(self, output_path, output_format, top, rows, threads=1, dpi=300):
+        """
+        Write the poster: the body with rows replacing its rows from top on
+        (top a band boundary). Bands the rows leave alone are copied from the
+        cached encoding; only the changed ones, and for PNG the following rows
+        whose compression refers back to them, are encoded again.
+        """
+        kind = _format_kind(output_format)
+        index, blocks_path = self.blocks(output_format, threads)
+        bottom = top + len(rows)
+        # PNG rows are filtered against the row above and deflated against the previous 32 KB
+        lookback = -(-DEFLATE_WINDOW // (self.width * 3 + 1)) if kind == 'png' else 0
+        encoded = 0
+        with open_writer(output_path, output_format, self.width, self.height, threads=threads, dpi=dpi) as writer, \
+                open(blocks_path, 'rb') as blocks:
+            cached = False
+            for i, start in enumerate(range(0, self.height, BAND_ROWS)):
+                end = min(start + BAND_ROWS, self.height)
+                if not (start < bottom + lookback and end > top):
+                    offset, size, adler, length = (int(v) for v in index[i])
+                    blocks.seek(offset)
+                    data = blocks.read(size)
+                    if kind == 'png':
+                        writer.write_deflated((data, adler, length), end - start)
+                    else:
+                        writer.write_compressed(data, end - start)
+                    cached = True
+                    continue
+                if cached and kind == 'png':
+                    writer.resume(*png_stream_state(self.body, start))
+                cached = False
+                writer.write_rows(rows[start - top:end - top] if start < bottom else self.body[start:end])
+                encoded += end - start
+        return encoded
+
+
+class RasterCache:
+    """
+    Poster bodies on disk, keyed by body_key(), so posters that differ only
+    in their text are composited onto a cached map instead of rendered again.
+
+    Entries are written to a temporary directory and renamed into place, so
+    concurrent writers of the same key are safe; least recently used entries
+    are evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return (self.cache_dir / key / 'meta.json').exists()
+
+    def get(self, key):
+        """The entry stored under key, or None."""
+        path = self.cache_dir / key
+        try:
+            entry = RasterEntry(path)
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def build(self, key, width, height, render):
+        """
+        Store the body that render(body) draws into a width x height RGB array,
+        returning the place name; gives the new entry.
+        """
+        tmp_path = self.cache_dir / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_path.mkdir()
+        try:
+            body = open_memmap(tmp_path / 'body.npy', mode='w+', dtype=np.uint8, shape=(height, width, 3))
+            place_name = render(body)
+            body.flush()
+            del body
+            (tmp_path / 'meta.json').write_text(json.dumps({
+                'width': width, 'height': height, 'place_name': place_name,
+            }, ensure_ascii=False), encoding='utf-8')
+            try:
+                tmp_path.rename(self.cache_dir / key)
+            except OSError:
+                # Another process stored the same body first
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        with self._lock:
+            self.misses += 1
+        self.evict(keep=key)
+        return RasterEntry(self.cache_dir / key)
+
+    def _entries(self):
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.name.startswith('.') or not path.is_dir():
+                continue
+            try:
+                size = sum(f.stat().st_size for f in path.iterdir())
+                entries.append((path.stat().st_mtime, size, path))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+        }
+
+    def evict(self, keep=None):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries, key=lambda item: item[0]):
+                if total <= self.max_bytes:
+                    break
+                if path.name == keep:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
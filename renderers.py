@@ -0,0 +1,143 @@
+import numpy as np
+import shapely
+from matplotlib.collections import LineCollection, PathCollection
+from matplotlib.path import Path
+
+POLYGON_TYPES = (shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON)
+PATH_CHUNK_VERTICES = 200000
+
+
+def street_arrays(graph):
+    """
+    Flatten a street graph into one coordinate array plus line offsets.
+
+    Line i is coords[offsets[i]:offsets[i + 1]]. The graph is a MultiDiGraph, so
+    a two-way street is stored as two opposite edges; those are emitted once.
+    """
+    seen = set()
+    curved = []
+    straight_u = []
+    straight_v = []
+    for u, v, data in graph.edges(data=True):
+        key = (min(u, v), max(u, v), str(data.get('osmid')), round(data.get('length', 0.0), 1))
+        if key in seen:
+            continue
+        seen.add(key)
+        geometry = data.get('geometry')
+        if geometry is not None:
+            curved.append(geometry)
+        else:
+            straight_u.append(u)
+            straight_v.append(v)
+
+    coords, index = shapely.get_coordinates(np.array(curved, dtype=object), return_index=True)
+    counts = np.bincount(index, minlength=len(curved))
+
+    nodes = graph.nodes
+    straight = np.empty((len(straight_u), 2, 2), dtype=np.float64)
+    straight[:, 0, 0] = [nodes[n]['x'] for n in straight_u]
+    straight[:, 0, 1] = [nodes[n]['y'] for n in straight_u]
+    straight[:, 1, 0] = [nodes[n]['x'] for n in straight_v]
+    straight[:, 1, 1] = [nodes[n]['y'] for n in straight_v]
+
+    coords = np.concatenate([coords, straight.reshape(-1, 2)])
+    counts = np.concatenate([counts, np.full(len(straight_u), 2)])
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return coords, offsets
+
+
+def draw_lines(ax, coords, offsets, color, width, zorder=3):
+    segments = np.split(coords, offsets[1:-1]) if len(offsets) > 1 else []
+    collection = LineCollection(segments, colors=color, linewidths=width, zorder=zorder)
+    ax.add_collection(collection, autolim=False)
+    return collection
+
+
+def polygon_arrays(geometries):
+    """
+    Flatten (Multi)Polygons into ring coordinates, ring offsets and an exterior flag.
+
+    Ring i is coords[offsets[i]:offsets[i + 1]] (closed). Exteriors are oriented
+    counter-clockwise and holes clockwise, so a single compound path filled with
+    matplotlib's nonzero rule keeps holes open while overlapping features stay
+    filled. Points and lines (e.g. waterway centerlines) have no area and are
+    dropped.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    polygons = geometries[np.isin(shapely.get_type_id(geometries), POLYGON_TYPES)]
+    parts = shapely.get_parts(polygons)
+    rings, polygon_index = shapely.get_rings(parts, return_index=True)
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+
+    counts = np.bincount(ring_index, minlength=len(rings))
+    offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    exterior = np.ones(len(rings), dtype=bool)
+    exterior[1:] = polygon_index[1:] != polygon_index[:-1]
+
+    coords = orient_rings(coords, offsets, exterior)
+    return coords, offsets, exterior
+
+
+def orient_rings(coords, offsets, ccw):
+    """Reverse the rings whose orientation does not match ccw (one flag per ring)."""
+    if not len(coords):
+        return coords
+    # Shoelace sums per ring; the term that pairs one ring's last vertex with the
+    # next ring's first vertex is masked out.
+    counts = np.diff(offsets)
+    x, y = coords[:, 0], coords[:, 1]
+    terms = x[:-1] * y[1:] - x[1:] * y[:-1]
+    terms[offsets[1:-1] - 1] = 0
+    area2 = np.add.reduceat(np.append(terms, 0), offsets[:-1])
+    flip = (area2 > 0) != ccw
+    if flip.any():
+        starts = np.repeat(offsets[:-1], counts)
+        ends = np.repeat(offsets[1:], counts)
+        order = np.arange(len(coords))
+        flipped = np.repeat(flip, counts)
+        order[flipped] = starts[flipped] + ends[flipped] - 1 - order[flipped]
+        coords = coords[order]
+    return coords
+
+
+def draw_polygons(ax, coords, offsets, color, alpha, zorder=1):
+    paths = []
+    ring_start = 0
+    n_rings = len(offsets) - 1
+    while ring_start < n_rings:
+        limit = offsets[ring_start] + PATH_CHUNK_VERTICES
+        ring_end = max(int(np.searchsorted(offsets, limit, side='right')) - 1, ring_start + 1)
+        ring_end = min(ring_end, n_rings)
+        first, last = offsets[ring_start], offsets[ring_end]
+        codes = np.full(last - first, Path.LINETO, dtype=Path.code_type)
+        codes[offsets[ring_start:ring_end] - first] = Path.MOVETO
+        codes[offsets[ring_start + 1:ring_end + 1] - first - 1] = Path.CLOSEPOLY
+        paths.append(Path(coords[first:last], codes))
+        ring_start = ring_end
+    collection = PathCollection(paths, facecolors=color, edgecolors='none', linewidths=0,
+                                alpha=alpha, zorder=zorder)
+    ax.add_collection(collection, autolim=False)
+    return collection
+
+
+def set_extent(ax, bounds, padding=0.02, aspect=None):
+    """
+    Frame bounds (west, south, east, north) the same way ox.plot_graph does.
+
+    The default aspect is the one of lat/lon at the middle latitude; projected
+    bounds in meters use aspect=1.
+    """
+    west, south, east, north = bounds
+    pad_ns = (north - south) * padding
+    pad_ew = (east - west) * padding
+    ax.set_ylim(south - pad_ns, north + pad_ns)
+    ax.set_xlim(west - pad_ew, east + pad_ew)
+    ax.set_aspect(aspect if aspect is not None else 1 / np.cos((south + north) / 2 / 180 * np.pi))
+
+
+def array_bounds(coords):
+    west, south = coords.min(axis=0)
+    east, north = coords.max(axis=0)
+    return west, south, east, north
@@ -0,0 +1,75 @@
+import math
+
+# Road classes fetched at each level, from the sparsest; every level adds to the one before.
+# Classes match as substrings, so 'motorway' also fetches motorway_link.
+ROAD_LEVELS = {
+    'motorway': ('motorway', 'trunk'),
+    'primary': ('motorway', 'trunk', 'primary'),
+    'secondary': ('motorway', 'trunk', 'primary', 'secondary'),
+    'tertiary': ('motorway', 'trunk', 'primary', 'secondary', 'tertiary'),
+    'local': ('motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'residential', 'unclassified',
+              'living_street'),
+    'all': None,
+}
+# How streets are loaded: the simplified OSMnx graph, or OSM ways read straight into flat arrays (ways.py)
+STREET_LOADERS = ('graph', 'ways')
+# Average gap between drawn streets that the automatic choice aims for, in output pixels
+STREET_SPACING_PX = 20
+# Street length per area (m/m²) of a dense city core with every road class: at scales where
+# even this leaves STREET_SPACING_PX between streets, no density probe is needed
+MAX_DENSITY = 0.06
+# The network density is sampled in a square of this half-size around the center
+PROBE_RADIUS = 500
+
+
+def pixels_per_meter(radius, width, map_height):
+    """Output pixels per ground meter when the 2 * radius square is cut to a width x map_height viewport."""
+    return max(width, map_height) / (2 * radius)
+
+
+def street_spacing(px_per_m, density):
+    """Average gap in pixels between streets of density m/m² (a square grid of spacing s has 2 / s)."""
+    return 2 * px_per_m / density if density > 0 else math.inf
+
+
+def road_level(highway):
+    """Index in ROAD_LEVELS of the sparsest level that fetches highway (a tag value or a list of them)."""
+    values = highway if isinstance(highway, list) else [highway]
+    best = len(ROAD_LEVELS) - 1
+    for value in values:
+        for index, classes in enumerate(ROAD_LEVELS.values()):
+            if classes is not None and any(c in str(value) for c in classes):
+                best = min(best, index)
+                break
+    return best
+
+
+def network_density(graph, area):
+    """
+    Street length per area (m/m²) fetched at each of ROAD_LEVELS, from a graph
+    covering area m². Two-way streets appear as two edges and are counted once.
+    """
+    lengths = [0.0] * len(ROAD_LEVELS)
+    seen = set()
+    for u, v, data in graph.edges(data=True):
+        length = float(data.get('length', 0.0))
+        key = (min(u, v), max(u, v), round(length, 1))
+        if key in seen:
+            continue
+        seen.add(key)
+        lengths[road_level(data.get('highway'))] += length
+    densities = []
+    total = 0.0
+    for length in lengths:
+        total += length
+        densities.append(total / area)
+    return densities
+
+
+def choose_level(px_per_m, densities, spacing=STREET_SPACING_PX):
+    """The most detailed level whose streets stay at least spacing pixels apart, else the sparsest."""
+    names = list(ROAD_LEVELS)
+    for name, density in reversed(list(zip(names, densities))):
+        if street_spacing(px_per_m, density) >= spacing:
+            return name
+    return names[0]
@@ -0,0 +1,148 @@
+import json
+import struct
+
+import numpy as np
+
+from renderers import street_arrays, polygon_arrays, array_bounds
+
+SCENE_MAGIC = b'PMSCENE1'
+SCENE_VERSION = 1
+# Arrays start on this boundary so the memory map can be viewed in place
+SCENE_ALIGN = 64
+
+
+class Scene:
+    """
+    Render-ready geometry for one poster: flat coordinate arrays per layer.
+
+    streets, water and buildings are (coords, offsets) pairs as produced by
+    renderers.street_arrays / renderers.polygon_arrays, or None when the layer
+    is not drawn. Coordinates are lon/lat, or meters in crs (a PROJ string)
+    once projected; center is (lat, lon) and radius the fetched distance.
+    """
+
+    def __init__(self, place_name, streets, water=None, buildings=None, bounds=None, crs=None,
+                 center=None, radius=None):
+        self.place_name = place_name
+        self.streets = streets
+        self.water = water
+        self.buildings = buildings
+        self.bounds = bounds if bounds is not None else array_bounds(streets[0])
+        self.crs = crs
+        self.center = center
+        self.radius = radius
+
+    def replace(self, **changes):
+        """Copy of the scene with some layers (or bounds, crs) swapped; the rest is kept."""
+        fields = {'streets': self.streets, 'water': self.water, 'buildings': self.buildings,
+                  'bounds': self.bounds, 'crs': self.crs, 'center': self.center, 'radius': self.radius}
+        fields.update(changes)
+        return Scene(self.place_name, **fields)
+
+    def layers(self):
+        return {name: arrays for name, arrays in
+                (('water', self.water), ('buildings', self.buildings), ('streets', self.streets))
+                if arrays is not None}
+
+
+def _polygons(gdf):
+    if gdf is None or gdf.empty:
+        return None
+    coords, offsets, _ = polygon_arrays(gdf.geometry.values)
+    return coords, offsets
+
+
+def prepare_scene(data, style):
+    return Scene(
+        data.place_name,
+        street_arrays(data.graph) if data.graph is not None else (data.ways.coords, data.ways.offsets),
+        water=_polygons(data.water) if style.get('draw_water') else None,
+        buildings=_polygons(data.buildings) if style.get('draw_buildings') else None,
+        center=data.center,
+        radius=data.radius,
+    )
+
+
+def select_layers(scene, style):
+    """The scene without the optional layers that style does not draw."""
+    return scene.replace(
+        water=scene.water if style.get('draw_water') else None,
+        buildings=scene.buildings if style.get('draw_buildings') else None,
+    )
+
+
+def _pad(f):
+    f.write(b'\0' * (-f.tell() % SCENE_ALIGN))
+
+
+def save_scene(scene, path, **metadata):
+    """
+    Write scene to one file: magic, header length, a JSON header and the arrays.
+
+    Coordinates are stored as float32 offsets from the center of the bounds
+    (millimetre precision over a city, in degrees or meters) and ring/line offsets as int64, each
+    array aligned so load_scene can map it without copying.
+    """
+    west, south, east, north = (float(v) for v in scene.bounds)
+    origin = np.array([(west + east) / 2, (south + north) / 2])
+    header = {'version': SCENE_VERSION, 'place_name': scene.place_name, 'bounds': [west, south, east, north],
+              'origin': origin.tolist(), 'crs': scene.crs,
+              'center': list(scene.center) if scene.center is not None else None, 'radius': scene.radius,
+              'layers': {}, 'metadata': metadata}
+    arrays = []
+    position = 0
+    for name, (coords, offsets) in scene.layers().items():
+        local = (np.asarray(coords, dtype=np.float64) - origin).astype('<f4')
+        entry = {}
+        for key, array in (('coords', local), ('offsets', np.asarray(offsets).astype('<i8'))):
+            position += -position % SCENE_ALIGN
+            entry[key] = [position, len(array)]
+            arrays.append(array)
+            position += array.nbytes
+        header['layers'][name] = entry
+
+    encoded = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(SCENE_MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        _pad(f)
+        start = f.tell()
+        for array in arrays:
+            f.write(b'\0' * (-(f.tell() - start) % SCENE_ALIGN))
+            f.write(array.tobytes())
+
+
+def read_scene_header(path):
+    """(header dict, byte position where the arrays start)."""
+    with open(path, 'rb') as f:
+        if f.read(len(SCENE_MAGIC)) != SCENE_MAGIC:
+            raise ValueError(f"{path} is not a scene file")
+        length, = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(length).decode('utf-8'))
+    if header.get('version') != SCENE_VERSION:
+        raise ValueError(f"Unsupported scene file version {header.get('version')} in {path}")
+    position = len(SCENE_MAGIC) + 4 + length
+    return header, position + -position % SCENE_ALIGN
+
+
+def load_scene(path):
+    """
+    Map a file from save_scene and return its Scene.
+
+    Offsets stay views of the memory map; coordinates are shifted back from
+    the origin in one vectorized pass, since matplotlib needs float64 anyway.
+    """
+    header, start = read_scene_header(path)
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    origin = np.array(header['origin'])
+    layers = {}
+    for name, entry in header['layers'].items():
+        coords_at, vertices = entry['coords']
+        offsets_at, count = entry['offsets']
+        coords = data[start + coords_at:start + coords_at + vertices * 8].view('<f4').reshape(-1, 2)
+        offsets = data[start + offsets_at:start + offsets_at + count * 8].view('<i8')
+        layers[name] = (coords + origin, offsets)
+    # Files written before projection kept center and radius in the metadata only
+    center = header.get('center') or header['metadata'].get('center')
+    return Scene(header['place_name'], layers['streets'], water=layers.get('water'),
+                 buildings=layers.get('buildings'), bounds=tuple(header['bounds']), crs=header.get('crs'),
+                 center=tuple(center) if center else None, radius=header.get('radius') or header['metadata'].get('radius'))
@@ -0,0 +1,356 @@
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from batch import job_style, normalize_job
+from geocoder import DEFAULT_GEOCODE_CACHE
+from roads import STREET_LOADERS, pixels_per_meter
+from variants import plan_outputs
+
+LAYERS = ('draw_buildings', 'draw_water')
+DEFAULT_MEMORY_BUDGET = 1024 ** 3
+# Latency samples kept for the percentiles in /stats
+LATENCY_SAMPLES = 1000
+
+
+def scene_key(job):
+    location = job['city'].strip().lower() if job['city'] else (round(job['lat'], 6), round(job['lon'], 6))
+    return location, job['radius'], job['roads'], job['street_spacing']
+
+
+def job_scale(job):
+    """Output pixels per meter of the job; data fetched for a finer scale has every road a coarser one needs."""
+    return pixels_per_meter(job['radius'], job['width'], round(job['height'] * 0.93))
+
+
+class SceneCache:
+    """
+    Bounded LRU of fetched MapData, keyed by location, radius and road options.
+
+    Each entry remembers which optional layers and which output scale it was
+    fetched for; a job that needs a layer the entry lacks, or a finer scale
+    (with --roads auto, more road classes), refetches with the union of both.
+    Concurrent requests for the same key wait for a single fetch.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, layers, fetch, scale=0.0):
+        """Return (data, hit); fetch(layers, scale) is called outside the lock on a miss."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and layers <= entry[0] and scale <= entry[1]:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2], True
+            if entry is not None:
+                layers = layers | entry[0]
+                scale = max(scale, entry[1])
+            waiting = self.pending.get(key)
+            if waiting is None or not (layers <= waiting[0] and scale <= waiting[1]):
+                waiting = (layers, scale, Future())
+                self.pending[key] = waiting
+                owner = True
+            else:
+                owner = False
+            self.misses += 1
+
+        if not owner:
+            return waiting[2].result(), False
+        try:
+            data = fetch(layers, scale)
+        except BaseException as e:
+            waiting[2].set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                if self.pending.get(key) is waiting:
+                    del self.pending[key]
+        with self.lock:
+            if self.max_entries > 0:
+                self.entries[key] = (layers, scale, data)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        waiting[2].set_result(data)
+        return data, False
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def _summary(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    return {'count': len(ordered), 'mean': round(sum(ordered) / len(ordered), 3),
+            'p50': percentile(0.5), 'p95': percentile(0.95), 'max': round(ordered[-1], 3)}
+
+
+class RenderService:
+    """Runs render jobs against a shared data source and scene cache, at most workers at a time."""
+
+    def __init__(self, source, workers=2, queue_size=16, cache_size=8,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, encode_threads=1, loader='graph'):
+        self.source = source
+        self.loader = loader
+        self.workers = workers
+        self.queue_size = queue_size
+        self.memory_budget = memory_budget
+        self.encode_threads = encode_threads
+        self.cache = SceneCache(cache_size)
+        self.slots = threading.Semaphore(workers)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.waiting = 0
+        self.running = 0
+        self.counts = {'completed': 0, 'failed': 0, 'rejected': 0}
+        self.latency = []
+        self.queue_wait = []
+
+    def _record(self, samples, value):
+        samples.append(value)
+        del samples[:-LATENCY_SAMPLES]
+
+    def _fetch(self, job, layers, scale):
+        from map_poster import MapPosterGenerator
+
+        fetch_style = {name: name in layers for name in LAYERS}
+        # Roads are chosen for a square poster as wide as the finest scale the entry serves
+        side = math.ceil(scale * 2 * job['radius'])
+        return MapPosterGenerator(fetch_style, self.source, loader=self.loader).fetch_map_data(
+            job['city'], job['lat'], job['lon'], job['radius'], (side, side), job['roads'], job['street_spacing'])
+
+    def render(self, job):
+        """Render one normalized job; returns the result dict, or None when the queue is full."""
+        from map_poster import MapPosterGenerator
+
+        queued = time.perf_counter()
+        with self.lock:
+            if self.waiting >= self.queue_size:
+                self.counts['rejected'] += 1
+                return None
+            self.waiting += 1
+        with self.slots:
+            started = time.perf_counter()
+            with self.lock:
+                self.waiting -= 1
+                self.running += 1
+            try:
+                style = job_style(job)
+                layers = frozenset(name for name in LAYERS if style.get(name))
+                data, hit = self.cache.get(scene_key(job), layers, lambda l, s: self._fetch(job, l, s),
+                                           job_scale(job))
+                output = Path(job['output'])
+                output.parent.mkdir(parents=True, exist_ok=True)
+                (path, output_format, width, height), *variants = plan_outputs(
+                    [(str(output), job['format'], job['width'], job['height']), *job['extra_outputs']])
+                for variant in variants:
+                    Path(variant[0]).parent.mkdir(parents=True, exist_ok=True)
+                MapPosterGenerator(style, self.source).create_poster(
+                    data,
+                    path,
+                    (width / 300, height / 300),
+                    job['title'],
+                    job['subtitle'],
+                    job['export_layers'],
+                    output_format,
+                    job['borderless'],
+                    self.memory_budget,
+                    None,
+                    self.encode_threads,
+                    job.get('lod', True),
+                    variants
+                )
+                result = {'status': 'ok', 'output': str(output.absolute()), 'cache_hit': hit}
+                if variants:
+                    result['extra_outputs'] = [str(Path(variant[0]).absolute()) for variant in variants]
+            except Exception as e:
+                result = {'status': 'error', 'error': f"{type(e).__name__}: {e}",
+                          'details': traceback.format_exc()}
+            finished = time.perf_counter()
+            with self.lock:
+                self.running -= 1
+                self.counts['completed' if result['status'] == 'ok' else 'failed'] += 1
+                self._record(self.latency, finished - queued)
+                self._record(self.queue_wait, started - queued)
+        result['seconds'] = round(finished - queued, 3)
+        result['queue_seconds'] = round(started - queued, 3)
+        return result
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                'uptime': round(time.time() - self.started, 1),
+                'workers': self.workers,
+                'queue_depth': self.waiting,
+                'queue_size': self.queue_size,
+                'running': self.running,
+                **self.counts,
+                'latency': _summary(self.latency),
+                'queue_wait': _summary(self.queue_wait),
+            }
+        stats['scene_cache'] = self.cache.stats()
+        if hasattr(self.source, 'geocode_stats'):
+            stats['geocode_cache'] = self.source.geocode_stats()
+        if hasattr(self.source, 'stats'):
+            stats['tile_cache'] = self.source.stats()
+        return stats
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    """POST /render with a JSON job (same fields as a batch manifest row); GET /stats, /health."""
+
+    service = None
+    job_counter = 0
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send(200, self.service.stats())
+        elif self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        else:
+            self._send(404, {'error': f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/render':
+            self._send(404, {'error': f"Unknown endpoint {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            row = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(row, dict):
+                raise ValueError("Job must be a JSON object")
+            with self.service.lock:
+                RenderHandler.job_counter += 1
+                index = RenderHandler.job_counter
+            job = normalize_job(row, index)
+        except (ValueError, TypeError, KeyError) as e:
+            self._send(400, {'status': 'error', 'error': str(e)})
+            return
+
+        result = self.service.render(job)
+        if result is None:
+            self._send(503, {'status': 'rejected', 'error': "Render queue is full"})
+        else:
+            self._send(200 if result['status'] == 'ok' else 500, result)
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        print(f"[+] {self.address_string()} {format % args}")
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, None
+
+
+def warm_up():
+    """Load fonts and the Agg backend once so the first job does not pay for it."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(1, 1))
+    fig.text(0.5, 0.5, 'WARM UP', fontsize=12, fontweight='bold')
+    FigureCanvasAgg(fig).draw()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='main.py serve',
+        description='[+] Long-running poster render server with an in-memory scene cache')
+    parser.add_argument('--host', default='127.0.0.1', help='HTTP listen address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='HTTP port (default: 8000)')
+    parser.add_argument('--socket', type=str, help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, default=2, help='Jobs rendered at the same time (default: 2)')
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help='Jobs allowed to wait for a worker; more are rejected with 503 (default: 16)')
+    parser.add_argument('--cache-size', type=int, default=8,
+                        help='Fetched scenes kept in memory, least recently used evicted (default: 8)')
+    parser.add_argument('--osm-file', type=str, help='Local OpenStreetMap extract to use instead of downloading')
+    parser.add_argument('--tile-cache', type=str, help='Directory for the persistent tile cache')
+    parser.add_argument('--tile-cache-size', type=int, default=2048, help='Tile cache size limit in MB (default: 2048)')
+    parser.add_argument('--gazetteer', type=str, help='CSV or SQLite of place names with lat/lon for offline geocoding')
+    parser.add_argument('--geocode-cache', type=str, default=str(DEFAULT_GEOCODE_CACHE),
+                        help=f'SQLite file of geocoding results (default: {DEFAULT_GEOCODE_CACHE})')
+    parser.add_argument('--no-geocode-cache', dest='geocode_cache', action='store_const', const=None,
+                        help='Do not read or write the geocode cache')
+    parser.add_argument('--shard-size', type=int,
+                        help='Side in meters of the Overpass queries large areas are split into (default: 10000)')
+    parser.add_argument('--fetch-workers', type=int, help='Overpass queries in flight at once (default: 4)')
+    parser.add_argument('--street-loader', choices=STREET_LOADERS, default='graph',
+                        help='Streets as a simplified graph, or as flat OSM way arrays (default: graph)')
+    parser.add_argument('--overpass-url', type=str, help='Overpass API base URL (default: osmnx setting)')
+    parser.add_argument('--nominatim-url', type=str, help='Nominatim base URL (default: osmnx setting)')
+    parser.add_argument('--memory-budget', type=int, default=1024, help='Render memory limit per job in MB (default: 1024)')
+    parser.add_argument('--encode-threads', type=int, default=1, help='Compression threads per job (default: 1)')
+    args = parser.parse_args(argv)
+
+    from map_poster import configure_endpoints, make_source
+
+    configure_endpoints(args.overpass_url, args.nominatim_url)
+    source = make_source(args.osm_file, args.tile_cache, args.tile_cache_size * 1024 ** 2, args.geocode_cache,
+                         args.gazetteer, args.shard_size, args.fetch_workers)
+    RenderHandler.service = RenderService(source, args.workers, args.queue_size, args.cache_size,
+                                          args.memory_budget * 1024 ** 2, args.encode_threads, args.street_loader)
+    warm_up()
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server = ThreadingUnixHTTPServer(args.socket, RenderHandler)
+        address = args.socket
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), RenderHandler)
+        address = f"http://{args.host}:{server.server_address[1]}"
+    print(f"[+] Render server on {address} ({args.workers} workers, queue {args.queue_size}, "
+          f"scene cache {args.cache_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[-] Interrupted by user")
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import osmnx as ox
+import pandas as pd
+
+from osmnx_compat import InsufficientResponseError, ResponseStatusCodeError
+from ways import StreetWays
+
+# Largest side of a shard query, in meters: a radius up to half of it is fetched in one query
+DEFAULT_SHARD_SIZE = 10000
+DEFAULT_WORKERS = 4
+SHARD_ATTEMPTS = 4
+BACKOFF_SECONDS = 1
+METERS_PER_DEGREE = 111320
+# osmnx downloads this much around a street query, so that streets crossing its edge simplify as inside
+PERIPHERY_METERS = 500
+
+
+def shard_bboxes(bbox, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Split a (north, south, east, west) bbox into a grid of bboxes no more than
+    shard_size meters on a side; neighbours share their edges exactly.
+    """
+    north, south, east, west = bbox
+    rows = max(1, math.ceil((north - south) * METERS_PER_DEGREE / shard_size))
+    cols = max(1, math.ceil((east - west) * METERS_PER_DEGREE * math.cos(math.radians((north + south) / 2))
+                            / shard_size))
+    lats = np.linspace(south, north, rows + 1).tolist()
+    lons = np.linspace(west, east, cols + 1).tolist()
+    return [(lats[r + 1], lats[r], lons[c + 1], lons[c]) for r in range(rows) for c in range(cols)]
+
+
+def buffer_bbox(bbox, meters):
+    """A (north, south, east, west) bbox grown by meters on every side."""
+    north, south, east, west = bbox
+    dlat = meters / METERS_PER_DEGREE
+    dlon = meters / (METERS_PER_DEGREE * math.cos(math.radians((north + south) / 2)))
+    return north + dlat, south - dlat, east + dlon, west - dlon
+
+
+def _retryable(error):
+    # osmnx raises server errors as ValueErrors; other ValueErrors (no data, unknown place) are final
+    return isinstance(error, ResponseStatusCodeError) or not isinstance(error, ValueError)
+
+
+class ShardedSource:
+    """
+    Source wrapper that fetches large areas as a grid of smaller queries.
+
+    Shards are fetched concurrently, at most workers queries at a time across
+    every request on the source. Each query is retried on its own with
+    exponential backoff, so a failure costs one shard rather than the whole
+    area. Streets are fetched unsimplified with every way that touches a
+    shard, over the area plus the periphery osmnx adds to a single query; the
+    shard graphs are merged on their OSM node and edge ids, then simplified
+    and truncated in the order osmnx uses. Ways (for the ways loader) and
+    features appearing in several shards are kept once.
+    """
+
+    # Queries are retried here, shard by shard; callers should not repeat a whole fetch
+    max_retries = 1
+
+    def __init__(self, source, shard_size=DEFAULT_SHARD_SIZE, workers=DEFAULT_WORKERS, attempts=SHARD_ATTEMPTS,
+                 backoff=BACKOFF_SECONDS):
+        self.source = source
+        self.shard_size = shard_size
+        self.workers = workers
+        self.attempts = attempts
+        self.backoff = backoff
+        # Each fetch has its own threads, shut down with it; this caps the queries in flight across fetches
+        self.slots = threading.BoundedSemaphore(workers)
+        self.counts = {'queries': 0, 'retries': 0, 'empty': 0, 'duplicates': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                self.counts[key] += value
+
+    def fetch_stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def _attempt(self, fn, *args, label="Request", abort=None):
+        """fn(*args), retried with exponential backoff; gives up early once abort is set."""
+        delay = self.backoff
+        for attempt in range(self.attempts):
+            try:
+                result = fn(*args)
+                self._count(queries=1)
+                return result
+            except Exception as e:
+                if not _retryable(e) or attempt == self.attempts - 1 or (abort is not None and abort.is_set()):
+                    raise
+                # Jittered, so shards that failed together do not retry together
+                pause = delay * random.uniform(0.5, 1.5)
+                print(f"\n⚠️  {label} failed (attempt {attempt + 1}/{self.attempts}): {e}; "
+                      f"retrying in {pause:.1f} sec...")
+                self._count(retries=1)
+                time.sleep(pause)
+                delay *= 2
+
+    def _fetch_shards(self, shards, fetch, label):
+        """fetch(bbox) for every shard, workers at a time; None for shards without data."""
+        # Once a shard has failed for good, the request fails: stop spending queries on the rest
+        failed = threading.Event()
+
+        def run(index, shard):
+            with self.slots:
+                if failed.is_set():
+                    return None
+                try:
+                    return self._attempt(fetch, shard, label=f"{label} shard {index + 1}/{len(shards)}",
+                                         abort=failed)
+                except InsufficientResponseError:
+                    self._count(queries=1, empty=1)
+                    return None
+                except BaseException:
+                    failed.set()
+                    raise
+
+        print(f"\n[+] {label}: {len(shards)} shards, {min(self.workers, len(shards))} at a time")
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(shards)), thread_name_prefix='shard') as pool:
+            futures = [pool.submit(run, index, shard) for index, shard in enumerate(shards)]
+            return [future.result() for future in futures]
+
+    def geocode(self, query):
+        return self._attempt(self.source.geocode, query, label="Geocoding")
+
+    def graph_from_bbox(self, bbox, highway_classes=None, simplify=True, retain_all=False,
+                        truncate_by_edge=False):
+        shards = shard_bboxes(bbox, self.shard_size)
+        if len(shards) == 1:
+            return self._attempt(self.source.graph_from_bbox, bbox, highway_classes, simplify, retain_all,
+                                 truncate_by_edge, label="Street network")
+
+        periphery = buffer_bbox(bbox, PERIPHERY_METERS)
+        graphs = [graph for graph in self._fetch_shards(
+            shard_bboxes(periphery, self.shard_size),
+            lambda shard: self.source.graph_from_bbox(shard, highway_classes, simplify=False, retain_all=True,
+                                                      truncate_by_edge=True, clean_periphery=False),
+            "Street network") if graph is not None]
+        if not graphs:
+            raise InsufficientResponseError("No street data found in any shard")
+        # Ways crossing a shard edge come back from both sides with the same node ids and edge keys
+        graph = nx.compose_all(graphs)
+        self._count(duplicates=sum(len(g.edges) for g in graphs) - len(graph.edges))
+        graph = ox.truncate.truncate_graph_bbox(graph, bbox=periphery, retain_all=True,
+                                                truncate_by_edge=truncate_by_edge)
+        if simplify:
+            graph = ox.simplify_graph(graph)
+        return ox.truncate.truncate_graph_bbox(graph, bbox=bbox, retain_all=retain_all,
+                                               truncate_by_edge=truncate_by_edge)
+
+    def ways_from_bbox(self, bbox, highway_classes=None):
+        shards = shard_bboxes(bbox, self.shard_size)
+        if len(shards) == 1:
+            return self._attempt(self.source.ways_from_bbox, bbox, highway_classes, label="Street network")
+
+        parts = [ways for ways in self._fetch_shards(
+            shards, lambda shard: self.source.ways_from_bbox(shard, highway_classes), "Street network")
+            if ways is not None]
+        if not parts:
+            raise InsufficientResponseError("No street data found in any shard")
+        # Ways are returned whole, so one crossing a shard edge comes back from both sides
+        ways = StreetWays.concat(parts)
+        self._count(duplicates=sum(len(part) for part in parts) - len(ways))
+        return ways
+
+    def features_from_bbox(self, bbox, tags):
+        shards = shard_bboxes(bbox, self.shard_size)
+        if len(shards) == 1:
+            return self._attempt(self.source.features_from_bbox, bbox, tags, label="Buildings/water")
+
+        frames = [frame for frame in self._fetch_shards(
+            shards, lambda shard: self.source.features_from_bbox(shard, tags), "Buildings/water")
+            if frame is not None and len(frame)]
+        if not frames:
+            raise InsufficientResponseError("No features found in any shard")
+        # Features are returned whole, so one reaching into several shards is the same row in each
+        gdf = pd.concat(frames)
+        duplicated = gdf.index.duplicated(keep='first')
+        self._count(duplicates=int(duplicated.sum()))
+        return gpd.GeoDataFrame(gdf[~duplicated], geometry='geometry', crs=frames[0].crs)
@@ -50,6 +50,14 @@ class MapStyle:
         self.title_box_color = '#000000'
         self.title_box_alpha = 0.22
         self.title_box_height = 0.12
+
+        # Borderless edge fade (fraction of width/height, alpha curve exponent)
+        self.fade_size = 0.24
+        self.fade_curve = 1.8
+
+        # Vignette (0.0 disables it)
+        self.vignette = 0.0
+        self.vignette_color = '#000000'
     
     def get_config(self):
         return {
@@ -69,7 +77,11 @@ class MapStyle:
             'title_box': self.title_box,
             'title_box_color': self.title_box_color,
             'title_box_alpha': self.title_box_alpha,
-            'title_box_height': self.title_box_height
+            'title_box_height': self.title_box_height,
+            'fade_size': self.fade_size,
+            'fade_curve': self.fade_curve,
+            'vignette': self.vignette,
+            'vignette_color': self.vignette_color
         }
 
 
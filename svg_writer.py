@@ -0,0 +1,166 @@
+import base64
+import gzip
+import io
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+from PIL import Image
+
+from renderers import PATH_CHUNK_VERTICES
+
+# Coordinates are written as integers in tenths of an output pixel, the tolerance lod.py simplifies to
+SVG_UNITS_PER_PIXEL = 10
+
+
+def quantize(coords, box, xlim, ylim):
+    """Data coordinates to integer SVG units, with the xlim x ylim window filling box (left, top, right, bottom) px."""
+    left, top, right, bottom = box
+    scale_x = (right - left) / (xlim[1] - xlim[0]) * SVG_UNITS_PER_PIXEL
+    scale_y = (bottom - top) / (ylim[1] - ylim[0]) * SVG_UNITS_PER_PIXEL
+    points = np.empty((len(coords), 2), dtype=np.int64)
+    points[:, 0] = np.rint(left * SVG_UNITS_PER_PIXEL + (coords[:, 0] - xlim[0]) * scale_x)
+    points[:, 1] = np.rint(top * SVG_UNITS_PER_PIXEL + (ylim[1] - coords[:, 1]) * scale_y)
+    return points
+
+
+def _path_chunk(points, offsets, closed):
+    """
+    Path data of the lines (or closed rings) in points, all relative: each line
+    starts with a moveto from where the previous one left the pen (the first
+    is absolute) followed by implicit relative linetos. Vertices that quantize
+    onto the previous one are dropped, as are lines left with a single point
+    and rings with two.
+    """
+    counts = np.diff(offsets)
+    item = np.repeat(np.arange(len(counts)), counts)
+    first = np.zeros(len(points), dtype=bool)
+    first[offsets[:-1]] = True
+    delta = np.empty_like(points)
+    delta[1:] = points[1:] - points[:-1]
+    keep = first | (delta != 0).any(axis=1)
+    if closed:
+        # The closing vertex repeats the first; z draws that edge
+        keep[offsets[1:] - 1] = False
+    keep &= (np.bincount(item[keep], minlength=len(counts)) >= (3 if closed else 2))[item]
+    points, first = points[keep], first[keep]
+    if not len(points):
+        return ''
+    # Dropped vertices sat on the previous kept one, so the deltas still hold
+    values = delta[keep]
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], len(points)) - 1
+    # After z the pen is back at the ring's first vertex, otherwise at the line's last
+    pen = points[starts if closed else ends]
+    values[starts[0]] = points[starts[0]]
+    values[starts[1:]] = points[starts[1:]] - pen[:-1]
+    tokens = list(map(str, values.ravel().tolist()))
+    for i in starts.tolist():
+        tokens[2 * i] = 'm' + tokens[2 * i]
+    if closed:
+        for i in ends.tolist():
+            tokens[2 * i + 1] += 'z'
+    return ' '.join(tokens).replace(' -', '-').replace(' m', 'm').replace('z ', 'z')
+
+
+def path_data(points, offsets, closed=False):
+    """
+    Yield path data strings for the lines or rings (points quantized, offsets as
+    in renderers.street_arrays), split like renderers.draw_polygons into paths
+    of about PATH_CHUNK_VERTICES vertices.
+    """
+    start = 0
+    items = len(offsets) - 1
+    while start < items:
+        limit = offsets[start] + PATH_CHUNK_VERTICES
+        end = min(max(int(np.searchsorted(offsets, limit, side='right')) - 1, start + 1), items)
+        first = offsets[start]
+        d = _path_chunk(points[first:offsets[end]], offsets[start:end + 1] - first, closed)
+        if d:
+            yield d
+        start = end
+
+
+def _attrs(attrs):
+    return ''.join(f" {name.rstrip('_').replace('_', '-')}={quoteattr(str(value))}"
+                   for name, value in attrs.items() if value is not None)
+
+
+def _units(pixels):
+    return f"{pixels * SVG_UNITS_PER_PIXEL:.2f}".rstrip('0').rstrip('.')
+
+
+class StreamingSVGWriter:
+    """
+    Writes an SVG element by element, so no document tree is built in memory.
+
+    The viewBox is in SVG_UNITS_PER_PIXEL units per output pixel and the
+    physical size follows from dpi; arguments are in output pixels. Paths
+    ending in .svgz are gzipped.
+    """
+
+    def __init__(self, path, width, height, dpi=300):
+        if str(path).lower().endswith('.svgz'):
+            self.file = gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+        else:
+            self.file = open(path, 'w', encoding='utf-8')
+        self.bytes = 0
+        self.paths = 0
+        self.depth = 0
+        self._write('<?xml version="1.0" encoding="utf-8" standalone="no"?>\n')
+        self._write(f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                    f'version="1.1" width="{width / dpi * 72:.6g}pt" height="{height / dpi * 72:.6g}pt" '
+                    f'viewBox="0 0 {_units(width)} {_units(height)}">\n')
+
+    def _write(self, text):
+        self.bytes += len(text)
+        self.file.write(text)
+
+    def begin_group(self, **attrs):
+        self._write(f"<g{_attrs(attrs)}>\n")
+        self.depth += 1
+
+    def end_group(self):
+        self._write("</g>\n")
+        self.depth -= 1
+
+    def clip_rect(self, id, box):
+        left, top, right, bottom = box
+        self._write(f'<defs><clipPath id="{id}"><rect x="{_units(left)}" y="{_units(top)}" '
+                    f'width="{_units(right - left)}" height="{_units(bottom - top)}"/></clipPath></defs>\n')
+
+    def rect(self, left, top, width, height, **attrs):
+        self._write(f'<rect x="{_units(left)}" y="{_units(top)}" width="{_units(width)}" '
+                    f'height="{_units(height)}"{_attrs(attrs)}/>\n')
+
+    def path(self, d, **attrs):
+        self._write(f'<path d="{d}"{_attrs(attrs)}/>\n')
+        self.paths += 1
+
+    def image(self, rgba, left, top, width, height, **attrs):
+        """Embed an RGBA uint8 array as a PNG stretched over the given box."""
+        buffer = io.BytesIO()
+        Image.fromarray(rgba).save(buffer, format='PNG')
+        data = base64.b64encode(buffer.getvalue()).decode('ascii')
+        self._write(f'<image x="{_units(left)}" y="{_units(top)}" width="{_units(width)}" '
+                    f'height="{_units(height)}" preserveAspectRatio="none"{_attrs(attrs)} '
+                    f'xlink:href="data:image/png;base64,{data}"/>\n')
+
+    def text(self, text, x, y, size, **attrs):
+        """Text whose baseline starts at (x, y) px, size in px."""
+        self._write(f'<text x="{_units(x)}" y="{_units(y)}" font-size="{_units(size)}"{_attrs(attrs)}>'
+                    f'{escape(text)}</text>\n')
+
+    def close(self):
+        while self.depth:
+            self.end_group()
+        self._write('</svg>\n')
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
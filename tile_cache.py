@@ -0,0 +1,317 @@
+import hashlib
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import osmnx as ox
+import pandas as pd
+import shapely
+
+from osmnx_compat import InsufficientResponseError
+from roads import ROAD_LEVELS
+from ways import StreetWays, class_mask
+
+TILE_DEGREES = 0.02
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'pretty-map' / 'tiles'
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+BUILDING_TAGS = {'building': True}
+WATER_TAGS = {
+    'water': True,
+    'waterway': True,
+    'natural': ['water', 'bay', 'harbour', 'coastline'],
+}
+FEATURE_COLUMNS = ('building', 'water', 'waterway', 'natural')
+
+
+def tile_bbox(ix, iy):
+    return ((iy + 1) * TILE_DEGREES, iy * TILE_DEGREES,
+            (ix + 1) * TILE_DEGREES, ix * TILE_DEGREES)
+
+
+def tiles_for_bbox(bbox):
+    north, south, east, west = bbox
+    return [(ix, iy)
+            for iy in range(math.floor(south / TILE_DEGREES), math.floor(north / TILE_DEGREES) + 1)
+            for ix in range(math.floor(west / TILE_DEGREES), math.floor(east / TILE_DEGREES) + 1)]
+
+
+def _variant(highway_classes):
+    if not highway_classes:
+        return 'all'
+    return 'hw-' + hashlib.sha1('|'.join(highway_classes).encode()).hexdigest()[:10]
+
+
+def _covering_variants(highway_classes):
+    """Variants of the road levels that include every class in highway_classes, all last."""
+    wanted = set(highway_classes)
+    return [_variant(classes) for classes in ROAD_LEVELS.values()
+            if classes is None or (set(classes) > wanted)]
+
+
+def _pack_strings(values):
+    return np.array(['' if v is None or v != v else str(v) for v in values])
+
+
+class TileCache:
+    """
+    Source wrapper that stores parsed map data as fixed-size lat/lon tiles on disk.
+
+    Streets are cached as the unsimplified OSM segment graph, so tiles from any
+    request can be merged and simplified into exactly the graph a direct query
+    would have produced; for the ways loader, streets are cached separately as
+    whole ways. Buildings and water are cached as WKB blobs with their tag
+    columns. Least recently used tiles are evicted once the cache directory
+    grows past max_bytes. Missing tiles are fetched workers at a time.
+    """
+
+    def __init__(self, source, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, workers=1):
+        self.source = source
+        self.workers = workers
+        self.max_retries = source.max_retries
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Kept up to date as tiles are stored, so the directory is only walked to evict
+        self.bytes = sum(size for size, _, _ in self._files())
+
+    def geocode(self, query):
+        return self.source.geocode(query)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'tiles': len(self._files()),
+            'bytes': self.bytes,
+        }
+
+    def _path(self, layer, tile):
+        return self.cache_dir / layer / f"{tile[0]}_{tile[1]}.npz"
+
+    def _load(self, path):
+        try:
+            with np.load(path) as data:
+                arrays = {key: data[key] for key in data.files}
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        with self._lock:
+            self.hits += 1
+        return arrays
+
+    def _store(self, path, arrays):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.stem}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        size = tmp_path.stat().st_size
+        with self._lock:
+            replaced = path.stat().st_size if path.exists() else 0
+            tmp_path.replace(path)
+            self.bytes += size - replaced
+            self.misses += 1
+
+    def _files(self):
+        """(size, mtime, path) of every cached tile."""
+        files = []
+        for f in self.cache_dir.rglob('*.npz'):
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_size, st.st_mtime, f))
+        return files
+
+    def evict(self):
+        with self._lock:
+            if self.bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        files = self._files()
+        # Recount from disk: other processes may share the directory
+        total = sum(size for size, _, _ in files)
+        for size, _, f in sorted(files, key=lambda item: item[1]):
+            if total <= self.max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+        self.bytes = total
+
+    def _street_tile(self, tile, highway_classes, layer='streets'):
+        fetch, select = {
+            'streets': (self._fetch_street_tile, _filter_street_arrays),
+            'ways': (self._fetch_way_tile, _filter_way_arrays),
+        }[layer]
+        variant = _variant(highway_classes)
+        if variant != 'all':
+            # A tile fetched with more road classes also serves this request
+            for covering in _covering_variants(highway_classes):
+                arrays = self._load_existing(self._path(f'{layer}-{covering}', tile))
+                if arrays is not None:
+                    return select(arrays, highway_classes)
+        path = self._path(f'{layer}-{variant}', tile)
+        arrays = self._load_existing(path)
+        if arrays is None:
+            arrays = fetch(tile, highway_classes)
+            self._store(path, arrays)
+        return arrays
+
+    def _load_existing(self, path):
+        if not path.exists():
+            return None
+        return self._load(path)
+
+    def _fetch_street_tile(self, tile, highway_classes):
+        try:
+            graph = self.source.graph_from_bbox(tile_bbox(*tile), highway_classes, simplify=False,
+                                                retain_all=True, truncate_by_edge=True)
+        except InsufficientResponseError:
+            graph = nx.MultiDiGraph()
+        node_ids = np.fromiter(graph.nodes, dtype=np.int64, count=len(graph))
+        edges = list(graph.edges(keys=True, data=True))
+        return {
+            'node_id': node_ids,
+            'x': np.array([graph.nodes[n]['x'] for n in node_ids], dtype=np.float64),
+            'y': np.array([graph.nodes[n]['y'] for n in node_ids], dtype=np.float64),
+            'u': np.array([e[0] for e in edges], dtype=np.int64),
+            'v': np.array([e[1] for e in edges], dtype=np.int64),
+            'key': np.array([e[2] for e in edges], dtype=np.int32),
+            'osmid': np.array([e[3].get('osmid', -1) for e in edges], dtype=np.int64),
+            'highway': _pack_strings(e[3].get('highway') for e in edges),
+            'oneway': np.array([bool(e[3].get('oneway', False)) for e in edges], dtype=bool),
+            'length': np.array([e[3].get('length', 0.0) for e in edges], dtype=np.float64),
+        }
+
+    def graph_from_bbox(self, bbox, highway_classes=None, simplify=True, retain_all=False,
+                        truncate_by_edge=False):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            tiles = list(pool.map(lambda t: self._street_tile(t, highway_classes), tiles_for_bbox(bbox)))
+        self.evict()
+
+        node_ids, first = np.unique(np.concatenate([t['node_id'] for t in tiles]), return_index=True)
+        x = np.concatenate([t['x'] for t in tiles])[first]
+        y = np.concatenate([t['y'] for t in tiles])[first]
+        edge_cols = {col: np.concatenate([t[col] for t in tiles])
+                     for col in ('u', 'v', 'key', 'osmid', 'highway', 'oneway', 'length')}
+        _, first = np.unique(np.stack([edge_cols['u'], edge_cols['v'], edge_cols['key']], axis=1),
+                             axis=0, return_index=True)
+
+        graph = nx.MultiDiGraph(crs=ox.settings.default_crs)
+        graph.add_nodes_from(zip(node_ids.tolist(), ({'x': a, 'y': b} for a, b in zip(x.tolist(), y.tolist()))))
+        graph.add_edges_from(
+            (int(edge_cols['u'][i]), int(edge_cols['v'][i]), int(edge_cols['key'][i]), {
+                'osmid': int(edge_cols['osmid'][i]),
+                'highway': str(edge_cols['highway'][i]),
+                'oneway': bool(edge_cols['oneway'][i]),
+                'length': float(edge_cols['length'][i]),
+            })
+            for i in first
+        )
+        if len(graph) == 0:
+            raise InsufficientResponseError("No street data found in cached or fetched tiles")
+
+        graph = ox.truncate.truncate_graph_bbox(graph, bbox=bbox, retain_all=retain_all,
+                                                truncate_by_edge=truncate_by_edge)
+        if simplify:
+            graph = ox.simplify_graph(graph)
+        return graph
+
+    def _fetch_way_tile(self, tile, highway_classes):
+        try:
+            ways = self.source.ways_from_bbox(tile_bbox(*tile), highway_classes)
+        except InsufficientResponseError:
+            ways = StreetWays.empty()
+        return ways.arrays()
+
+    def ways_from_bbox(self, bbox, highway_classes=None):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            tiles = list(pool.map(lambda t: StreetWays.from_arrays(self._street_tile(t, highway_classes, 'ways')),
+                                  tiles_for_bbox(bbox)))
+        self.evict()
+        # Ways crossing a tile edge are stored whole in each tile
+        ways = StreetWays.concat(tiles).within(bbox)
+        if not len(ways):
+            raise InsufficientResponseError("No street data found in cached or fetched tiles")
+        return ways
+
+    def _feature_tile(self, tile, layer, tags):
+        path = self._path(layer, tile)
+        arrays = self._load_existing(path)
+        if arrays is None:
+            arrays = self._fetch_feature_tile(tile, tags)
+            self._store(path, arrays)
+        return arrays
+
+    def _fetch_feature_tile(self, tile, tags):
+        try:
+            gdf = self.source.features_from_bbox(tile_bbox(*tile), tags)
+        except InsufficientResponseError:
+            gdf = gpd.GeoDataFrame(geometry=[], crs=ox.settings.default_crs)
+        wkb = shapely.to_wkb(gdf.geometry.values)
+        lengths = np.array([len(b) for b in wkb], dtype=np.int64)
+        arrays = {
+            'element_type': _pack_strings(gdf.index.get_level_values(0) if len(gdf) else []),
+            'osmid': np.array(gdf.index.get_level_values(1) if len(gdf) else [], dtype=np.int64),
+            'wkb': np.frombuffer(b''.join(wkb), dtype=np.uint8),
+            'wkb_offsets': np.concatenate([[0], np.cumsum(lengths)]),
+        }
+        for col in FEATURE_COLUMNS:
+            if col in gdf.columns:
+                arrays[col] = _pack_strings(gdf[col])
+        return arrays
+
+    def features_from_bbox(self, bbox, tags):
+        layers = []
+        if 'building' in tags:
+            layers.append(('buildings', BUILDING_TAGS))
+        if any(key in tags for key in ('water', 'waterway', 'natural')):
+            layers.append(('water', WATER_TAGS))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            frames = list(pool.map(lambda job: _frame_from_arrays(self._feature_tile(*job)),
+                                   [(t, layer, layer_tags) for t in tiles_for_bbox(bbox)
+                                    for layer, layer_tags in layers]))
+        self.evict()
+
+        frames = [f for f in frames if len(f)]
+        if not frames:
+            raise InsufficientResponseError("No features found in cached or fetched tiles")
+        gdf = pd.concat(frames)
+        gdf = gdf[~gdf.index.duplicated(keep='first')]
+        gdf = gdf[gdf.intersects(ox.utils_geo.bbox_to_poly(bbox=bbox))]
+        return gpd.GeoDataFrame(gdf, geometry='geometry', crs=ox.settings.default_crs)
+
+
+def _filter_street_arrays(arrays, highway_classes):
+    pattern = '|'.join(highway_classes)
+    keep = pd.Series(arrays['highway']).str.contains(pattern).to_numpy()
+    arrays = dict(arrays)
+    for col in ('u', 'v', 'key', 'osmid', 'highway', 'oneway', 'length'):
+        arrays[col] = arrays[col][keep]
+    return arrays
+
+
+def _filter_way_arrays(arrays, highway_classes):
+    ways = StreetWays.from_arrays(arrays)
+    return ways.select(class_mask(highway_classes)[ways.highway]).arrays()
+
+
+def _frame_from_arrays(arrays):
+    offsets = arrays['wkb_offsets']
+    blob = arrays['wkb'].tobytes()
+    geometry = shapely.from_wkb([blob[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)])
+    index = pd.MultiIndex.from_arrays([arrays['element_type'], arrays['osmid']],
+                                      names=['element_type', 'osmid'])
+    data = {col: pd.Series(arrays[col]).replace('', None).to_numpy()
+            for col in FEATURE_COLUMNS if col in arrays}
+    return gpd.GeoDataFrame(data, geometry=geometry, index=index, crs=ox.settings.default_crs)
@@ -0,0 +1,184 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from image_writers import open_writer
+
+# Output formats by file extension
+OUTPUT_FORMATS = {
+    '.png': 'png',
+    '.tif': 'tiff',
+    '.tiff': 'tiff',
+    '.jpg': 'jpeg',
+    '.jpeg': 'jpeg',
+    '.webp': 'webp',
+    '.svg': 'svg',
+    '.svgz': 'svg',
+}
+# Formats that are written strip by strip while a tiled poster renders
+STREAMED_FORMATS = ('png', 'tif', 'tiff')
+JPEG_QUALITY = 92
+WEBP_QUALITY = 90
+# Box-reduce by whole factors while the image stays at least this many times the target size,
+# then Lanczos-resample the rest of the way (Pillow's reducing_gap)
+REDUCING_GAP = 2
+
+
+def output_format(path):
+    """Output format of a path, from its extension."""
+    suffix = Path(path).suffix.lower()
+    if suffix not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format for {path}: use one of {', '.join(OUTPUT_FORMATS)}")
+    return OUTPUT_FORMATS[suffix]
+
+
+def parse_output(spec, default_size):
+    """
+    (path, format, width, height) of an output given as PATH or PATH:WIDTHxHEIGHT;
+    the format follows the extension and the size defaults to default_size.
+    """
+    match = re.fullmatch(r'(.+):(\d+)[xX](\d+)', spec)
+    if match:
+        path, width, height = match.group(1), int(match.group(2)), int(match.group(3))
+    else:
+        path, (width, height) = spec, default_size
+    return path, output_format(path), width, height
+
+
+def plan_outputs(outputs):
+    """
+    Order (path, format, width, height) outputs for one render: the largest
+    first, which sets the render size, then the rest, which are downsampled
+    from it and so must keep its aspect ratio.
+    """
+    outputs = sorted(outputs, key=lambda output: output[2] * output[3], reverse=True)
+    _, _, width, height = outputs[0]
+    for path, _, w, h in outputs[1:]:
+        if w > width or h > height:
+            raise ValueError(f"{path}: {w}x{h} does not fit in the {width}x{height} render")
+        # Rounded sizes are allowed a pixel of slack
+        if abs(w * height - h * width) > max(width, height):
+            raise ValueError(f"{path}: {w}x{h} does not have the aspect ratio of the {width}x{height} render")
+    return outputs
+
+
+def save_image(image, path, output_format, dpi=300):
+    """Save a PIL image with the encoder options of output_format."""
+    if output_format in ('tif', 'tiff'):
+        output_format = 'tiff'
+    options = {'dpi': (dpi, dpi)}
+    if output_format == 'jpeg':
+        # No optimize: Pillow then encodes into a buffer of one byte per pixel, which dense maps overflow
+        options.update(quality=JPEG_QUALITY, subsampling=0)
+    elif output_format == 'webp':
+        options.update(quality=WEBP_QUALITY, method=4)
+    image.save(path, format=output_format.upper(), **options)
+
+
+class Downsampler:
+    """
+    Builds one smaller copy of an image fed to it in row order, whole or in strips.
+
+    Rows are box-reduced by a whole factor as they arrive, so only the reduced
+    image is kept; result() resamples that to the target size with Lanczos.
+    Reducing strip by strip gives the same pixels as reducing the whole image.
+    """
+
+    def __init__(self, source_size, target_size):
+        self.size = target_size
+        self.factor = max(1, min(source_size[0] // target_size[0], source_size[1] // target_size[1]) // REDUCING_GAP)
+        self.reduced = []
+        self.pending = None
+
+    def _reduce(self, rows):
+        if self.factor == 1:
+            return np.array(rows)
+        return np.asarray(Image.fromarray(rows).reduce(self.factor))
+
+    def feed(self, rows):
+        """Add the next RGB rows of the source image."""
+        if self.pending is not None:
+            rows = np.concatenate([self.pending, rows])
+            self.pending = None
+        whole = len(rows) // self.factor * self.factor
+        if whole < len(rows):
+            self.pending = np.array(rows[whole:])
+        if whole:
+            self.reduced.append(self._reduce(np.ascontiguousarray(rows[:whole])))
+
+    def result(self):
+        """The target-size PIL image of everything fed."""
+        if self.pending is not None:
+            self.reduced.append(self._reduce(self.pending))
+            self.pending = None
+        image = Image.fromarray(np.concatenate(self.reduced))
+        if image.size != tuple(self.size):
+            image = image.resize(self.size, Image.LANCZOS)
+        return image
+
+
+class DownsampledOutput:
+    """
+    An output file made from a Downsampler: a smaller size, or a format that
+    cannot be written strip by strip. Reducing and the final resample and
+    encode run on a thread of its own, alongside rendering and the other
+    outputs; finish() starts the encode, close() waits for it.
+    """
+
+    def __init__(self, path, output_format, source_size, size, dpi=300):
+        self.path = path
+        self.output_format = output_format
+        self.dpi = dpi
+        self.downsampler = Downsampler(source_size, size)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = []
+        self.saved = None
+
+    def write_rows(self, rows):
+        # Always copy: callers hand in a view of a canvas that is redrawn before the thread reads it
+        self.pending.append(self.executor.submit(self.downsampler.feed, np.array(rows)))
+
+    def _save(self):
+        save_image(self.downsampler.result(), self.path, self.output_format, self.dpi)
+
+    def finish(self):
+        if self.saved is None:
+            self.saved = self.executor.submit(self._save)
+
+    def close(self):
+        self.finish()
+        try:
+            for future in self.pending:
+                future.result()
+            self.saved.result()
+        finally:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown(cancel_futures=True)
+
+
+def open_output(path, output_format, width, height, source_size, threads=1, dpi=300):
+    """
+    Writer for rows of a source_size image: streamed to disk when the output
+    has the source size and a streamable format, otherwise downsampled.
+    """
+    if output_format in STREAMED_FORMATS and (width, height) == tuple(source_size):
+        return open_writer(path, output_format, width, height, threads=threads, dpi=dpi)
+    return DownsampledOutput(path, output_format, source_size, (width, height), dpi)
+
+
+def finish_outputs(writers):
+    """Start the final encode of every downsampled output among writers, so they run side by side."""
+    for writer in writers:
+        if isinstance(writer, DownsampledOutput):
+            writer.finish()
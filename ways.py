@@ -0,0 +1,150 @@
+import numpy as np
+
+from osm_file import is_drawable_street
+from roads import ROAD_LEVELS, road_level
+
+# Highway tag values by code; code 0 is any other value. Codes are stored in tile caches: only append.
+HIGHWAY_CLASSES = ('other', 'motorway', 'motorway_link', 'trunk', 'trunk_link', 'primary', 'primary_link',
+                   'secondary', 'secondary_link', 'tertiary', 'tertiary_link', 'residential', 'unclassified',
+                   'living_street', 'service', 'road', 'busway', 'track', 'pedestrian', 'footway', 'cycleway',
+                   'bridleway', 'path', 'steps', 'corridor', 'elevator')
+HIGHWAY_CODES = {name: code for code, name in enumerate(HIGHWAY_CLASSES)}
+# ROAD_LEVELS index of the sparsest level that fetches each code
+LEVEL_OF_CODE = np.array([road_level(name) for name in HIGHWAY_CLASSES], dtype=np.int64)
+METERS_PER_DEGREE = 111320
+
+
+def class_mask(highway_classes):
+    """Boolean array over codes: which ones highway_classes (substrings, as in ROAD_LEVELS) fetch."""
+    if not highway_classes:
+        return np.ones(len(HIGHWAY_CLASSES), dtype=bool)
+    return np.array([code > 0 and any(c in name for c in highway_classes)
+                     for code, name in enumerate(HIGHWAY_CLASSES)])
+
+
+def _offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+class StreetWays:
+    """
+    Streets as OSM ways in flat arrays, with no graph topology.
+
+    Way i is coords[offsets[i]:offsets[i + 1]] in lon/lat, the same layout as
+    renderers.street_arrays, with its highway code (an index into
+    HIGHWAY_CLASSES) and OSM id. Ways are whole, so they may reach past the
+    area they were fetched for; viewport clipping trims them.
+    """
+
+    def __init__(self, coords, offsets, highway, osmid):
+        self.coords = coords
+        self.offsets = offsets
+        self.highway = highway
+        self.osmid = osmid
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 2)), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.uint8),
+                   np.zeros(0, dtype=np.int64))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['coords'], arrays['offsets'], arrays['highway'], arrays['osmid'])
+
+    @classmethod
+    def concat(cls, parts):
+        """One StreetWays of parts, keeping the first copy of ways that appear in several."""
+        parts = list(parts)
+        if not parts:
+            return cls.empty()
+        osmid = np.concatenate([p.osmid for p in parts])
+        keep = np.zeros(len(osmid), dtype=bool)
+        keep[np.unique(osmid, return_index=True)[1]] = True
+        ways = cls(np.concatenate([p.coords for p in parts]),
+                   _offsets(np.concatenate([np.diff(p.offsets) for p in parts])),
+                   np.concatenate([p.highway for p in parts]), osmid)
+        return ways if keep.all() else ways.select(keep)
+
+    def __len__(self):
+        return len(self.osmid)
+
+    @property
+    def vertices(self):
+        return len(self.coords)
+
+    def arrays(self):
+        return {'coords': self.coords, 'offsets': self.offsets, 'highway': self.highway, 'osmid': self.osmid}
+
+    def select(self, mask):
+        """The ways where mask (one flag per way) is set."""
+        counts = np.diff(self.offsets)
+        return StreetWays(self.coords[np.repeat(mask, counts)], _offsets(counts[mask]), self.highway[mask],
+                          self.osmid[mask])
+
+    def within(self, bbox):
+        """The ways whose extent meets a (north, south, east, west) bbox."""
+        if not len(self):
+            return self
+        north, south, east, west = bbox
+        starts = self.offsets[:-1]
+        x, y = self.coords[:, 0], self.coords[:, 1]
+        return self.select((np.minimum.reduceat(x, starts) <= east) & (np.maximum.reduceat(x, starts) >= west)
+                           & (np.minimum.reduceat(y, starts) <= north) & (np.maximum.reduceat(y, starts) >= south))
+
+    def lengths(self, bbox=None):
+        """Length of each way in meters; with bbox, of its segments whose midpoint lies inside."""
+        if not len(self):
+            return np.zeros(0)
+        x, y = self.coords[:, 0], self.coords[:, 1]
+        mid_x = (x[:-1] + x[1:]) / 2
+        mid_y = (y[:-1] + y[1:]) / 2
+        segments = np.hypot(np.diff(x) * np.cos(np.radians(mid_y)), np.diff(y)) * METERS_PER_DEGREE
+        # The segment from one way's last vertex to the next way's first is not a street
+        segments[self.offsets[1:-1] - 1] = 0
+        if bbox is not None:
+            north, south, east, west = bbox
+            segments[(mid_x < west) | (mid_x > east) | (mid_y < south) | (mid_y > north)] = 0
+        return np.add.reduceat(np.append(segments, 0), self.offsets[:-1])
+
+
+def way_density(ways, bbox, area):
+    """network_density for StreetWays: street length per area (m/m²) inside bbox at each of ROAD_LEVELS."""
+    lengths = np.bincount(LEVEL_OF_CODE[ways.highway], weights=ways.lengths(bbox), minlength=len(ROAD_LEVELS))
+    return (np.cumsum(lengths) / area).tolist()
+
+
+def ways_from_elements(elements, highway_classes=None):
+    """
+    StreetWays of the drawable streets among Overpass JSON elements (nodes
+    and ways, as returned by a network query). Ways repeated across
+    responses are kept once; nodes missing from the response are skipped.
+    """
+    nodes = {}
+    ways = {}
+    for element in elements:
+        kind = element['type']
+        if kind == 'node':
+            nodes[element['id']] = (element['lon'], element['lat'])
+        elif kind == 'way' and element['id'] not in ways \
+                and is_drawable_street(element.get('tags', {}), highway_classes):
+            ways[element['id']] = element
+
+    points = []
+    counts = []
+    highway = []
+    osmid = []
+    for way_id, way in ways.items():
+        line = [nodes[ref] for ref in way['nodes'] if ref in nodes]
+        if len(line) < 2:
+            continue
+        points.extend(line)
+        counts.append(len(line))
+        highway.append(HIGHWAY_CODES.get(way['tags']['highway'], 0))
+        osmid.append(way_id)
+    if not osmid:
+        from osmnx_compat import InsufficientResponseError
+        raise InsufficientResponseError("No streets in server response")
+    return StreetWays(np.array(points, dtype=np.float64), _offsets(counts), np.array(highway, dtype=np.uint8),
+                      np.array(osmid, dtype=np.int64))